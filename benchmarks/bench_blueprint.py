@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Blueprint rendering benchmark
+
+Compares the old per-residue print() renderer with render_blueprint, which
+assembles each blueprint from cached per-element blocks. The per-blueprint
+cost of the old renderer grows with the number of residues, the block
+renderer only with the number of elements.
+
+    python benchmarks/bench_blueprint.py
+"""
+
+import argparse
+import io
+import time
+
+from bp_tools.bp_tools import build_from_params, render_blueprint
+from bp_tools.design_space import DesignSpace
+
+
+def legacy_render(ss_elements, abego=False):
+    """
+    The per-residue print loop create_blueprint used before block caching
+    """
+    fl = io.StringIO()
+    first = True
+    helix_type = "H" if abego else "HA"
+    sheet_type = "E" if abego else "ED"
+    loop_type = "L" if abego else "LD"
+    tmpType = "LD"
+    for ssType, ssLength in ss_elements:
+        if ssType.lower() == "h":
+            tmpType = helix_type
+        if ssType.lower() == "l":
+            tmpType = loop_type
+        if ssType.lower() == "e":
+            tmpType = sheet_type
+        if first:
+            print("{} {} {}".format(1, "A", tmpType), file=fl)
+            first = False
+            for ii in range(1, ssLength):
+                print("{} {} {}".format(0, "x", tmpType), file=fl)
+        else:
+            for ii in range(0, ssLength):
+                print("{} {} {}".format(0, "x", tmpType), file=fl)
+    return fl.getvalue()
+
+
+def time_per_blueprint(render, combinations):
+    start = time.perf_counter()
+    for ss_elements in combinations:
+        render(ss_elements)
+    return (time.perf_counter() - start) / len(combinations) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--designs", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(
+        f"{'residues':>8} {'legacy us':>10} {'blocks us':>10} {'speedup':>8}"
+    )
+    for scale in (1, 2, 4, 8):
+        params = [
+            f"H {10 * scale} {10 * scale + 9} 0 0",
+            "L 2 5 0 0",
+            f"H {10 * scale} {10 * scale + 9} 0 0",
+            "L 2 5 0 0",
+        ]
+        space = DesignSpace(build_from_params(params))
+        combinations = [
+            [(e.dssp_type, e.size) for e in c]
+            for c in space.iter_range(0, args.designs, gray=True)
+        ]
+        for ss_elements in combinations:
+            assert legacy_render(ss_elements) == render_blueprint(ss_elements)
+        residues = sum(size for _, size in combinations[0])
+        legacy = time_per_blueprint(legacy_render, combinations)
+        blocks = time_per_blueprint(render_blueprint, combinations)
+        print(
+            f"{residues:>8} {legacy:>10.1f} {blocks:>10.1f} "
+            f"{legacy / blocks:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
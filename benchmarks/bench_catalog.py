@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Design catalog benchmark
+
+Records n synthetic designs in a fresh catalog in chunks of the bulk
+writer's size, then times the queries the catalog exists for: counting and
+listing designs by repeat size and element type, looking up one design by
+name and storing a runner status by location.
+
+    python benchmarks/bench_catalog.py --designs 1000000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from bp_tools.bp_tools import get_design_name
+from bp_tools.catalog import DesignCatalog
+
+
+def synthetic_designs(n, seed=0):
+    rng = random.Random(seed)
+    seen = set()
+    while len(seen) < n:
+        ss_elements = []
+        for _ in range(rng.randint(2, 4)):
+            ss_elements.append((rng.choice("HE"), rng.randint(5, 30), 0, 0))
+            ss_elements.append(("L", rng.randint(2, 5), 0, 0))
+        name = get_design_name(ss_elements)
+        if name not in seen:
+            seen.add(name)
+            yield ss_elements, f"/run/{name}", None
+
+
+def timed(label, function, repeats=5):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        value = function()
+    per_call = (time.perf_counter() - start) / repeats
+    print(f"{label:<40} {per_call * 1e3:9.2f} ms")
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--designs", type=int, default=200000)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "catalog.sqlite")
+        catalog = DesignCatalog(path)
+        start = time.perf_counter()
+        chunk = []
+        for design in synthetic_designs(args.designs):
+            chunk.append(design)
+            if len(chunk) == args.chunk_size:
+                catalog.add_designs(chunk)
+                chunk = []
+        catalog.add_designs(chunk)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path) / 1e6
+        print(
+            f"recorded {len(catalog)} designs in {elapsed:.1f} s "
+            f"({len(catalog) / elapsed:.0f}/s), {size:.0f} MB"
+        )
+
+        sheet = {"repeat_size": (40, 50), "has_types": ("E",)}
+        n = timed(
+            "count repeat 40-50 with a sheet", lambda: catalog.count(**sheet)
+        )
+        print(f"  {n} designs")
+        timed(
+            "first 100 of them",
+            lambda: catalog.query(limit=100, **sheet),
+        )
+        timed("all of them", lambda: catalog.query(**sheet), repeats=1)
+        timed("count repeat 45", lambda: catalog.count(repeat_size=(45, 45)))
+        row = catalog.query(limit=1, repeat_size=(45, 45))[0]
+        timed("design by name", lambda: catalog.design(row["name"]))
+        timed(
+            "store a run status",
+            lambda: catalog.set_run_status(
+                {"location": row["path"], "status": "ok", "elapsed": 1.0}
+            ),
+        )
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Combination memory benchmark
+
+Measures the memory held by n combinations loaded the way frag_params
+readers build them (one SecondaryStructElement per element and combination)
+against the same combinations in a CombinationBatch, and times the total
+repeat length of every combination both ways.
+
+    python benchmarks/bench_combination_memory.py
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from bp_tools.bp_tools import SecondaryStructElement, build_from_params
+from bp_tools.combination_batch import CombinationBatch
+from bp_tools.design_space import DesignSpace
+
+
+def measure(build):
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--combinations", type=int, default=200000)
+    args = parser.parse_args()
+    space = DesignSpace(
+        build_from_params(
+            ["H 10 40 10 1", "L 2 6 0 0", "H 10 40 10 1", "L 2 6 0 0"]
+        )
+    )
+    n = min(args.combinations, len(space))
+    dicts = [
+        [element.to_dict() for element in combination]
+        for combination in space.iter_range(0, n)
+    ]
+    objects, object_bytes = measure(
+        lambda: [
+            tuple(SecondaryStructElement.from_dict(d) for d in combination)
+            for combination in dicts
+        ]
+    )
+    batch, batch_bytes = measure(
+        lambda: CombinationBatch.from_space(space, 0, n)
+    )
+    print(f"{n} combinations of {batch.n_elements} elements")
+    print(f"objects: {object_bytes / n:8.1f} bytes/combination")
+    print(f"batch:   {batch_bytes / n:8.1f} bytes/combination")
+
+    start = time.perf_counter()
+    lengths = [sum(e.size for e in combination) for combination in objects]
+    object_time = time.perf_counter() - start
+    start = time.perf_counter()
+    batch_lengths = batch.total_lengths()
+    batch_time = time.perf_counter() - start
+    assert lengths == batch_lengths.tolist()
+    print(f"total lengths, objects: {object_time * 1e3:8.2f} ms")
+    print(f"total lengths, batch:   {batch_time * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for the bp_tools CLIs
+
+Starts a fresh interpreter for each CLI module, times "import" and
+"--help", and checks that pyrosetta was not pulled in along the way. Exits
+non-zero if pyrosetta was imported or the median startup exceeds --max-ms,
+so it can guard the pyrosetta-free fast path in CI. Every CLI also
+generates a small set of combinations once, so a module that only fails
+past argument parsing doesn't pass unnoticed.
+
+    python benchmarks/bench_import.py --max-ms 100
+"""
+
+import argparse
+import statistics
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+CLI_MODULES = ["bp_tools.build_bp_run", "bp_tools.blueprint_organizer"]
+SMOKE_ARGS = ["-s", "H 3 4 10 1", "-s", "L 2 2", "--no-echo"]
+
+NO_PYROSETTA_CHECK = (
+    "import sys, {module}; "
+    "sys.exit('pyrosetta' in sys.modules or 'numpy' in sys.modules)"
+)
+
+
+def time_command(argv, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(argv, check=True, stdout=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--max-ms", type=float, default=100.0)
+    parser.add_argument("--repeats", type=int, default=7)
+    args = parser.parse_args()
+
+    baseline = time_command([sys.executable, "-c", "pass"], args.repeats)
+    print(f"bare interpreter: {baseline:.1f} ms")
+    failed = False
+    for module in CLI_MODULES:
+        heavy = subprocess.run(
+            [sys.executable, "-c", NO_PYROSETTA_CHECK.format(module=module)]
+        ).returncode
+        if heavy:
+            print(f"FAIL {module} imports pyrosetta or numpy at startup")
+            failed = True
+        for label, argv in (
+            ("import", [sys.executable, "-c", f"import {module}"]),
+            ("--help", [sys.executable, "-m", module, "--help"]),
+        ):
+            elapsed = time_command(argv, args.repeats)
+            status = "ok" if elapsed <= args.max_ms else "FAIL"
+            failed = failed or status == "FAIL"
+            print(f"{status:4} {module} {label}: {elapsed:.1f} ms")
+        with tempfile.TemporaryDirectory() as tmp:
+            smoke = subprocess.run(
+                [sys.executable, "-m", module, *SMOKE_ARGS]
+                + ["-w", os.path.join(tmp, "frag_params.json")],
+                cwd=tmp,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+        if smoke.returncode:
+            print(f"FAIL {module} generating combinations:")
+            print(smoke.stderr.strip())
+            failed = True
+        else:
+            print(f"ok   {module} generating combinations")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Silent file index benchmark
+
+Writes a binary-silent-like library of n structures, then times building
+the tag index on first open, reopening with the saved index and random
+access to single tags, against a linear scan for the tag as a
+parse-the-whole-file reader would do it.
+
+    python benchmarks/bench_silent_index.py --structures 100000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from bp_tools.silent_reader import SilentFile
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def write_library(path, n, length, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        f.write("SEQUENCE: " + "A" * length + "\n")
+        f.write("SCORE:     score description\n")
+        f.write("REMARK BINARY SILENTFILE\n")
+        for k in range(n):
+            tag = f"frag_{k:07d}"
+            sequence = "".join(rng.choice(AMINO_ACIDS) for _ in range(length))
+            f.write(f"SCORE:  {-rng.random() * 100:.3f} {tag}\n")
+            f.write(f"ANNOTATED_SEQUENCE: {sequence} {tag}\n")
+            f.write(f"RES_NUM A:1-{length} {tag}\n")
+            for i in range(length):
+                f.write(f"L{'x' * 60} {tag}\n")
+
+
+def linear_lookup(path, tag):
+    with open(path, "r") as f:
+        for line in f:
+            if (
+                line.startswith("ANNOTATED_SEQUENCE:")
+                and line.split()[-1] == tag
+            ):
+                return line.split()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--structures", type=int, default=20000)
+    parser.add_argument("--length", type=int, default=40)
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "library.silent")
+        write_library(path, args.structures, args.length)
+        size = os.path.getsize(path) / 1e6
+        print(f"{args.structures} structures, {size:.0f} MB")
+
+        start = time.perf_counter()
+        with SilentFile(path) as silent:
+            assert silent.index_built
+        print(f"first open (scan): {time.perf_counter() - start:8.3f} s")
+
+        start = time.perf_counter()
+        silent = SilentFile(path)
+        assert not silent.index_built
+        print(f"reopen (index):    {time.perf_counter() - start:8.3f} s")
+
+        rng = random.Random(1)
+        tags = [rng.choice(silent.tags) for _ in range(args.lookups)]
+        start = time.perf_counter()
+        for tag in tags:
+            silent.chain_residues(tag)
+        per_lookup = (time.perf_counter() - start) / args.lookups
+        print(f"indexed lookup:    {per_lookup * 1e6:8.1f} us")
+
+        start = time.perf_counter()
+        for tag in tags[:3]:
+            linear_lookup(path, tag)
+        per_scan = (time.perf_counter() - start) / 3
+        print(f"linear lookup:     {per_scan * 1e6:8.1f} us")
+        silent.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Vectorized atom pair lattice constraints between repeats
+
+For every constrained element, residue i of repeat r is paired with residue
+i of repeat r + k for every repeat pair and separation k. The residue index
+pairs of a whole element are computed at once with numpy and formatted in
+bulk, one text block per element and repeat pair.
+"""
+
+import numpy as np
+
+# family name -> (line template, partner residue shift, scale the distance
+# with the repeat separation). Templates take (resnum, partner resnum, dist,
+# tolerance); the CB family has a fixed target distance for sheet pairing.
+CST_FAMILIES = {
+    "CA": ("AtomPair CA %2d CA %3d HARMONIC {dist} {tol}", 0, True),
+    "CB": ("AtomPair CB %2d CB %3d HARMONIC 4.8 0.5", -1, False),
+}
+
+# constraint families per element dssp type (lower case), sheets also get
+# CB pairs like create_atom_pair_cst_string's sheet_mode
+DEFAULT_FAMILIES = {"h": ("CA",), "l": ("CA",), "e": ("CA", "CB")}
+
+
+def _format_number(value, width):
+    return str("%.2f" % value).rjust(width)
+
+
+def _family_templates(families, lattice_space, cst_tolerance, separation):
+    templates = []
+    for family in families:
+        template, shift, scaled = CST_FAMILIES[family]
+        dist = lattice_space * separation if scaled else lattice_space
+        templates.append(
+            (
+                template.format(
+                    dist=_format_number(dist, 4),
+                    tol=_format_number(cst_tolerance, 2),
+                ),
+                shift,
+            )
+        )
+    return templates
+
+
+def _repeat_pairs(n_repeats, separations):
+    """
+    (r, r + k) repeat pairs for every distinct separation k (positive)
+    """
+    separations = list(dict.fromkeys(separations))
+    if any(k < 1 for k in separations):
+        raise ValueError(f"separations must be positive, got {separations}")
+    return [(r, r + k) for k in separations for r in range(n_repeats - k)]
+
+
+def _pair_families(element_families, repeat_pair):
+    # CB pairs only between adjacent repeats
+    if repeat_pair[1] - repeat_pair[0] != 1:
+        return [f for f in element_families if f != "CB"]
+    return element_families
+
+
+def element_cst_size(element, n_repeats=2, separations=(1,), families=None):
+    """
+    (lines, characters) iter_atom_pair_cst_blocks writes for one element
+    (dssp_type,size,lattice_space,cst_tolerance), without formatting them
+
+    Characters assume residue numbers fit the %2d/%3d fields of the
+    templates
+    """
+    dssp_type, size, lattice_space, cst_tolerance = element
+    if not lattice_space:
+        return 0, 0
+    if families is None:
+        families = DEFAULT_FAMILIES
+    element_families = families.get(dssp_type.lower(), ("CA",))
+    lines = 0
+    chars = 0
+    for repeat_pair in _repeat_pairs(n_repeats, separations):
+        for template, _ in _family_templates(
+            _pair_families(element_families, repeat_pair),
+            lattice_space,
+            cst_tolerance,
+            repeat_pair[1] - repeat_pair[0],
+        ):
+            lines += size
+            chars += size * (len(template % (0, 0)) + 1)
+    return lines, chars
+
+
+def atom_pair_cst_block(
+    resnums,
+    lattice_space,
+    repeat_size,
+    cst_tolerance,
+    families=("CA",),
+    repeat_pair=(0, 1),
+):
+    """
+    Constraint lines for resnums (numbered in the first repeat) between the
+    two repeats of repeat_pair
+
+    Lines are ordered by residue, then by family, so with the default
+    repeat pair the output matches create_atom_pair_cst_string
+    """
+    resnums = np.asarray(resnums, dtype=np.int64)
+    if not resnums.size or not families:
+        return ""
+    r_from, r_to = repeat_pair
+    separation = r_to - r_from
+    first = resnums + r_from * repeat_size
+    second = resnums + r_to * repeat_size
+    templates = _family_templates(
+        families, lattice_space, cst_tolerance, separation
+    )
+    lines = [None] * (resnums.size * len(templates))
+    for f, (template, shift) in enumerate(templates):
+        # one C level map per family, interleaved into residue order
+        lines[f :: len(templates)] = map(
+            template.__mod__,
+            zip(first.tolist(), (second + shift).tolist()),
+        )
+    return "\n".join(lines) + "\n"
+
+
+def iter_atom_pair_cst_blocks(
+    ss_elements,
+    repeat_size=None,
+    n_repeats=2,
+    separations=(1,),
+    families=None,
+):
+    """
+    Generator of constraint text blocks for a combination
+
+    ss_elements should be a list of tuples
+    (dssp_type,size,lattice_space,cst_tolerance); elements with a lattice
+    space of 0 are not constrained. Every repeat r is paired with r + k for
+    each k in separations, within n_repeats repeats (n_repeats=2 constrains
+    repeat 1 to repeat 2 only). The CA target distance is scaled by k.
+    families maps lower case dssp types to constraint families and defaults
+    to DEFAULT_FAMILIES; CB pairs are only made between adjacent repeats.
+    """
+    if families is None:
+        families = DEFAULT_FAMILIES
+    if repeat_size is None:
+        repeat_size = sum(element[1] for element in ss_elements)
+    pairs = _repeat_pairs(n_repeats, separations)
+    offset = 1
+    for dssp_type, size, lattice_space, cst_tolerance in ss_elements:
+        if lattice_space:
+            resnums = np.arange(offset, offset + size)
+            element_families = families.get(dssp_type.lower(), ("CA",))
+            for repeat_pair in pairs:
+                yield atom_pair_cst_block(
+                    resnums,
+                    lattice_space,
+                    repeat_size,
+                    cst_tolerance,
+                    families=_pair_families(element_families, repeat_pair),
+                    repeat_pair=repeat_pair,
+                )
+        offset += size
+
+
+def create_atom_pair_csts(ss_elements, **kwargs):
+    """
+    Returns the full constraint file text, see iter_atom_pair_cst_blocks
+    """
+    return "".join(iter_atom_pair_cst_blocks(ss_elements, **kwargs))
+
+
+def write_atom_pair_csts(fh, ss_elements, **kwargs):
+    """
+    Streams the constraints to the open file handle fh block by block, so
+    very large constraint sets are never held in memory at once
+
+    Returns the number of characters written
+    """
+    written = 0
+    for block in iter_atom_pair_cst_blocks(ss_elements, **kwargs):
+        written += fh.write(block)
+    return written
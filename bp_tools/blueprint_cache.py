@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of rendered fragment blueprint rows
+
+Every design that inserts the same fragment needs the same FragmentRows.
+The cache keys them by the sha256 of the structure file plus the kind of
+loader that read it, the chain, insertion mode, offset and clip, keeps
+recent entries in memory (LRU) and optionally persists them as small json
+files so later runs skip loading the structure entirely.
+"""
+
+import functools
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from bp_tools.bp_tools import (
+    FragmentRows,
+    get_chain_sequence,
+    render_fragment_rows,
+    safe_load_pdb,
+)
+from bp_tools.silent_reader import (
+    is_silent_spec,
+    parse_silent_spec,
+    read_silent_residues,
+    silent_record_hash,
+)
+
+
+def file_content_hash(path, block_size=1 << 20):
+    """
+    sha256 hex digest of the contents of path
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# loader kinds of the built-in loaders, see loader_kind. Any loader whose
+# rows come from a pyrosetta Pose (in process or in a pose service) is of
+# POSE_KIND, so they all share cache entries
+PDB_READER_KIND = "pdb_reader"
+POSE_KIND = "pose"
+
+
+def read_sequence(path, chain=None):
+    """
+    Default cache loader: sequence of chain via the pure-Python pdb reader
+    """
+    from bp_tools.pdb_reader import read_chain_residues
+
+    return read_chain_residues(path, chain=chain).sequence
+
+
+def pose_sequence_loader(rosetta_flags_file=""):
+    """
+    Returns a cache loader that reads the fragment as a pyrosetta Pose
+
+    The Pose is only built on a cache miss; chain is ignored and the first
+    chain of the pose is used. The loader pickles, so it can be handed to
+    worker processes
+    """
+    return functools.partial(
+        _load_pose_sequence, rosetta_flags_file=rosetta_flags_file
+    )
+
+
+def loader_kind(loader):
+    """
+    Name of what loader reads structures with, so rows rendered from a
+    pyrosetta Pose and from the pdb reader never share cache entries
+
+    Loaders may name their kind in a kind attribute; other functions are
+    named by their qualified name
+    """
+    kind = getattr(loader, "kind", None)
+    if kind is not None:
+        return kind
+    func = loader.func if isinstance(loader, functools.partial) else loader
+    if func is read_sequence:
+        return PDB_READER_KIND
+    if func is _load_pose_sequence:
+        return POSE_KIND
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+def _load_pose_sequence(path, chain=None, rosetta_flags_file=""):
+    if is_silent_spec(path):
+        # pyrosetta can't seek to a tag, the indexed reader can
+        return read_silent_residues(path, chain=chain).sequence
+    pose = safe_load_pdb(path, rosetta_flags_file=rosetta_flags_file)
+    if pose is None:
+        raise ValueError(f"unable to load: {path}")
+    return get_chain_sequence(pose)
+
+
+class BlueprintFragmentCache(object):
+    """
+    LRU cache of FragmentRows keyed by (content hash, loader kind, chain,
+    append, offset, clip)
+
+    loader(path, chain) must return the one letter sequence of the fragment
+    chain; it is only called on a miss. kind defaults to
+    loader_kind(loader). hits, disk_hits and misses count lookups served
+    from memory, from cache_dir and by rendering.
+    """
+
+    def __init__(
+        self, max_entries=256, cache_dir=None, loader=read_sequence, kind=None
+    ):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.loader = loader
+        self.kind = kind or loader_kind(loader)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # content hashes, revalidated by (mtime, size) so unchanged files are
+        # not re-read on every lookup
+        self._hashes = {}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+        }
+
+    def content_hash(self, path):
+        silent = parse_silent_spec(path)
+        if silent is not None:
+            # only the structure's own record, not the whole library
+            st = os.stat(silent[0])
+            stamp = (st.st_mtime_ns, st.st_size)
+            cached = self._hashes.get(path)
+            if cached is None or cached[0] != stamp:
+                cached = (stamp, silent_record_hash(path))
+                self._hashes[path] = cached
+            return cached[1]
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        path = os.path.abspath(path)
+        cached = self._hashes.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, file_content_hash(path))
+            self._hashes[path] = cached
+        return cached[1]
+
+    def key(self, path, chain=None, append=False, offset=None, clip=None):
+        return (
+            self.content_hash(path),
+            self.kind,
+            chain,
+            append,
+            offset,
+            clip,
+        )
+
+    def _disk_path(self, key):
+        name = hashlib.sha256(json.dumps(key).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{name}.json")
+
+    def _load_from_disk(self, key):
+        try:
+            with open(self._disk_path(key), "r") as f:
+                return FragmentRows.from_dict(json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _save_to_disk(self, key, rows):
+        disk_path = self._disk_path(key)
+        tmp_path = f"{disk_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(rows.to_dict(), f)
+        os.replace(tmp_path, disk_path)
+
+    def _remember(self, key, rows):
+        self._entries[key] = rows
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, path, chain=None, append=False, offset=None, clip=None):
+        """
+        Returns the FragmentRows for inserting chain of path
+        """
+        key = self.key(path, chain, append, offset, clip)
+        rows = self._entries.get(key)
+        if rows is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return rows
+        if self.cache_dir:
+            rows = self._load_from_disk(key)
+            if rows is not None:
+                self.disk_hits += 1
+                self._remember(key, rows)
+                return rows
+        self.misses += 1
+        rows = render_fragment_rows(
+            self.loader(path, chain), append=append, offset=offset, clip=clip
+        )
+        self._remember(key, rows)
+        if self.cache_dir:
+            self._save_to_disk(key, rows)
+        return rows
+
+    def clear(self):
+        self._entries.clear()
+        self._hashes.clear()
+
+
+_default_cache = None
+
+
+def get_fragment_cache():
+    """
+    Returns the process wide in-memory BlueprintFragmentCache
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = BlueprintFragmentCache()
+    return _default_cache
@@ -1,15 +1,12 @@
 #!/usr/bin/env python3
-from itertools import product
-
-from argparse import ArgumentParser
-
 import json
 
-parser = ArgumentParser()
-
-
 import click
 
+from bp_tools.bp_tools import build_from_params, build_from_file
+from bp_tools.design_space import DesignSpace
+from bp_tools.frag_io import write_frag_params_json, write_frag_params_jsonl
+
 
 @click.command()
 @click.option("-o", "--output-dir", default=".")
@@ -26,8 +23,23 @@ import click
     "-w",
     "--write-frag-file",
     "write_frag_file",
+    default="",
+    help="Path for the combination dump "
+    "(default: frag_params.json, or frag_params.jsonl with --jsonl)",
+)
+@click.option(
+    "--jsonl/--json",
+    "jsonl",
     default=False,
     show_default=True,
+    help="Write one combination per line instead of a single json array",
+)
+@click.option(
+    "--echo/--no-echo",
+    "echo",
+    default=True,
+    show_default=True,
+    help="Print every combination to the console as it is written",
 )
 @click.option(
     "-l",
@@ -67,36 +79,38 @@ def main(
     append=False,
     write_param_sampler_file="",
     rosetta_flags_file="",
+    write_frag_file="",
+    jsonl=False,
+    echo=True,
 ):
     ""
     if struct_params and fragment_file:
         raise ValueError(
             "either a fragment file or struct params must be given, but not both"
         )
-    sse_sampler_list = (
-        build_from_params(struct_params)
-        if struct_params
-        else build_from_file(fragment_file)
-    )
+    if struct_params:
+        sse_sampler_list = build_from_params(struct_params)
+    else:
+        with open(fragment_file, "r") as f:
+            sse_sampler_list = build_from_file(f)
 
     # dump the sampler in case we have various options for param interpretation
     # For instance, inserting different fragments from a pdb into an existing param set
     if write_param_sampler_file:
         with open(write_param_sampler_file, "w") as f:
-            json.dump(sse_sampler_list, f)
-
-    fragerator = product(*(f.get_ss_elements_list() for f in sse_sampler_list))
+            json.dump([s.to_dict() for s in sse_sampler_list], f)
 
-    dump_list = []
+    fragerator = DesignSpace(sse_sampler_list)
 
     # run through all the permutations and save each collection of frags as a list
-    for ss_elements in fragerator:
-        print(ss_elements)
-        elem_dict_list = [sse.to_dict() for sse in ss_elements]
-        dump_list.append(elem_dict_list)
-
-    with open("frag_params.json", "w") as f:
-        json.dump(dump_list, f)
+    if jsonl:
+        write_frag_params_jsonl(
+            fragerator, write_frag_file or "frag_params.jsonl", echo=echo
+        )
+    else:
+        write_frag_params_json(
+            fragerator, write_frag_file or "frag_params.json", echo=echo
+        )
 
 
 if __name__ == "__main__":
@@ -1,16 +1,13 @@
 #!/usr/bin/env python3
-from itertools import product
-
-import pyrosetta
-
-from argparse import ArgumentParser
+import hashlib
 import os
 import json
+import shutil
+from functools import lru_cache
 
-parser = ArgumentParser()
-
+# pyrosetta is imported lazily where a pose is actually needed: the import
+# alone takes seconds, and enumeration/blueprint generation never uses it
 
-import click
 
 # pyrosetta wrappers and utilities
 def read_flag_file(filename):
@@ -26,25 +23,124 @@ def read_flag_file(filename):
     return " ".join(lines)
 
 
+_flag_file_cache = {}
+
+
+def read_flag_file_cached(filename):
+    """
+    read_flag_file, memoized on (absolute path, mtime)
+
+    The file is only re-read if it changed on disk since the last call
+    """
+    path = os.path.abspath(filename)
+    key = (path, os.stat(path).st_mtime_ns)
+    if key not in _flag_file_cache:
+        _flag_file_cache[key] = read_flag_file(path)
+    return _flag_file_cache[key]
+
+
+def normalize_flags(flags_str):
+    """
+    Returns a hashable, order independent form of a rosetta flags string
+
+    "-b 2 -a 1" and "-a 1  -b   2" normalize to the same value
+    """
+    options = []
+    for token in flags_str.split():
+        # negative numbers are values, not options
+        if token.startswith("-") and len(token) > 1 and token[1].isalpha():
+            options.append([token])
+        elif options:
+            options[-1].append(token)
+        else:
+            raise ValueError(f"flag value without an option: {token}")
+    return tuple(sorted(" ".join(option) for option in options))
+
+
+class PyRosettaSession(object):
+    """
+    Initializes pyrosetta once per process and remembers the flags it used
+
+    pyrosetta.init is expensive and cannot be redone with different options,
+    so the first init() call wins. Later calls without a flags file, or
+    with the same normalized flags, use the running session; later calls
+    with a different flags file raise a RuntimeError instead of silently
+    running with the wrong options.
+    """
+
+    def __init__(self):
+        self.flags = None
+
+    @property
+    def initialized(self):
+        return self.flags is not None
+
+    def init(self, flags_file_path="", mute=False):
+        if self.flags is not None and not flags_file_path:
+            return self
+        flags_str = (
+            read_flag_file_cached(flags_file_path) if flags_file_path else ""
+        )
+        if mute:
+            flags_str = f"-mute all {flags_str}"
+        flags = normalize_flags(flags_str)
+        if self.flags is None:
+            import pyrosetta
+
+            pyrosetta.init(" ".join(flags_str.split()), silent=mute)
+            self.flags = flags
+        elif flags != self.flags:
+            raise RuntimeError(
+                "pyrosetta is already initialized in this process with flags "
+                f"{' '.join(self.flags)!r}, cannot re-initialize with "
+                f"{' '.join(flags)!r}"
+            )
+        return self
+
+    def load_pdb(self, pdb):
+        """
+        Returns the pose for pdb, or None (with a message) if it fails to load
+        """
+        import pyrosetta
+
+        if self.flags is None:
+            self.init()
+        try:
+            return pyrosetta.pose_from_pdb(pdb)
+        except RuntimeError as e:
+            print(e)
+            print(f"unable to load: {pdb}")
+            return
+
+
+_session = PyRosettaSession()
+
+
+def get_pyrosetta_session():
+    """
+    Returns the process wide PyRosettaSession
+    """
+    return _session
+
+
 def run_pyrosetta_with_flags(flags_file_path, mute=False):
-    if not flags_file_path:
-        pyrosetta.init("-mute all " if mute else "", silent=mute)
-        return
-    flags = read_flag_file(flags_file_path)
-    flags_str = " ".join(flags.replace("\n", " ").split())
-    pyrosetta.init(
-        f"-mute all {flags_str}" if mute else flags_str, silent=mute
-    )
+    return _session.init(flags_file_path, mute=mute)
 
 
 def safe_load_pdb(pdb, rosetta_flags_file=""):
-    run_pyrosetta_with_flags(rosetta_flags_file, mute=False)
-    try:
-        return pyrosetta.pose_from_pdb(pdb)
-    except RuntimeError as e:
-        print(e)
-        print(f"unable to load: {pdb}")
-        return
+    return _session.init(rosetta_flags_file).load_pdb(pdb)
+
+
+def load_pdbs(pdbs, rosetta_flags_file=""):
+    """
+    Generator of (pdb, pose) for every path in pdbs
+
+    pyrosetta is initialized once for the whole batch; pose is None for
+    files that fail to load
+    """
+    session = _session.init(rosetta_flags_file)
+    for pdb in pdbs:
+        yield pdb, session.load_pdb(pdb)
 
 
 class SecondaryStructElementSampler(object):
@@ -54,6 +150,14 @@ class SecondaryStructElementSampler(object):
     This container is used as an interface for sampling various lengths
     """
 
+    __slots__ = (
+        "dssp_type",
+        "min_size",
+        "max_size",
+        "repeat_dist",
+        "repeat_dist_cst",
+    )
+
     def __init__(
         self, dssp_type, min_size, max_size, repeat_dist=0, repeat_dist_cst=0
     ):
@@ -82,6 +186,7 @@ class SecondaryStructElementSampler(object):
             for i in range(self.min_size, self.max_size + 1)
         )
 
+    @classmethod
     def from_dict(cls, dict):
         return cls(**dict)
 
@@ -110,7 +215,7 @@ class SecondaryStructElementSampler(object):
     def get_ss_elements_list(self):
         return [
             SecondaryStructElement(
-                self.dssp_type, i, self.repeat_dist, self.repeat_dist
+                self.dssp_type, i, self.repeat_dist, self.repeat_dist_cst
             )
             for i in range(self.min_size, self.max_size + 1)
         ]
@@ -123,6 +228,8 @@ class SecondaryStructElement(object):
     This container is a convenience interface for saving run params
     """
 
+    __slots__ = ("dssp_type", "size", "repeat_dist", "repeat_dist_cst")
+
     def __init__(self, dssp_type, size, repeat_dist=0, repeat_dist_cst=0):
         self.dssp_type = dssp_type
         self.size = size
@@ -137,6 +244,19 @@ class SecondaryStructElement(object):
             "repeat_dist_cst": self.repeat_dist_cst,
         }
 
+    def to_tuple(self):
+        """
+        The (dssp_type,size,lattice_space,cst_tolerance) form used by
+        prepare_design_dir
+        """
+        return (
+            self.dssp_type,
+            self.size,
+            self.repeat_dist,
+            self.repeat_dist_cst,
+        )
+
+    @classmethod
     def from_dict(cls, dict):
         return cls(**dict)
 
@@ -218,6 +338,10 @@ def prepare_design_dir(
     extra_pose=None,
     append=False,
     abego=False,
+    cst_repeats=2,
+    cst_separations=(1,),
+    atomic=False,
+    layout="flat",
 ):  # xml_str=""):
     """
     prepares a directory to run the rosetta_scripts executable
@@ -225,15 +349,26 @@ def prepare_design_dir(
     ss_elements should be a list of tuples (dssp_type,size,lattice_space,cst_tolerance)
 
     setting lattice space to 0 will create no constraints for that element
+
+    constraints pair every repeat r with r + k for k in cst_separations,
+    within cst_repeats repeats (the default constrains repeat 1 to repeat 2)
+
+    with atomic set the dir is built under a hidden .partial name and renamed
+    into place at the end, replacing any partial dir left by an earlier run
+
+    layout is one of DESIGN_LAYOUTS, see design_path
     """
 
-    # forgive this ugly str parse
-    name = "_".join(
-        ["".join((type, str(size))) for type, size, lat, cst in ss_elements]
-    )
+    name = get_design_name(ss_elements)
     repeat_size = sum(size for type, size, lat, cst in ss_elements)
-    if dirname != "":
-        path_name = "{}/{}".format(dirname, name)
+    path_name = design_path(dirname, name, layout)
+    final_path = path_name
+    if atomic:
+        path_name = os.path.join(
+            os.path.dirname(final_path), f".{name}.partial"
+        )
+        if os.path.lexists(path_name):
+            shutil.rmtree(path_name)
     if not os.path.exists(path_name):
         os.makedirs(path_name)
 
@@ -248,21 +383,22 @@ def prepare_design_dir(
         abego=abego,
     )
 
-    offset = 1
-    cst_string = ""
-    for type, size, lat, cst in ss_elements:
-        if lat:
-            cst_string += create_atom_pair_cst_string(
-                range(offset, offset + size),
-                lat,
-                repeat_size,
-                cst,
-                sheet_mode=(type.lower() == "e"),
-            )
-        offset += size
+    from bp_tools.atom_pair_csts import write_atom_pair_csts
+
     with open(path_name + "/lattice_csts.cst", "w") as f:
-        f.write(cst_string)
+        write_atom_pair_csts(
+            f,
+            ss_elements,
+            repeat_size=repeat_size,
+            n_repeats=cst_repeats,
+            separations=cst_separations,
+        )
     add_flags(path_name, name, repeat_size)
+    if atomic:
+        if os.path.lexists(final_path):
+            shutil.rmtree(final_path)
+        os.rename(path_name, final_path)
+    return final_path
     # fl = open(path_name + "/design.xml", "w")
     # if not xml_str:
     #     xml_str = get_default_xml()
@@ -270,40 +406,113 @@ def prepare_design_dir(
     # fl.close()
 
 
-def copy_necessary_files(name, dir):
-    os.symlink(f"{dir}/flags_cst", name + "/flags")
-    os.symlink(
-        f"{dir}/abinitio_remodel_cen_stage0a.wts",
-        name + "/abinitio_remodel_cen_stage0a.wts",
-    )
-    os.symlink(
-        f"{dir}/abinitio_remodel_cen_stage0b.wts",
-        name + "/abinitio_remodel_cen_stage0b.wts",
-    )
-    os.symlink(
-        f"{dir}/abinitio_remodel_cen_stage1.wts",
-        name + "/abinitio_remodel_cen_stage1.wts",
-    )
-    os.symlink(
-        f"{dir}/abinitio_remodel_cen_stage2.wts",
-        name + "/abinitio_remodel_cen_stage2.wts",
+def get_design_name(ss_elements):
+    """
+    Returns the design dir name, e.g. H20_L3_H18_L4
+
+    ss_elements should be a list of tuples (dssp_type,size,...)
+    """
+    # forgive this ugly str parse
+    return "_".join(
+        ["".join((element[0], str(element[1]))) for element in ss_elements]
     )
-    os.symlink(
-        f"{dir}/abinitio_remodel_cen.wts", name + "/abinitio_remodel_cen.wts"
+
+
+DESIGN_LAYOUTS = ("flat", "hashed")
+
+
+def design_subdir(name, layout="flat"):
+    """
+    The dir a design goes into relative to the run dir: "" for the flat
+    layout, two levels of sha1 prefix of the name (e.g. "3f/a2") for the
+    hashed layout, which keeps every dir to a few hundred entries even for
+    millions of designs
+    """
+    if layout == "flat":
+        return ""
+    if layout == "hashed":
+        digest = hashlib.sha1(name.encode()).hexdigest()
+        return f"{digest[:2]}/{digest[2:4]}"
+    raise ValueError(f"unknown layout {layout}, use one of {DESIGN_LAYOUTS}")
+
+
+def design_path(dirname, name, layout="flat"):
+    """
+    Path of the design dir for name under dirname
+    """
+    return os.path.join(dirname, design_subdir(name, layout), name)
+
+
+# files every design dir needs from extra_files_dir: name in the design dir
+# -> name in extra_files_dir
+SHARED_FILES = {
+    "flags": "flags_cst",
+    "abinitio_remodel_cen_stage0a.wts": "abinitio_remodel_cen_stage0a.wts",
+    "abinitio_remodel_cen_stage0b.wts": "abinitio_remodel_cen_stage0b.wts",
+    "abinitio_remodel_cen_stage1.wts": "abinitio_remodel_cen_stage1.wts",
+    "abinitio_remodel_cen_stage2.wts": "abinitio_remodel_cen_stage2.wts",
+    "abinitio_remodel_cen.wts": "abinitio_remodel_cen.wts",
+    "cmd": "cmd",
+    "start.pdb": "start.pdb",
+}
+
+
+def copy_necessary_files(name, dir):
+    for link_name, source in SHARED_FILES.items():
+        os.symlink(f"{dir}/{source}", f"{name}/{link_name}")
+
+
+def motif_flags_text(design_length):
+    """
+    The motif_flags contents for a design with the given repeat length
+    """
+    return "-score:motif_residues " + ",".join(
+        str(ii) for ii in range(design_length, design_length * 2 + 1)
     )
-    os.symlink(f"{dir}/cmd", name + "/cmd")
-    os.symlink(f"{dir}/start.pdb", name + "/start.pdb")
 
 
 def add_flags(path_name, name, design_length):
-    fl = open(path_name + "/motif_flags", "w")
-    fl.write("-score:motif_residues ")
-    # design_length = get_design_length(name)
-    # print("design_length:{}",design_length)
-    for ii in range(design_length, design_length * 2):
-        fl.write("{},".format(ii))
-    fl.write("{}".format(design_length * 2))
-    fl.close
+    with open(path_name + "/motif_flags", "w") as fl:
+        fl.write(motif_flags_text(design_length))
+
+
+def render_design_files(
+    ss_elements,
+    extra_pose=None,
+    append=False,
+    abego=False,
+    cst_repeats=2,
+    cst_separations=(1,),
+):
+    """
+    Renders the per-design files prepare_design_dir writes, without touching
+    the filesystem
+
+    Returns (name, {file name: contents}); the SHARED_FILES are not included
+    """
+    from bp_tools.atom_pair_csts import create_atom_pair_csts
+
+    name = get_design_name(ss_elements)
+    repeat_size = sum(size for type, size, lat, cst in ss_elements)
+    blueprint_elements = [(type, size) for type, size, lat, cst in ss_elements]
+    return (
+        name,
+        {
+            "design.blueprint": render_blueprint(
+                blueprint_elements,
+                extra_pose=extra_pose,
+                append=append,
+                abego=abego,
+            ),
+            "lattice_csts.cst": create_atom_pair_csts(
+                ss_elements,
+                repeat_size=repeat_size,
+                n_repeats=cst_repeats,
+                separations=cst_separations,
+            ),
+            "motif_flags": motif_flags_text(repeat_size),
+        },
+    )
 
 
 def get_design_length(name):
@@ -327,75 +536,204 @@ def create_atom_pair_cst_string(
     sheet_sd=0.2,
 ):
     """
-    Creates atom pair csts between repeats. Sheet mode adds N-O H-O also
-    """
-    lines = ""
-    cst_template = "AtomPair CA %s CA %s HARMONIC %s %s"
-
-    # cst_template_NO = "AtomPair N  %s O  %s HARMONIC 2.8 0.2"
-    # cst_template_HO = "AtomPair H  %s O  %s HARMONIC 1.8 0.2"
-    cst_template_CB = "AtomPair CB %s CB %s HARMONIC 4.8 0.5"
-    c = str("%.2f" % lattice_space).rjust(4)
-    d = str("%.2f" % cst_tolerance).rjust(2)
-    # ref_0 = resnums[0]
-    for i in resnums:
-        # if ss_list[i-1] == 'h':
-        a = str(int(i)).rjust(2)
-        b = str(int(repeat_size + i)).rjust(3)
-        line = cst_template % (a, b, c, d)
-        lines += line
-        lines += "\n"
-        if sheet_mode:  # and (i - ref_0 + 1) % 2:
-            a = str(int(i)).rjust(2)
-            b = str(int(repeat_size + i - 1)).rjust(3)
-            line_cb = cst_template_CB % (a, b)
-            # line_no = cst_template_NO % (a, b)
-            # line_ho = cst_template_HO % (a, b)
-            lines += line_cb + "\n"
-            # lines += line_ho + "\n"
-            # lines += line_no + "\n"
-    return lines
-
-
-def create_csts(name, ss_elements, lattice_space, cst_tolerance):
-    ss_lengths = [int(element[1:]) for element in ss_elements]
-    # for i, element in enumerate(ss_elements):
-    #    for x in range(ss_lengths[i]):
-    # 	  ss_list.append(ss_elements[0][0])
-    rep_len = sum(ss_lengths)
-    cst_template = "AtomPair CA %s CA %s HARMONIC %s %s"
-    c = str("%.2f" % lattice_space).rjust(4)
-    d = str("%.2f" % cst_tolerance).rjust(2)
+    Creates atom pair csts between repeats. Sheet mode adds CB-CB pairs also
+
+    See bp_tools.atom_pair_csts for constraints across more than two repeats
+    """
+    from bp_tools.atom_pair_csts import atom_pair_cst_block
+
+    return atom_pair_cst_block(
+        resnums,
+        lattice_space,
+        repeat_size,
+        cst_tolerance,
+        families=("CA", "CB") if sheet_mode else ("CA",),
+    )
+
+
+def create_csts(name, ss_elements, lattice_space, cst_tolerance, n_repeats=2):
+    """
+    Legacy constraint writer for names like ["H20", "L3", "H18"]
+
+    Every other element starting with the first gets CA pairs between each
+    pair of adjacent repeats
+    """
+    from bp_tools.atom_pair_csts import write_atom_pair_csts
+
+    elements = [
+        (
+            element[0],
+            int(element[1:]),
+            0 if i % 2 else lattice_space,
+            cst_tolerance,
+        )
+        for i, element in enumerate(ss_elements)
+    ]
     with open(name + "/lattice_csts.cst", "w") as fout:
-        for rep_unit in [0]:
-            for i in range(1, ss_lengths[0] + 1):
-                # if ss_list[i-1] == 'h':
-                a = str(int(i + rep_unit * rep_len)).rjust(2)
-                b = str(int(rep_len + i + rep_unit * rep_len)).rjust(3)
-                line = cst_template % (a, b, c, d)
-                fout.write(line + "\n")
-            for i in range(
-                ss_lengths[0] + ss_lengths[1] + 1,
-                ss_lengths[0] + ss_lengths[1] + ss_lengths[2] + 1,
-            ):
-                # if ss_list[i-1] == 'h':
-                a = str(int(i + rep_unit * rep_len)).rjust(2)
-                b = str(int(rep_len + i + rep_unit * rep_len)).rjust(3)
-                line = cst_template % (a, b, c, d)
-                fout.write(line + "\n")
+        # no per type families: CA pairs only, whatever the element type
+        write_atom_pair_csts(fout, elements, n_repeats=n_repeats, families={})
+
+
+def sequence_to_blueprint(sequence, offset=0, clip=2):
+    """
+    Blueprint rows ("resi name1 .") for a one letter sequence
+
+    Positions 1 + offset through len(sequence) - clip are kept
+    """
+    return "\n".join(
+        f"{resi} {sequence[resi - 1]} ."
+        for resi in range(1 + offset, len(sequence) + 1 - clip)
+    )
 
 
 def pose_to_blueprint(pose, offset=0, clip=2):
     """
+    Blueprint rows for every residue of pose, see sequence_to_blueprint
     """
-    # chain_a = pose.split_by_chain()[1]
-    out = ""
-    for resi in range(1 + offset, len(pose.residues) + 1 - clip):
-        resn = pose.residue(resi).name1()
-        out += f"{resi} {resn} ."
-        out += "\n"
-    out = out[:-1]
-    return out
+    return sequence_to_blueprint(pose.sequence(), offset=offset, clip=clip)
+
+
+def get_chain_sequence(extra_pose):
+    """
+    One letter sequence of the first chain of extra_pose
+
+    extra_pose may be a pyrosetta Pose or a pdb_reader.ChainResidues (which
+    already describes a single chain)
+    """
+    if hasattr(extra_pose, "split_by_chain"):
+        return extra_pose.split_by_chain()[1].sequence()
+    return extra_pose.sequence
+
+
+class FragmentRows(object):
+    """
+    The pose-derived part of a blueprint for an inserted fragment
+
+    lead and trail are the fixed rows before/after the built elements,
+    first_anchor and last_anchor are the (position, name1) of the fragment
+    residues that get the secondary structure of the first/last element.
+    These only depend on the fragment and the insertion mode, so they can be
+    rendered once and reused for every combination.
+    """
+
+    def __init__(
+        self,
+        append,
+        lead=None,
+        first_anchor=None,
+        last_anchor=None,
+        trail=None,
+    ):
+        self.append = append
+        self.lead = lead
+        self.first_anchor = first_anchor
+        self.last_anchor = last_anchor
+        self.trail = trail
+
+    def to_dict(self):
+        return {
+            "append": self.append,
+            "lead": self.lead,
+            "first_anchor": self.first_anchor,
+            "last_anchor": self.last_anchor,
+            "trail": self.trail,
+        }
+
+    @classmethod
+    def from_dict(cls, dict):
+        return cls(**dict)
+
+    def __repr__(self):
+        return f"""FragmentRows(**{self.to_dict()})"""
+
+
+def render_fragment_rows(sequence, append=False, offset=None, clip=None):
+    """
+    Renders the FragmentRows for a fragment with the given sequence
+
+    offset and clip select the fixed rows (see sequence_to_blueprint) and
+    default to 0 and 2 when appending, 2 and 0 when prepending
+    """
+    if append:
+        # This dumps all but the last two positions in the pose to the bp
+        # The last res before the dump is special, as is the last for
+        # bp insertions
+        pre_append_pos = len(sequence) - 1
+        last_pos = len(sequence)
+        return FragmentRows(
+            True,
+            lead=sequence_to_blueprint(
+                sequence,
+                offset=0 if offset is None else offset,
+                clip=2 if clip is None else clip,
+            ),
+            first_anchor=(pre_append_pos, sequence[pre_append_pos - 1]),
+            last_anchor=(last_pos, sequence[last_pos - 1]),
+        )
+    return FragmentRows(
+        False,
+        last_anchor=(2, sequence[1]),
+        trail=sequence_to_blueprint(
+            sequence,
+            offset=2 if offset is None else offset,
+            clip=0 if clip is None else clip,
+        ),
+    )
+
+
+# blueprint secondary structure per element type, (dssp mode, abego mode)
+BLUEPRINT_SS_TYPES = {"h": ("HA", "H"), "l": ("LD", "L"), "e": ("ED", "E")}
+
+
+@lru_cache(maxsize=4096)
+def _element_rows(bp_type, size, first):
+    """
+    The "0 x <type>" rows built for one element
+
+    The first element's first row is the anchor, so it gets one row less
+    """
+    return f"0 x {bp_type}\n" * (size - 1 if first else size)
+
+
+def render_blueprint(ss_elements, extra_pose=None, append=False, abego=False):
+    """
+    Returns the text of the blueprint create_blueprint would write
+
+    Each element contributes a cached block of rows, so rendering costs one
+    lookup per element rather than one format/print per residue
+    """
+    rows = None
+    if isinstance(extra_pose, FragmentRows):
+        rows = extra_pose
+    elif isinstance(extra_pose, str):
+        from bp_tools.pdb_reader import read_chain_residues
+
+        rows = render_fragment_rows(
+            read_chain_residues(extra_pose).sequence, append
+        )
+    elif extra_pose is not None:
+        rows = render_fragment_rows(get_chain_sequence(extra_pose), append)
+    parts = []
+    if rows and rows.lead is not None:
+        parts.append(f"{rows.lead}\n")
+    # elements of an unknown type keep the type of the previous element
+    bp_type = "LD"
+    first = True
+    for ssType, ssLength in ss_elements:
+        previous = (bp_type, bp_type)
+        bp_type = BLUEPRINT_SS_TYPES.get(ssType.lower(), previous)[abego]
+        if first:
+            anchor = rows.first_anchor if rows and rows.first_anchor else None
+            pos, name1 = anchor if anchor else (1, "A")
+            parts.append(f"{pos} {name1} {bp_type}\n")
+        parts.append(_element_rows(bp_type, ssLength, first))
+        first = False
+    if rows and rows.last_anchor:
+        pos, name1 = rows.last_anchor
+        parts.append(f"{pos} {name1} {bp_type}\n")
+    if rows and rows.trail is not None:
+        parts.append(f"{rows.trail}\n")
+    return "".join(parts)
 
 
 def create_blueprint(
@@ -405,66 +743,17 @@ def create_blueprint(
     Dumps a blueprint file at the given path
 
     ss_elements should be a list of tuples (dssp_type,length) to be bprint built
-    """
-    fl = open(path, "w")
-    first = True
-    extra_pose_a = None
-    if extra_pose:
-
-        extra_pose_a = extra_pose.split_by_chain()[1]
-        if append:
-
-            # This dumps all but the last two positions in the pose to the bp
-            # The last res before the dump is special, as is the last for
-            # bp insertions
-            print(pose_to_blueprint(extra_pose_a), file=fl)
-    helix_type = "H" if abego else "HA"
-    sheet_type = "E" if abego else "ED"
-    loop_type = "L" if abego else "LD"
-    tmpType = "LD"
-    for ssType, ssLength in ss_elements:
-        if ssType.lower() == "h":
-            tmpType = helix_type
-        if ssType.lower() == "l":
-            tmpType = loop_type
-        if ssType.lower() == "e":
-            tmpType = sheet_type
-        if first:
-            if extra_pose_a and append:
-                pre_append_pos = len(extra_pose_a.residues) - 1
-                print(
-                    "{} {} {}".format(
-                        pre_append_pos,
-                        extra_pose_a.residue(pre_append_pos).name1(),
-                        tmpType,
-                    ),
-                    file=fl,
-                )
-
-            else:
-                print("{} {} {}".format(1, "A", tmpType), file=fl)
-            first = False
-            for ii in range(1, ssLength):
-                print("{} {} {}".format(0, "x", tmpType), file=fl)
-        else:
-            for ii in range(0, ssLength):
-                print("{} {} {}".format(0, "x", tmpType), file=fl)
-    if extra_pose_a and append:
-        last_pos = len(extra_pose_a.residues)
-        print(
-            "{} {} {}".format(
-                last_pos, extra_pose_a.residue(last_pos).name1(), tmpType
-            ),
-            file=fl,
-        )
-    if extra_pose_a and not append:
-        print(
-            "{} {} {}".format(2, extra_pose_a.residue(2).name1(), tmpType),
-            file=fl,
-        )
-        print(pose_to_blueprint(extra_pose_a, offset=2, clip=0), file=fl)
 
-    fl.close()
+    extra_pose is the fragment to insert, either a pyrosetta Pose, a
+    ChainResidues from bp_tools.pdb_reader (no pyrosetta needed),
+    pre-rendered FragmentRows (whose own insertion mode is used) or the
+    path of a structure file or "path.silent:tag"
+    """
+    text = render_blueprint(
+        ss_elements, extra_pose=extra_pose, append=append, abego=abego
+    )
+    with open(path, "w") as fl:
+        fl.write(text)
 
 
 def build_from_params(params,):
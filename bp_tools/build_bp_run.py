@@ -1,495 +1,66 @@
 #!/usr/bin/env python3
-from itertools import product
-
-import pyrosetta
-
-from argparse import ArgumentParser
-import os
 import json
-
-parser = ArgumentParser()
-
+import os
+import sys
 
 import click
 
+from bp_tools.blueprint_cache import (
+    BlueprintFragmentCache,
+    pose_sequence_loader,
+    read_sequence,
+)
+from bp_tools.bp_tools import (
+    DESIGN_LAYOUTS,
+    build_from_file,
+    build_from_params,
+)
+from bp_tools.bulk_writer import prepare_design_dirs
+from bp_tools.design_filters import (
+    CANONICAL_MODES,
+    CyclicCanonical,
+    FilterStats,
+    LengthWindow,
+    accepts_all,
+    iter_filtered,
+    parse_relation,
+)
+from bp_tools.design_index import INDEX_NAME, DesignIndex
+from bp_tools.design_space import DesignSpace, parse_shard
+from bp_tools.frag_io import write_frag_params_json, write_frag_params_jsonl
+from bp_tools.manifest import MANIFEST_NAME, DesignManifest
+from bp_tools.sampling import SAMPLE_MODES, sample_space
 
-def read_flag_file(filename):
-    """
-    Reads the flag file, ignoring comment lines
-
-
-    """
-    with open(filename, "r") as myfile:
-        lines = myfile.read().splitlines()
-    # filter the lines
-    lines = [l for l in lines if l.startswith("-")]
-    return " ".join(lines)
-
-
-def run_pyrosetta_with_flags(flags_file_path, mute=False):
-    if not flags_file_path:
-        pyrosetta.init("-mute all " if mute else "", silent=mute)
-        return
-    flags = read_flag_file(flags_file_path)
-    flags_str = " ".join(flags.replace("\n", " ").split())
-    pyrosetta.init(
-        f"-mute all {flags_str}" if mute else flags_str, silent=mute
-    )
-
-
-def safe_load_pdb(pdb, rosetta_flags_file=""):
-    run_pyrosetta_with_flags(rosetta_flags_file, mute=False)
-    try:
-        return pyrosetta.pose_from_pdb(pdb)
-    except RuntimeError as e:
-        print(e)
-        print(f"unable to load: {pdb}")
-        return
-
-
-class SecondaryStructElementSampler(object):
-    """
-    A container for describing the fragment type and sizes to use for b-print
-
-    This container is used as an interface for sampling various lengths
-    """
-
-    def __init__(
-        self, dssp_type, min_size, max_size, repeat_dist=0, repeat_dist_cst=0
-    ):
-        self.dssp_type = dssp_type
-        self.min_size = min_size
-        self.max_size = max_size
-        self.repeat_dist = repeat_dist
-        self.repeat_dist_cst = repeat_dist_cst
-
-    def to_dict(self):
-        return {
-            "dssp_type": self.dssp_type,
-            "min_size": self.min_size,
-            "max_size": self.max_size,
-            "repeat_dist": self.repeat_dist,
-            "repeat_dist_cst": self.repeat_dist_cst,
-        }
-
-    def tuple_generator(self):
-        return (
-            (self.dssp_type, i, self.repeat_dist, self.repeat_dist_cst)
-            for i in range(self.min_size, self.max_size + 1)
-        )
-
-    def from_dict(cls, dict):
-        return cls(**dict)
-
-    def __repr__(self):
-        return f"""SecondaryStructElementSampler(**{self.to_dict()})"""
-
-    def __str__(self):
-        return str(
-            "dssp_type"
-            + self.dssp_type
-            + "\n"
-            + "min_size"
-            + self.min_size
-            + "\n"
-            + "max_size"
-            + self.max_size
-            + "\n"
-            + "repeat_dist"
-            + self.repeat_dist
-            + "\n"
-            + "repeat_dist_cst"
-            + self.repeat_dist_cst
-            + "\n"
-        )
-
-    def get_ss_elements_list(self):
-        return [
-            SecondaryStructElement(
-                self.dssp_type, i, self.repeat_dist, self.repeat_dist
-            )
-            for i in range(self.min_size, self.max_size + 1)
-        ]
-
-
-class SecondaryStructElement(object):
-    """
-    A container for describing the specific fragment type to use for b-print
-
-    This container is a convenience interface for saving run params
-    """
-
-    def __init__(self, dssp_type, size, repeat_dist=0, repeat_dist_cst=0):
-        self.dssp_type = dssp_type
-        self.size = size
-        self.repeat_dist = repeat_dist
-        self.repeat_dist_cst = repeat_dist_cst
-
-    def to_dict(self):
-        return {
-            "dssp_type": self.dssp_type,
-            "size": self.size,
-            "repeat_dist": self.repeat_dist,
-            "repeat_dist_cst": self.repeat_dist_cst,
-        }
-
-    def from_dict(cls, dict):
-        return cls(**dict)
-
-    def __repr__(self):
-        return f"""SecondaryStructElement(**{self.to_dict()})"""
-
-    def __str__(self):
-        return str(
-            "dssp_type"
-            + self.dssp_type
-            + "\n"
-            + "size"
-            + self.size
-            + "\n"
-            + "repeat_dist"
-            + self.repeat_dist
-            + "\n"
-            + "repeat_dist_cst"
-            + self.repeat_dist_cst
-            + "\n"
-        )
-
-
-def get_default_xml():
-    """
-    returns a hardcoded xml
-    """
-    return """<ROSETTASCRIPTS>
-    <TASKOPERATIONS>
-    </TASKOPERATIONS>
-    <SCOREFXNS>
-    <ScoreFunction name="sfn_centroid" weights="abinitio_remodel_cen.wts">
-        <Reweight scoretype="sheet" weight="4"/>
-        <Reweight scoretype="ss_pair" weight="1"/>
-    </ScoreFunction>
-    <ScoreFunction name="sfn_motif" weights="empty">
-    <Reweight scoretype="cen_pair_motifs" weight="1"/>
-    </ScoreFunction>
-    <ScoreFunction name="sfn_motif_degree" weights="empty">
-    <Reweight scoretype="cen_pair_motif_degree" weight="1"/>
-    </ScoreFunction>
-    <ScoreFunction name="VDW" weights="empty">
-    <Reweight scoretype="vdw" weight="1"/>
-    </ScoreFunction>
-    </SCOREFXNS>
-    <FILTERS>
-    <worst9mer name="worst9mer_h" threshold="0.15" only_helices="true"/>
-    <ScoreType name="VDW" scorefxn="VDW" threshold="100" confidence="1" />
-    <ScoreType name="motif_score" scorefxn="sfn_motif" threshold="-1" confidence="1" />
-    <ScoreType name="motif_degree_score" scorefxn="sfn_motif_degree" threshold="-0.3" confidence="1" />
-    <SSDegree name="ss_degree_avg" report_avg="true" ignore_terminal_ss="2"/>
-    <SSDegree name="ss_degree_worst" report_avg="false" ignore_terminal_ss="2"/>
-    <RepeatParameter name="radius" param_type="radius" numb_repeats="4" min="0" max="99999999" confidence="1"/> #replace with correct number of repeats
-    <RepeatParameter name="rise" param_type="rise" numb_repeats="4" min="0" max="99999999" confidence="1"/>
-    <RepeatParameter name="omega" param_type="omega" numb_repeats="4" min="0" max="99999999" confidence="1"/>
-    </FILTERS>
-    <MOVERS>
-    <RemodelMover name="remodel_mover" blueprint="design.blueprint"/>
-    </MOVERS>
-    <PROTOCOLS>
-    <Add mover_name="remodel_mover"/>
-    <Add filter_name="VDW"/>
-    <Add filter_name="worst9mer_h"/>
-    <Add filter_name="motif_score"/>
-    <Add filter_name="motif_degree_score"/>
-    <Add filter_name="ss_degree_worst"/>
-    <Add filter_name="radius"/>
-    <Add filter_name="rise"/>
-    <Add filter_name="omega"/>
-    </PROTOCOLS>
-    <OUTPUT scorefxn="sfn_centroid"/>
-    </ROSETTASCRIPTS>"""
+CONTAINER_NAMES = {"tar": "designs.tar", "sqlite": "designs.sqlite"}
 
 
-def prepare_design_dir(
-    dirname,
-    ss_elements,
-    extra_files_dir,
-    extra_pose=None,
+def print_dry_run(
+    design_space,
+    extra_pdb="",
     append=False,
-    abego=False,
-):  # xml_str=""):
-    """
-    prepares a directory to run the rosetta_scripts executable
-
-    ss_elements should be a list of tuples (dssp_type,size,lattice_space,cst_tolerance)
-
-    setting lattice space to 0 will create no constraints for that element
-    """
-
-    # forgive this ugly str parse
-    name = "_".join(
-        ["".join((type, str(size))) for type, size, lat, cst in ss_elements]
-    )
-    repeat_size = sum(size for type, size, lat, cst in ss_elements)
-    if dirname != "":
-        path_name = "{}/{}".format(dirname, name)
-    if not os.path.exists(path_name):
-        os.makedirs(path_name)
-
-    # TODO remove
-    copy_necessary_files(path_name, extra_files_dir)
-    blueprint_elements = [(type, size) for type, size, lat, cst in ss_elements]
-    create_blueprint(
-        path_name + "/design.blueprint",
-        blueprint_elements,
-        extra_pose=extra_pose,
-        append=append,
-        abego=abego,
-    )
-
-    offset = 1
-    cst_string = ""
-    for type, size, lat, cst in ss_elements:
-        if lat:
-            cst_string += create_atom_pair_cst_string(
-                range(offset, offset + size),
-                lat,
-                repeat_size,
-                cst,
-                sheet_mode=(type.lower() == "e"),
-            )
-        offset += size
-    with open(path_name + "/lattice_csts.cst", "w") as f:
-        f.write(cst_string)
-    add_flags(path_name, name, repeat_size)
-    # fl = open(path_name + "/design.xml", "w")
-    # if not xml_str:
-    #     xml_str = get_default_xml()
-    # print(xml_str, file=fl)
-    # fl.close()
-
-
-def copy_necessary_files(name, dir):
-    os.symlink(f"{dir}/flags_cst", name + "/flags")
-    os.symlink(
-        f"{dir}/abinitio_remodel_cen_stage0a.wts",
-        name + "/abinitio_remodel_cen_stage0a.wts",
-    )
-    os.symlink(
-        f"{dir}/abinitio_remodel_cen_stage0b.wts",
-        name + "/abinitio_remodel_cen_stage0b.wts",
-    )
-    os.symlink(
-        f"{dir}/abinitio_remodel_cen_stage1.wts",
-        name + "/abinitio_remodel_cen_stage1.wts",
-    )
-    os.symlink(
-        f"{dir}/abinitio_remodel_cen_stage2.wts",
-        name + "/abinitio_remodel_cen_stage2.wts",
-    )
-    os.symlink(
-        f"{dir}/abinitio_remodel_cen.wts", name + "/abinitio_remodel_cen.wts"
-    )
-    os.symlink(f"{dir}/cmd", name + "/cmd")
-    os.symlink(f"{dir}/start.pdb", name + "/start.pdb")
-
-
-def add_flags(path_name, name, design_length):
-    fl = open(path_name + "/motif_flags", "w")
-    fl.write("-score:motif_residues ")
-    # design_length = get_design_length(name)
-    # print("design_length:{}",design_length)
-    for ii in range(design_length, design_length * 2):
-        fl.write("{},".format(ii))
-    fl.write("{}".format(design_length * 2))
-    fl.close
-
-
-def get_design_length(name):
-    name_wo_filename = os.path.splitext(name)[0]
-    component_list = name_wo_filename.split("_")
-    length = 0
-    for ii in range(1, (len(component_list) - 1)):
-        tmpItem = component_list[ii].replace("h", "")
-        tmpItem2 = tmpItem.replace("l", "")
-        if tmpItem2[0] != "t":
-            length += int(tmpItem2)
-    return length
-
-
-def create_atom_pair_cst_string(
-    resnums,
-    lattice_space,
-    repeat_size,
-    cst_tolerance,
-    sheet_mode=False,
-    sheet_sd=0.2,
-):
-    """
-    Creates atom pair csts between repeats. Sheet mode adds N-O H-O also
-    """
-    lines = ""
-    cst_template = "AtomPair CA %s CA %s HARMONIC %s %s"
-
-    # cst_template_NO = "AtomPair N  %s O  %s HARMONIC 2.8 0.2"
-    # cst_template_HO = "AtomPair H  %s O  %s HARMONIC 1.8 0.2"
-    cst_template_CB = "AtomPair CB %s CB %s HARMONIC 4.8 0.5"
-    c = str("%.2f" % lattice_space).rjust(4)
-    d = str("%.2f" % cst_tolerance).rjust(2)
-    # ref_0 = resnums[0]
-    for i in resnums:
-        # if ss_list[i-1] == 'h':
-        a = str(int(i)).rjust(2)
-        b = str(int(repeat_size + i)).rjust(3)
-        line = cst_template % (a, b, c, d)
-        lines += line
-        lines += "\n"
-        if sheet_mode:  # and (i - ref_0 + 1) % 2:
-            a = str(int(i)).rjust(2)
-            b = str(int(repeat_size + i - 1)).rjust(3)
-            line_cb = cst_template_CB % (a, b)
-            # line_no = cst_template_NO % (a, b)
-            # line_ho = cst_template_HO % (a, b)
-            lines += line_cb + "\n"
-            # lines += line_ho + "\n"
-            # lines += line_no + "\n"
-    return lines
-
-
-def create_csts(name, ss_elements, lattice_space, cst_tolerance):
-    ss_lengths = [int(element[1:]) for element in ss_elements]
-    # for i, element in enumerate(ss_elements):
-    #    for x in range(ss_lengths[i]):
-    # 	  ss_list.append(ss_elements[0][0])
-    rep_len = sum(ss_lengths)
-    cst_template = "AtomPair CA %s CA %s HARMONIC %s %s"
-    c = str("%.2f" % lattice_space).rjust(4)
-    d = str("%.2f" % cst_tolerance).rjust(2)
-    with open(name + "/lattice_csts.cst", "w") as fout:
-        for rep_unit in [0]:
-            for i in range(1, ss_lengths[0] + 1):
-                # if ss_list[i-1] == 'h':
-                a = str(int(i + rep_unit * rep_len)).rjust(2)
-                b = str(int(rep_len + i + rep_unit * rep_len)).rjust(3)
-                line = cst_template % (a, b, c, d)
-                fout.write(line + "\n")
-            for i in range(
-                ss_lengths[0] + ss_lengths[1] + 1,
-                ss_lengths[0] + ss_lengths[1] + ss_lengths[2] + 1,
-            ):
-                # if ss_list[i-1] == 'h':
-                a = str(int(i + rep_unit * rep_len)).rjust(2)
-                b = str(int(rep_len + i + rep_unit * rep_len)).rjust(3)
-                line = cst_template % (a, b, c, d)
-                fout.write(line + "\n")
-
-
-def pose_to_blueprint(pose, offset=0, clip=2):
-    """
-    """
-    # chain_a = pose.split_by_chain()[1]
-    out = ""
-    for resi in range(1 + offset, len(pose.residues) + 1 - clip):
-        resn = pose.residue(resi).name1()
-        out += f"{resi} {resn} ."
-        out += "\n"
-    out = out[:-1]
-    return out
-
-
-def create_blueprint(
-    path, ss_elements, extra_pose=None, append=False, abego=False
+    output_format=None,
+    **kwargs,
 ):
     """
-    Dumps a blueprint file at the given path
+    Prints the closed-form design_stats summary of design_space as json
 
-    ss_elements should be a list of tuples (dssp_type,length) to be bprint built
+    The fragment rows (if any) are read with the built-in pdb reader
     """
-    fl = open(path, "w")
-    first = True
-    extra_pose_a = None
-    if extra_pose:
-
-        extra_pose_a = extra_pose.split_by_chain()[1]
-        if append:
-
-            # This dumps all but the last two positions in the pose to the bp
-            # The last res before the dump is special, as is the last for
-            # bp insertions
-            print(pose_to_blueprint(extra_pose_a), file=fl)
-    helix_type = "H" if abego else "HA"
-    sheet_type = "E" if abego else "ED"
-    loop_type = "L" if abego else "LD"
-    tmpType = "LD"
-    for ssType, ssLength in ss_elements:
-        if ssType.lower() == "h":
-            tmpType = helix_type
-        if ssType.lower() == "l":
-            tmpType = loop_type
-        if ssType.lower() == "e":
-            tmpType = sheet_type
-        if first:
-            if extra_pose_a and append:
-                pre_append_pos = len(extra_pose_a.residues) - 1
-                print(
-                    "{} {} {}".format(
-                        pre_append_pos,
-                        extra_pose_a.residue(pre_append_pos).name1(),
-                        tmpType,
-                    ),
-                    file=fl,
-                )
-
-            else:
-                print("{} {} {}".format(1, "A", tmpType), file=fl)
-            first = False
-            for ii in range(1, ssLength):
-                print("{} {} {}".format(0, "x", tmpType), file=fl)
-        else:
-            for ii in range(0, ssLength):
-                print("{} {} {}".format(0, "x", tmpType), file=fl)
-    if extra_pose_a and append:
-        last_pos = len(extra_pose_a.residues)
-        print(
-            "{} {} {}".format(
-                last_pos, extra_pose_a.residue(last_pos).name1(), tmpType
-            ),
-            file=fl,
-        )
-    if extra_pose_a and not append:
-        print(
-            "{} {} {}".format(2, extra_pose_a.residue(2).name1(), tmpType),
-            file=fl,
-        )
-        print(pose_to_blueprint(extra_pose_a, offset=2, clip=0), file=fl)
-
-    fl.close()
-
-
-def build_from_params(params,):
-    ""
-    sse_list = []
-    for pstr in params:
-        try:
-            dssp_type, min_size, max_size, repeat_dist, repeat_dist_cst = pstr.split(
-                " "
-            )
-        except ValueError:
-            print("no constraints entered for: ", pstr)
-            dssp_type, min_size, max_size, = pstr.split(" ")
-            repeat_dist, repeat_dist_cst = [0] * 2
-        sse_list.append(
-            SecondaryStructElementSampler(
-                dssp_type,
-                int(min_size),
-                int(max_size),
-                float(repeat_dist),
-                float(repeat_dist_cst),
-            )
-        )
-    return sse_list
-
-
-def build_from_file(file):
-    ""
-    return [SecondaryStructElement.from_dict(d) for d in json.load(file)]
+    from bp_tools.design_stats import estimate_design_stats
+
+    fragment_rows = None
+    if extra_pdb:
+        fragment_rows = BlueprintFragmentCache().get(extra_pdb, append=append)
+    stats = estimate_design_stats(
+        design_space,
+        fragment_rows=fragment_rows,
+        output_format=output_format or "dir",
+        **kwargs,
+    ).to_dict()
+    if output_format is None:
+        # no design dirs are built
+        del stats["output"]
+    print(json.dumps(stats, indent=2))
 
 
 @click.command()
@@ -507,8 +78,32 @@ def build_from_file(file):
     "-w",
     "--write-frag-file",
     "write_frag_file",
+    default="",
+    help="Path for the combination dump "
+    "(default: frag_params.json, or frag_params.jsonl/.bin with "
+    "--jsonl/--binary)",
+)
+@click.option(
+    "--jsonl/--json",
+    "jsonl",
     default=False,
     show_default=True,
+    help="Write one combination per line instead of a single json array",
+)
+@click.option(
+    "--binary",
+    "binary",
+    is_flag=True,
+    default=False,
+    help="Write the compact, random access binary frag_params format "
+    "(see bp_frag_convert)",
+)
+@click.option(
+    "--echo/--no-echo",
+    "echo",
+    default=True,
+    show_default=True,
+    help="Print every combination to the console as it is written",
 )
 @click.option(
     "-e",
@@ -517,7 +112,60 @@ def build_from_file(file):
     default=".",
     show_default=True,
 )
-@click.option("-p", "--extra-pdb", "extra_pdb", default="", show_default=True)
+@click.option(
+    "-p",
+    "--extra-pdb",
+    "extra_pdb",
+    default="",
+    show_default=True,
+    help="Fragment to insert: a pdb/mmCIF file or one structure of a silent "
+    "file as path.silent:tag",
+)
+@click.option(
+    "--extra-pdb-dir",
+    "extra_pdb_dir",
+    default="",
+    help="Cross every combination with every structure in this dir, one "
+    "run dir per fragment under --output-dir",
+)
+@click.option(
+    "--extra-pdb-list",
+    "extra_pdb_list",
+    default="",
+    help="Like --extra-pdb-dir, with the fragment paths listed one per line",
+)
+@click.option(
+    "--fragment-timeout",
+    "fragment_timeout",
+    type=float,
+    default=300.0,
+    show_default=True,
+    help="Seconds to load one fragment of --extra-pdb-dir/-list before it is "
+    "skipped",
+)
+@click.option(
+    "--load-pose/--parse-pdb",
+    "load_pose",
+    default=False,
+    show_default=True,
+    help="Load --extra-pdb as a pyrosetta Pose instead of parsing the "
+    "sequence with the built-in pdb/mmCIF reader",
+)
+@click.option(
+    "--pose-service/--no-pose-service",
+    "use_pose_service",
+    default=True,
+    show_default=True,
+    help="With --load-pose, ask a running bp_tools pose-service for the "
+    "structure instead of starting pyrosetta in this process",
+)
+@click.option(
+    "--fragment-cache-dir",
+    "fragment_cache_dir",
+    default="",
+    help="Optional: keep rendered --extra-pdb blueprint rows in this dir so "
+    "later runs do not need to read the structure again",
+)
 @click.option(
     "-a/ ",
     "--append-mode/--prepend-mode",
@@ -539,51 +187,481 @@ def build_from_file(file):
     default="",
     help="Optional: include a rosetta flags file",
 )
+@click.option(
+    "--shard",
+    "shard",
+    default="",
+    help="Only generate contiguous shard i/N (i is 0 based) of the space, "
+    "e.g. --shard $SLURM_ARRAY_TASK_ID/100",
+)
+@click.option(
+    "--index",
+    "indices",
+    type=int,
+    multiple=True,
+    help="Only generate the combination(s) with this index in product order",
+)
+@click.option(
+    "--sample",
+    "sample",
+    type=int,
+    default=None,
+    help="Only generate this many distinct combinations, drawn with "
+    "--sample-mode",
+)
+@click.option(
+    "--sample-mode",
+    "sample_mode",
+    type=click.Choice(SAMPLE_MODES),
+    default="uniform",
+    show_default=True,
+    help="uniform over all combinations, stratified to give every total "
+    "repeat length an equal share, or a low discrepancy halton sequence "
+    "over the element sizes",
+)
+@click.option(
+    "--seed",
+    "seed",
+    type=int,
+    default=0,
+    show_default=True,
+    help="Random seed for --sample",
+)
+@click.option(
+    "--gray-order/--product-order",
+    "gray_order",
+    default=False,
+    show_default=True,
+    help="Enumerate in Gray code order so neighbouring designs differ in "
+    "exactly one element (--index still uses product order, not allowed "
+    "with --sample)",
+)
+@click.option(
+    "--min-length",
+    "min_length",
+    type=int,
+    default=None,
+    help="Skip combinations with a shorter total repeat length",
+)
+@click.option(
+    "--max-length",
+    "max_length",
+    type=int,
+    default=None,
+    help="Skip combinations with a longer total repeat length",
+)
+@click.option(
+    "--relation",
+    "relations",
+    multiple=True,
+    help="Only keep combinations where element sizes satisfy i<op>j[+/-n] "
+    "(0 based positions), e.g. --relation '2>=0' (can be repeated)",
+)
+@click.option(
+    "--dedupe-cyclic",
+    "dedupe_cyclic",
+    type=click.Choice(("off",) + CANONICAL_MODES),
+    default="off",
+    show_default=True,
+    help="Only keep the first of the combinations that are rotations "
+    "(or also reversals) of the same repeat unit",
+)
+@click.option(
+    "--cst-repeats",
+    "cst_repeats",
+    type=int,
+    default=2,
+    show_default=True,
+    help="Number of repeats to write lattice constraints for",
+)
+@click.option(
+    "--cst-separation",
+    "cst_separations",
+    type=click.IntRange(min=1),
+    multiple=True,
+    default=[1],
+    show_default=True,
+    help="Constrain repeat i to repeat i+k for this k (can be repeated)",
+)
+@click.option(
+    "--dry-run",
+    "dry_run",
+    is_flag=True,
+    default=False,
+    help="Only print (as json) the number of combinations, the repeat length "
+    "distribution and the expected output size, computed without "
+    "enumerating; covers the whole space within --min/max-length",
+)
+@click.option(
+    "-b/ ",
+    "--build-design-dirs/--no-build-design-dirs",
+    "build_design_dirs",
+    default=False,
+    show_default=True,
+    help="Also prepare a rosetta_scripts design dir per combination",
+)
+@click.option(
+    "--output-format",
+    "output_format",
+    type=click.Choice(["dir", "tar", "sqlite"]),
+    default="dir",
+    show_default=True,
+    help="Write one dir per design, or all designs into a single "
+    "<output-dir>/designs.tar or designs.sqlite (see bp_materialize)",
+)
+@click.option(
+    "--layout",
+    "layout",
+    type=click.Choice(DESIGN_LAYOUTS),
+    default="flat",
+    show_default=True,
+    help="Put design dirs directly in the output dir, or fan them out into "
+    f"hashed ab/cd/<name> subdirs listed in <output-dir>/{INDEX_NAME}",
+)
+@click.option(
+    "--resume/--no-resume",
+    "resume",
+    default=False,
+    show_default=True,
+    help="Skip design dirs the manifest records as complete and atomically "
+    "rebuild partial or stale ones",
+)
+@click.option(
+    "--manifest",
+    "manifest_path",
+    default="",
+    help=f"Manifest of completed design dirs "
+    f"(default: <output-dir>/{MANIFEST_NAME})",
+)
+@click.option(
+    "--catalog/--no-catalog",
+    "use_catalog",
+    default=True,
+    show_default=True,
+    help="Record every built design in the queryable catalog "
+    "<output-dir>/design_catalog.sqlite (see bp_tools catalog)",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    "jobs",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of parallel workers used to prepare design dirs",
+)
 def main(
     output_dir=".",
     struct_params=[],
     fragment_file="",
     extra_files_dir=".",
     extra_pdb="",
+    extra_pdb_dir="",
+    extra_pdb_list="",
+    fragment_timeout=300.0,
     append=False,
     abego=False,
     rosetta_flags_file="",
+    write_frag_file="",
+    jsonl=False,
+    binary=False,
+    echo=True,
+    shard="",
+    indices=(),
+    build_design_dirs=False,
+    jobs=1,
+    load_pose=False,
+    use_pose_service=True,
+    fragment_cache_dir="",
+    gray_order=False,
+    cst_repeats=2,
+    cst_separations=(1,),
+    resume=False,
+    manifest_path="",
+    output_format="dir",
+    min_length=None,
+    max_length=None,
+    relations=(),
+    dedupe_cyclic="off",
+    dry_run=False,
+    sample=None,
+    sample_mode="uniform",
+    seed=0,
+    layout="flat",
+    use_catalog=True,
 ):
     ""
     if struct_params and fragment_file:
         raise ValueError(
             "either a fragment file or struct params must be given, but not both"
         )
-    sse_sampler_list = (
-        build_from_params(struct_params)
-        if struct_params
-        else build_from_file(fragment_file)
-    )
-    fragerator = product(*(f.get_ss_elements_list() for f in sse_sampler_list))
+    if struct_params:
+        sse_sampler_list = build_from_params(struct_params)
+    else:
+        with open(fragment_file, "r") as f:
+            sse_sampler_list = build_from_file(f)
+    design_space = DesignSpace(sse_sampler_list)
+    # repeated separations would write the same constraints twice
+    cst_separations = tuple(dict.fromkeys(cst_separations))
+    if sum((bool(shard), bool(indices), sample is not None)) > 1:
+        raise click.UsageError(
+            "--shard, --index and --sample are mutually exclusive"
+        )
+    if sample is not None and sample < 1:
+        raise click.BadParameter("must be at least 1", param_hint="--sample")
+    if sample is not None and gray_order:
+        raise click.UsageError(
+            "--gray-order can't be combined with --sample, samples come "
+            "in the order they are drawn"
+        )
+    suffix = "json"
+    if shard:
+        try:
+            shard_i, shard_n = parse_shard(shard)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--shard")
+        start, stop = design_space.shard_bounds(shard_i, shard_n)
+        suffix = f"{shard_i}.json"
+    elif indices:
+        for k in indices:
+            if not -len(design_space) <= k < len(design_space):
+                raise click.BadParameter(
+                    f"{k} is outside the {len(design_space)} combinations",
+                    param_hint="--index",
+                )
+    else:
+        start, stop = 0, len(design_space)
+    # (rule, the option it came from)
+    rule_options = []
+    if min_length is not None or max_length is not None:
+        rule_options.append(
+            (LengthWindow(min_length, max_length), "--min-length/--max-length")
+        )
+    for spec in relations:
+        try:
+            rule_options.append((parse_relation(spec), "--relation"))
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--relation")
+    for rule, option in rule_options:
+        try:
+            rule.bind(design_space)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint=option)
+    rules = [rule for rule, _ in rule_options]
+    canonical = None
+    if dedupe_cyclic != "off":
+        # last, so its rejections are counted among otherwise kept designs
+        canonical = CyclicCanonical(dedupe_cyclic)
+        canonical.bind(design_space)
+        rules.append(canonical)
+
+    if dry_run:
+        print_dry_run(
+            design_space,
+            extra_pdb=extra_pdb,
+            append=append,
+            abego=abego,
+            cst_repeats=cst_repeats,
+            cst_separations=cst_separations,
+            min_length=min_length,
+            max_length=max_length,
+            output_format=output_format if build_design_dirs else None,
+            extra_files_dir=extra_files_dir,
+            jsonl=jsonl,
+        )
+        if relations or canonical:
+            print(
+                "--relation and --dedupe-cyclic are not applied in a dry "
+                "run, counts are upper bounds",
+                file=sys.stderr,
+            )
+        return
 
-    dump_list = []
+    def fragerator(stats=None):
+        if sample is not None:
+            return sample_space(
+                design_space,
+                sample,
+                mode=sample_mode,
+                seed=seed,
+                rules=rules,
+                stats=stats,
+            )
+        if indices:
+            combinations = (design_space[k] for k in indices)
+            if rules:
+                return (
+                    combination
+                    for combination in combinations
+                    if accepts_all(combination, rules, stats)
+                )
+            return combinations
+        if rules:
+            return iter_filtered(
+                design_space, rules, start, stop, gray=gray_order, stats=stats
+            )
+        return design_space.iter_range(start, stop, gray=gray_order)
 
-    for ss_elements in fragerator:
-        print(ss_elements)
-        elem_dict_list = [sse.to_dict() for sse in ss_elements]
-        dump_list.append(elem_dict_list)
+    if binary:
+        from bp_tools.frag_binary import write_frag_params_binary
 
-    with open("frag_params.json", "w") as f:
-        json.dump(dump_list, f)
+        suffix = suffix[: -len("json")] + "bin"
 
-    # extra_pose = (
-    #     safe_load_pdb(extra_pdb, rosetta_flags_file=rosetta_flags_file)
-    #     if extra_pdb
-    #     else None
-    # )
-    # prepare_design_dir(
-    #     output_dir,
-    #     elem_list,
-    #     extra_files_dir,
-    #     extra_pose=extra_pose,
-    #     append=append,
-    #     abego=abego,
-    # )
+        def writer(combinations, path, echo=False):
+            return write_frag_params_binary(
+                combinations, path, sse_sampler_list, echo=echo
+            )
+
+    elif jsonl:
+        suffix += "l"
+        writer = write_frag_params_jsonl
+    else:
+        writer = write_frag_params_json
+    stats = FilterStats(rules)
+    writer(
+        fragerator(stats),
+        write_frag_file or f"frag_params.{suffix}",
+        echo=echo,
+    )
+    if rules:
+        for line in stats.report():
+            print(line, file=sys.stderr)
+    if canonical and stats.accepted:
+        candidates = stats.accepted + stats.rejected[canonical.name]
+        print(
+            f"{dedupe_cyclic} dedupe kept {stats.accepted} of {candidates} "
+            f"combinations, reduction factor "
+            f"{candidates / stats.accepted:.2f}",
+            file=sys.stderr,
+        )
+
+    if not build_design_dirs:
+        return
+    if extra_pdb and (extra_pdb_dir or extra_pdb_list):
+        raise click.UsageError(
+            "--extra-pdb can't be combined with --extra-pdb-dir/-list"
+        )
+    if (extra_pdb_dir or extra_pdb_list) and manifest_path:
+        raise click.UsageError(
+            "--manifest can't be used with --extra-pdb-dir/-list, every "
+            "fragment's run dir keeps its own"
+        )
+    loader = read_sequence
+    if load_pose:
+        loader = pose_sequence_loader(rosetta_flags_file)
+        if use_pose_service:
+            from bp_tools.pose_service import service_client
+
+            client = service_client(flags_file=rosetta_flags_file)
+            if client is not None:
+                loader = client.sequence_loader(fallback=loader)
+    # (label, fragment rows, fragment source, run dir) of every run to
+    # build; the fragment rows are rendered once and shared by every design
+    # of a run
+    runs = [(None, None, "", output_dir)]
+    fragment_failures = []
+    if extra_pdb:
+        fragment_cache = BlueprintFragmentCache(
+            cache_dir=fragment_cache_dir or None, loader=loader
+        )
+        try:
+            extra_pose = fragment_cache.get(extra_pdb, append=append)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        runs = [(None, extra_pose, extra_pdb, output_dir)]
+    elif extra_pdb_dir or extra_pdb_list:
+        from bp_tools.fragment_batch import (
+            fragment_labels,
+            list_fragment_files,
+            render_fragments,
+            write_fragment_table,
+        )
+
+        fragment_paths = list_fragment_files(extra_pdb_dir, extra_pdb_list)
+        if not fragment_paths:
+            raise click.ClickException("no fragment files found")
+        rows, fragment_failures = render_fragments(
+            fragment_paths,
+            loader,
+            append=append,
+            cache_dir=fragment_cache_dir or None,
+            workers=jobs,
+            timeout=fragment_timeout,
+        )
+        for path, error in fragment_failures:
+            print(f"failed to load fragment {path}: {error}", file=sys.stderr)
+        entries = [
+            (label, path, os.path.join(output_dir, label))
+            for label, path in zip(
+                fragment_labels(fragment_paths), fragment_paths
+            )
+            if path in rows
+        ]
+        os.makedirs(output_dir, exist_ok=True)
+        write_fragment_table(output_dir, entries)
+        runs = [
+            (label, rows[path], path, run_dir)
+            for label, path, run_dir in entries
+        ]
+    # tarfile and sqlite3 are only needed once we build
+    from bp_tools.catalog import CATALOG_NAME, DesignCatalog
+    from bp_tools.output_backends import open_backend
+
+    catalog = None
+    if use_catalog:
+        os.makedirs(output_dir, exist_ok=True)
+        catalog = DesignCatalog(os.path.join(output_dir, CATALOG_NAME))
+    failed = bool(fragment_failures)
+    for label, extra_pose, fragment, run_dir in runs:
+        if label is not None:
+            print(f"fragment {label}", file=sys.stderr)
+        os.makedirs(run_dir, exist_ok=True)
+        container = run_dir
+        if output_format != "dir":
+            container = os.path.join(run_dir, CONTAINER_NAMES[output_format])
+        with open_backend(
+            container,
+            extra_files_dir,
+            backend_type=output_format,
+            layout=layout,
+        ) as backend, DesignManifest(
+            manifest_path or os.path.join(run_dir, MANIFEST_NAME)
+        ) as manifest, DesignIndex(
+            run_dir
+        ) as index:
+            result = prepare_design_dirs(
+                fragerator(),
+                run_dir,
+                extra_files_dir,
+                workers=jobs,
+                extra_pose=extra_pose,
+                append=append,
+                abego=abego,
+                cst_repeats=cst_repeats,
+                cst_separations=cst_separations,
+                total=(
+                    stats.accepted
+                    if rules
+                    else (
+                        min(sample, len(design_space))
+                        if sample is not None
+                        else len(indices) if indices else stop - start
+                    )
+                ),
+                manifest=manifest,
+                resume=resume,
+                backend=backend,
+                index=index if layout != "flat" else None,
+                catalog=catalog,
+                fragment=os.path.abspath(fragment) if fragment else "",
+            )
+        for name, error in result.failures:
+            print(f"failed to prepare {name}: {error}", file=sys.stderr)
+        failed = failed or bool(result.failures)
+    if catalog is not None:
+        catalog.close()
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
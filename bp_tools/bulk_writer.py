@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Bulk materialization of design directories
+
+prepare_design_dir does a handful of small, latency-bound filesystem calls
+per combination. prepare_design_dirs fans chunks of combinations out over a
+thread or process pool so many of those calls are in flight at once.
+"""
+
+import concurrent.futures
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from bp_tools.bp_tools import (
+    get_design_name,
+    prepare_design_dir,
+    render_design_files,
+)
+from bp_tools.manifest import design_input_hasher
+
+
+class BulkResult(object):
+    """
+    Summary of a prepare_design_dirs run
+
+    failures is a list of (design_name, error_message) tuples, skipped counts
+    designs a resumed run found already complete in the manifest
+    """
+
+    def __init__(self):
+        self.completed = 0
+        self.skipped = 0
+        self.failures = []
+        self.elapsed = 0.0
+
+    @property
+    def attempted(self):
+        return self.completed + len(self.failures)
+
+    @property
+    def rate(self):
+        return self.attempted / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return (
+            f"BulkResult(completed={self.completed}, skipped={self.skipped}, "
+            f"failed={len(self.failures)}, elapsed={self.elapsed:.2f})"
+        )
+
+
+def _as_tuple(ss_element):
+    return (
+        ss_element.to_tuple()
+        if hasattr(ss_element, "to_tuple")
+        else tuple(ss_element)
+    )
+
+
+def _prepare_chunk(chunk, dirname, extra_files_dir, kwargs):
+    """
+    Worker: prepares every design in chunk, capturing errors per design
+
+    chunk is a list of (ss_elements, input_hash); returns the list of
+    (name, input_hash, path) that completed and the list of failures
+    """
+    completed = []
+    failures = []
+    for ss_elements, input_hash in chunk:
+        name = get_design_name(ss_elements)
+        try:
+            path = prepare_design_dir(
+                dirname, ss_elements, extra_files_dir, **kwargs
+            )
+            completed.append((name, input_hash, path))
+        except Exception as e:
+            failures.append((name, f"{type(e).__name__}: {e}"))
+    return completed, failures
+
+
+def _render_chunk(chunk, kwargs):
+    """
+    Worker for container backends: renders every design in chunk
+
+    Returns the list of (name, files, input_hash) rendered and the list of
+    failures; the parent process writes them to the backend in one batch
+    """
+    rendered = []
+    failures = []
+    kwargs = {k: v for k, v in kwargs.items() if k not in ("atomic", "layout")}
+    for ss_elements, input_hash in chunk:
+        try:
+            name, files = render_design_files(ss_elements, **kwargs)
+            rendered.append((name, files, input_hash))
+        except Exception as e:
+            failures.append(
+                (get_design_name(ss_elements), f"{type(e).__name__}: {e}")
+            )
+    return rendered, failures
+
+
+def _chunked(combinations, chunk_size, input_hash, skip):
+    """
+    Groups combinations (as tuples, with their input hash) into chunks,
+    leaving out the ones skip(name, input_hash) accepts
+    """
+    chunk = []
+    for ss_elements in combinations:
+        ss_elements = [_as_tuple(element) for element in ss_elements]
+        digest = input_hash(ss_elements) if input_hash else None
+        if skip(get_design_name(ss_elements), digest):
+            continue
+        chunk.append((ss_elements, digest))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _report(result, total, start_time, file):
+    elapsed = time.perf_counter() - start_time
+    rate = result.attempted / elapsed if elapsed else 0.0
+    of_total = f"/{total}" if total is not None else ""
+    print(
+        f"processed {result.attempted + result.skipped}{of_total} designs "
+        f"({result.completed} built, {len(result.failures)} failed, "
+        f"{result.skipped} already done) at {rate:.1f} dirs/s",
+        file=file,
+        flush=True,
+    )
+
+
+def prepare_design_dirs(
+    design_space,
+    dirname,
+    extra_files_dir,
+    workers=1,
+    extra_pose=None,
+    append=False,
+    abego=False,
+    cst_repeats=2,
+    cst_separations=(1,),
+    use_processes=False,
+    chunk_size=64,
+    progress=True,
+    report_interval=5.0,
+    progress_file=sys.stderr,
+    total=None,
+    manifest=None,
+    resume=False,
+    backend=None,
+    layout="flat",
+    index=None,
+    catalog=None,
+    fragment="",
+):
+    """
+    Runs prepare_design_dir for every combination in design_space
+
+    design_space may be a DesignSpace or any iterable of combinations, each
+    either a sequence of SecondaryStructElement or of
+    (dssp_type,size,lattice_space,cst_tolerance) tuples.
+
+    Combinations are submitted to a pool of workers in chunks of chunk_size,
+    with at most two chunks per worker in flight so memory stays bounded.
+    Threads are used by default since the work is dominated by filesystem
+    latency; use_processes switches to a process pool (extra_pose must then
+    be picklable). A failing design is recorded in the result and does not
+    stop the batch. total is only used for progress reports and defaults to
+    len(design_space) where available.
+
+    If a DesignManifest is given every completed design is recorded in it
+    with a hash of its inputs. With resume, designs already recorded with
+    the same hash (and still on disk) are skipped, and everything else is
+    rebuilt atomically, replacing partial dirs from an interrupted run.
+
+    backend is an optional output backend (see output_backends). Container
+    backends do not take parallel writes: workers only render the design
+    files and every finished chunk is written to the backend as one batch.
+
+    layout is "flat" or "hashed" (see bp_tools.design_path); a directory
+    backend brings its own. Completed design dirs are added to index (a
+    design_index.DesignIndex) if one is given, and every completed design
+    to catalog (a catalog.DesignCatalog) with fragment as its fragment
+    source.
+
+    Returns a BulkResult
+    """
+    kwargs = {
+        "extra_pose": extra_pose,
+        "append": append,
+        "abego": abego,
+        "cst_repeats": cst_repeats,
+        "cst_separations": tuple(cst_separations),
+        "layout": layout,
+    }
+    if resume:
+        if manifest is None:
+            raise ValueError("resume needs a manifest")
+        kwargs["atomic"] = True
+    if total is None and hasattr(design_space, "__len__"):
+        total = len(design_space)
+    result = BulkResult()
+    input_hash = None
+    if manifest is not None:
+        input_hash = design_input_hasher(
+            extra_files_dir=extra_files_dir,
+            extra_pose=extra_pose,
+            append=append,
+            abego=abego,
+            cst_repeats=cst_repeats,
+            cst_separations=cst_separations,
+        )
+
+    container = backend is not None and not backend.parallel_writes
+    if backend is not None and not container:
+        dirname = backend.dirname
+        kwargs["layout"] = backend.layout
+
+    def on_disk(name):
+        if container:
+            return backend.has_design(name)
+        return os.path.isdir(manifest.completed[name]["path"])
+
+    def skip(name, digest):
+        if resume and manifest.is_complete(name, digest) and on_disk(name):
+            result.skipped += 1
+            return True
+        return False
+
+    start_time = time.perf_counter()
+    last_report = start_time
+    workers = max(1, workers)
+    # the executors are resolved lazily so importing this module stays cheap
+    pool_type = (
+        concurrent.futures.ProcessPoolExecutor
+        if use_processes
+        else concurrent.futures.ThreadPoolExecutor
+    )
+    chunks = _chunked(design_space, chunk_size, input_hash, skip)
+    with pool_type(max_workers=workers) as pool:
+        pending = set()
+        chunk_elements = {}
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < 2 * workers:
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if container:
+                    future = pool.submit(_render_chunk, chunk, kwargs)
+                else:
+                    future = pool.submit(
+                        _prepare_chunk,
+                        chunk,
+                        dirname,
+                        extra_files_dir,
+                        kwargs,
+                    )
+                pending.add(future)
+                if catalog is not None:
+                    chunk_elements[future] = {
+                        get_design_name(ss_elements): ss_elements
+                        for ss_elements, _ in chunk
+                    }
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                completed, failures = future.result()
+                if container:
+                    try:
+                        backend.write_designs(
+                            [(name, files) for name, files, _ in completed]
+                        )
+                    except Exception as e:
+                        error = f"{type(e).__name__}: {e}"
+                        failures += [(name, error) for name, *_ in completed]
+                        completed = []
+                    completed = [
+                        (name, digest, backend.location(name))
+                        for name, _, digest in completed
+                    ]
+                result.completed += len(completed)
+                result.failures.extend(failures)
+                if manifest is not None:
+                    for name, digest, path in completed:
+                        manifest.record(name, digest, path)
+                if index is not None and not container:
+                    for name, _, path in completed:
+                        index.add(name, path)
+                if catalog is not None:
+                    elements = chunk_elements.pop(future)
+                    catalog.add_designs(
+                        [
+                            (elements[name], path, digest)
+                            for name, digest, path in completed
+                        ],
+                        fragment=fragment,
+                        cst_repeats=cst_repeats,
+                        cst_separations=cst_separations,
+                        append=append,
+                        abego=abego,
+                    )
+            now = time.perf_counter()
+            if progress and now - last_report >= report_interval:
+                _report(result, total, start_time, progress_file)
+                last_report = now
+    result.elapsed = time.perf_counter() - start_time
+    if progress:
+        _report(result, total, start_time, progress_file)
+    return result
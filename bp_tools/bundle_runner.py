@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Runs a bundle of designs in one pyrosetta process
+
+pyrosetta is initialized once with the shared flags file of the run (the
+design dirs' "flags"), then every design in the bundle gets its own
+blueprint, constraints and per-design flags set as options and runs
+through the protocol from inside its design dir, so the relative paths of
+the flags and the XML resolve as they do for the design's cmd.
+
+The default protocol does what "rosetta_scripts @flags" does: it parses
+the -parser:protocol XML of the flags (get_default_xml if there is none)
+for every design, applies it to start.pdb, and only writes structures
+that pass its filters. Every written structure gets a line in the score
+file (-out:file:scorefile, default score.sc) with the filter values and
+the total score of the XML's OUTPUT score function, so bp_tools harvest
+reads bundle runs like cmd runs. --protocol module:function swaps in any
+callable protocol(pose, design_dir) that modifies pose in place and
+returns False to discard it.
+"""
+
+import contextlib
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ElementTree
+
+import click
+
+from bp_tools.bp_tools import get_pyrosetta_session
+from bp_tools.bundles import is_container_location
+
+# per-design files and the rosetta file options they are passed as
+DESIGN_FILE_OPTIONS = {
+    "design.blueprint": "remodel:blueprint",
+    "lattice_csts.cst": "constraints:cst_file",
+}
+PER_DESIGN_FLAGS = ("motif_flags",)
+DEFAULT_SCOREFILE = "score.sc"
+
+
+def read_bundle(path):
+    with open(path, "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def parse_flags_file(path):
+    """
+    {option: [values]} for the "-option value,value" lines of a flags file
+    """
+    options = {}
+    with open(path, "r") as f:
+        for token in f.read().split():
+            if token.startswith("-") and not token[1:2].isdigit():
+                key = token.lstrip("-")
+                options[key] = []
+            elif options:
+                options[key] += [v for v in token.split(",") if v]
+    return options
+
+
+def _set_option(key, values):
+    from pyrosetta.rosetta.basic import options
+
+    if all(v.lstrip("-").isdigit() for v in values):
+        options.set_integer_vector_option(key, [int(v) for v in values])
+    else:
+        options.set_string_vector_option(key, values)
+
+
+def set_design_options(design_dir):
+    """
+    Points the global rosetta options at the files of design_dir
+    """
+    from pyrosetta.rosetta.basic import options
+
+    for file_name, key in DESIGN_FILE_OPTIONS.items():
+        path = os.path.join(design_dir, file_name)
+        if key == "constraints:cst_file":
+            options.set_file_vector_option(key, [path])
+        else:
+            options.set_file_option(key, path)
+    for flags_name in PER_DESIGN_FLAGS:
+        path = os.path.join(design_dir, flags_name)
+        if os.path.exists(path):
+            for key, values in parse_flags_file(path).items():
+                _set_option(key, values)
+
+
+def design_flags(design_dir):
+    """
+    {option: [values]} of the design's flags file, {} if it has none
+    """
+    path = os.path.join(design_dir, "flags")
+    return parse_flags_file(path) if os.path.exists(path) else {}
+
+
+def protocol_xml(design_dir):
+    """
+    Text of the rosetta_scripts XML of a design: the -parser:protocol file
+    of its flags (relative to the design dir), else get_default_xml
+    """
+    from bp_tools.bp_tools import get_default_xml
+
+    values = design_flags(design_dir).get("parser:protocol")
+    if not values:
+        return get_default_xml()
+    with open(os.path.join(design_dir, values[0]), "r") as f:
+        return f.read()
+
+
+def _output_scorefxn_name(xml):
+    try:
+        output = ElementTree.fromstring(xml).find("OUTPUT")
+    except ElementTree.ParseError:
+        return None
+    return None if output is None else output.get("scorefxn")
+
+
+def rosetta_scripts_protocol(pose, design_dir):
+    """
+    Default protocol: the design's rosetta_scripts XML (see protocol_xml),
+    parsed in the design dir so its relative paths resolve there
+
+    Returns whether the pose passed the protocol's filters. The total score
+    is computed with the score function of the OUTPUT tag, as
+    rosetta_scripts does for its score file
+    """
+    from pyrosetta.rosetta.protocols.moves import MoverStatus
+    from pyrosetta.rosetta.protocols.rosetta_scripts import XmlObjects
+
+    xml = protocol_xml(design_dir)
+    objects = XmlObjects.create_from_string(xml)
+    protocol = objects.get_mover("ParsedProtocol")
+    protocol.apply(pose)
+    if protocol.get_last_move_status() != MoverStatus.MS_SUCCESS:
+        return False
+    scorefxn_name = _output_scorefxn_name(xml)
+    if scorefxn_name:
+        objects.get_score_function(scorefxn_name)(pose)
+    return True
+
+
+def pose_scores(pose):
+    """
+    {term: value} of a scored pose: its energies and the extra scores the
+    filters reported
+    """
+    return {
+        name: float(value)
+        for name, value in dict(pose.scores).items()
+        if isinstance(value, (int, float))
+    }
+
+
+def append_score_line(path, tag, scores):
+    """
+    Appends tag's scores to a Rosetta score file, with a "SCORE: ...
+    description" header line first if the file is new or its last header
+    had other terms
+    """
+    terms = sorted(scores)
+    if "total_score" in scores:
+        terms.remove("total_score")
+        terms.insert(0, "total_score")
+    header = None
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                fields = line.split()
+                if fields[:1] == ["SCORE:"] and fields[-1] == "description":
+                    header = fields[1:-1]
+    widths = [max(len(term), 10) for term in terms]
+    with open(path, "a") as f:
+        if header != terms:
+            if header is None:
+                f.write("SEQUENCE: \n")
+            f.write(
+                "SCORE: "
+                + " ".join(t.rjust(w) for t, w in zip(terms, widths))
+                + " description\n"
+            )
+        f.write(
+            "SCORE: "
+            + " ".join(
+                f"{scores[t]:.3f}".rjust(w) for t, w in zip(terms, widths)
+            )
+            + f" {tag}\n"
+        )
+
+
+@contextlib.contextmanager
+def working_dir(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def load_protocol(spec):
+    """
+    Imports "module:function"
+    """
+    module_name, sep, function_name = spec.partition(":")
+    if not sep:
+        raise ValueError(f"protocol must look like module:function: {spec}")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def resolve_design_dir(location, scratch_dir):
+    """
+    The design dir of a bundle entry, materializing container entries into
+    scratch_dir
+    """
+    if is_container_location(location):
+        from bp_tools.output_backends import materialize_design
+
+        container, _, name = location.rpartition(":")
+        return materialize_design(container, name, scratch_dir)
+    return location
+
+
+def _run_design(
+    location,
+    protocol,
+    nstruct,
+    output_dir,
+    flags_file,
+    scratch_dir,
+    session,
+    log,
+):
+    """
+    Runs one design of run_bundle, returns its error message or None
+    """
+    import pyrosetta
+
+    start = time.perf_counter()
+    container = design_dir = None
+    try:
+        design_dir = os.path.abspath(resolve_design_dir(location, scratch_dir))
+        if is_container_location(location):
+            container = location.rpartition(":")[0]
+        if not session.initialized:
+            session.init(flags_file or os.path.join(design_dir, "flags"))
+        set_design_options(design_dir)
+        name = os.path.basename(os.path.normpath(design_dir))
+        out_dir = os.path.abspath(output_dir or design_dir)
+        os.makedirs(out_dir, exist_ok=True)
+        scorefile = design_flags(design_dir).get(
+            "out:file:scorefile", [DEFAULT_SCOREFILE]
+        )[0]
+        passed = 0
+        with working_dir(design_dir):
+            for i in range(1, nstruct + 1):
+                pose = pyrosetta.pose_from_pdb("start.pdb")
+                if protocol(pose, design_dir) is False:
+                    continue
+                tag = f"{name}_{i:04d}"
+                pose.dump_pdb(os.path.join(out_dir, f"{tag}.pdb"))
+                append_score_line(
+                    os.path.join(out_dir, scorefile), tag, pose_scores(pose)
+                )
+                passed += 1
+        if container is not None:
+            from bp_tools.output_backends import store_results
+
+            store_results(container, name, design_dir)
+    except Exception as e:
+        print(f"failed: {location}: {e}", file=log, flush=True)
+        return f"{type(e).__name__}: {e}"
+    finally:
+        # the materialized copy, its outputs are stored by now
+        if container is not None:
+            shutil.rmtree(design_dir, ignore_errors=True)
+    print(
+        f"done: {location}, {passed}/{nstruct} passed in "
+        f"{time.perf_counter() - start:.1f} s",
+        file=log,
+        flush=True,
+    )
+    return None
+
+
+def run_bundle(
+    locations,
+    protocol=rosetta_scripts_protocol,
+    nstruct=1,
+    output_dir=None,
+    flags_file=None,
+    scratch_dir=None,
+    log=sys.stderr,
+):
+    """
+    Runs protocol nstruct times for every design in locations, in one
+    pyrosetta session
+
+    Structures that pass are written as <name>_<i>.pdb into the design
+    dir, or into output_dir if given, with their scores appended to the
+    score file there. Each design runs with its dir as the working
+    directory; designs of tar/sqlite outputs run from a copy in
+    scratch_dir, whose outputs are then stored next to the container (see
+    output_backends.store_results). flags_file defaults to the "flags" of
+    the first design. A failing design is reported and skipped.
+
+    Returns the list of (location, error message) of the failed designs
+    """
+    own_scratch_dir = scratch_dir is None
+    scratch_dir = scratch_dir or tempfile.mkdtemp(prefix="bp_bundle_")
+    session = get_pyrosetta_session()
+    failures = []
+    try:
+        for location in locations:
+            error = _run_design(
+                location,
+                protocol,
+                nstruct,
+                output_dir,
+                flags_file,
+                scratch_dir,
+                session,
+                log,
+            )
+            if error is not None:
+                failures.append((location, error))
+    finally:
+        if own_scratch_dir:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+    return failures
+
+
+@click.command()
+@click.argument("bundle_file")
+@click.option("-n", "--nstruct", "nstruct", type=int, default=1)
+@click.option(
+    "-o",
+    "--output-dir",
+    "output_dir",
+    default="",
+    help="Write the output pdbs here instead of into each design dir",
+)
+@click.option(
+    "--flags",
+    "flags_file",
+    default="",
+    help="Rosetta flags to initialize with (default: the first design's "
+    "flags)",
+)
+@click.option(
+    "--protocol",
+    "protocol_spec",
+    default="",
+    help="module:function to run on every pose instead of the design's "
+    "rosetta_scripts XML",
+)
+def main(
+    bundle_file, nstruct=1, output_dir="", flags_file="", protocol_spec=""
+):
+    """
+    Runs every design listed in BUNDLE_FILE in this process
+    """
+    protocol = rosetta_scripts_protocol
+    if protocol_spec:
+        try:
+            protocol = load_protocol(protocol_spec)
+        except (ValueError, ImportError, AttributeError) as e:
+            raise click.BadParameter(str(e), param_hint="--protocol")
+    failures = run_bundle(
+        read_bundle(bundle_file),
+        protocol=protocol,
+        nstruct=nstruct,
+        output_dir=output_dir or None,
+        flags_file=flags_file or None,
+    )
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
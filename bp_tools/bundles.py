@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Job bundles: one scheduler task runs K designs in sequence
+
+Starting Rosetta (reading the database) costs tens of seconds, more than a
+short centroid trajectory, so launching one process per design dir wastes
+most of the allocation. write_bundles splits the designs of a run into
+bundles of K and writes
+
+    tasks.txt               every design location, one per line
+    bundle_00000.txt ...    the locations of each bundle
+    bundle_00000.sh ...     the command file of each bundle
+    submit_slurm.sh         an array job script, one task per bundle
+    (or submit_sge.sh)
+
+A bundle either runs each design's own cmd one after another ("cmd"
+runner, saves scheduler overhead) or hands the whole bundle to
+bp_run_bundle, which initializes pyrosetta once and loops over the designs
+("pyrosetta" runner, also saves the Rosetta startup).
+
+Locations are design dirs or "container:name" entries of a tar/sqlite
+output (see output_backends); the latter are materialized into $TMPDIR at
+job start, and what they write there is copied back to results/<name>
+next to the container when they finish (see output_dir_for).
+"""
+
+import json
+import os
+import shlex
+
+from bp_tools.manifest import MANIFEST_NAME
+
+RUNNERS = ("cmd", "pyrosetta")
+SCHEDULERS = ("slurm", "sge")
+TASKS_NAME = "tasks.txt"
+
+
+def is_container_location(location):
+    """
+    True for "path.tar:name" / "path.sqlite:name" locations
+    """
+    from bp_tools.output_backends import backend_type_for
+
+    container, sep, _ = location.rpartition(":")
+    return bool(sep) and backend_type_for(container) != "dir"
+
+
+def output_dir_for(location):
+    """
+    Dir the outputs of the design at location end up in: the design dir
+    itself, or the container's results dir for "container:name" entries
+    """
+    if is_container_location(location):
+        from bp_tools.output_backends import results_dir
+
+        container, _, name = location.rpartition(":")
+        return results_dir(container, name)
+    return location
+
+
+def collect_design_locations(run_dir):
+    """
+    Absolute locations of the designs of a run, in build order
+
+    Read from the manifest if there is one (skipping designs whose dir is
+    gone), else from the hashed layout's index, else from the design dirs
+    directly under run_dir. A run with many fragments (see fragment_batch)
+    lists the designs of every fragment's run dir in turn.
+    """
+    from bp_tools.design_index import DesignIndex
+    from bp_tools.fragment_batch import read_fragment_table
+
+    fragment_runs = read_fragment_table(run_dir)
+    if fragment_runs:
+        return [
+            location
+            for _, _, fragment_run_dir in fragment_runs
+            for location in collect_design_locations(fragment_run_dir)
+        ]
+
+    manifest_path = os.path.join(run_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        locations = {}
+        with open(manifest_path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                locations.pop(record["name"], None)
+                locations[record["name"]] = record["path"]
+        return [
+            location
+            for location in locations.values()
+            if is_container_location(location) or os.path.isdir(location)
+        ]
+    index = DesignIndex(run_dir)
+    if len(index):
+        return [os.path.abspath(index.lookup(name)) for name in index]
+    return sorted(
+        os.path.abspath(entry.path)
+        for entry in os.scandir(run_dir)
+        if entry.is_dir()
+        and os.path.exists(os.path.join(entry.path, "design.blueprint"))
+    )
+
+
+def split_bundles(locations, bundle_size):
+    """
+    Splits locations into consecutive bundles of bundle_size (the last one
+    may be smaller)
+    """
+    if bundle_size < 1:
+        raise ValueError(f"bundle size must be positive, got {bundle_size}")
+    return [
+        locations[i : i + bundle_size]
+        for i in range(0, len(locations), bundle_size)
+    ]
+
+
+def _cmd_bundle_lines(locations):
+    lines = []
+    for location in locations:
+        if not is_container_location(location):
+            lines.append(
+                f"design_dir={shlex.quote(os.path.abspath(location))}"
+            )
+            lines.append(
+                '(cd "$design_dir" && bash ./cmd) '
+                '|| { echo "failed: $design_dir" >&2; status=1; }'
+            )
+            continue
+        container, _, name = location.rpartition(":")
+        args = (
+            f"{shlex.quote(container)} {shlex.quote(name)} "
+            '-o "${TMPDIR:-/tmp}"'
+        )
+        lines.append(f"design_dir=$(bp_materialize {args})")
+        lines.append(
+            '[ -n "$design_dir" ] && (cd "$design_dir" && bash ./cmd) '
+            '|| { echo "failed: $design_dir" >&2; status=1; }'
+        )
+        lines.append(
+            f'[ -z "$design_dir" ] || bp_materialize --store-results {args} '
+            '> /dev/null || { echo "failed to store results: $design_dir" '
+            ">&2; status=1; }"
+        )
+    return lines
+
+
+def bundle_script(bundle_list_path, locations, runner="cmd", runner_args=""):
+    """
+    Text of the command file for one bundle
+    """
+    lines = ["#!/bin/bash", "status=0"]
+    if runner == "cmd":
+        lines += _cmd_bundle_lines(locations)
+    elif runner == "pyrosetta":
+        lines.append(
+            f"bp_run_bundle {shlex.quote(os.path.abspath(bundle_list_path))}"
+            + (f" {runner_args}" if runner_args else "")
+            + " || status=1"
+        )
+    else:
+        raise ValueError(f"unknown runner {runner}, use one of {RUNNERS}")
+    lines.append("exit $status")
+    return "\n".join(lines) + "\n"
+
+
+def scheduler_script(
+    scheduler,
+    bundle_dir,
+    n_bundles,
+    job_name="bp_bundles",
+    max_parallel=None,
+    directives=(),
+):
+    """
+    Text of an array job script running every bundle once
+
+    directives are extra scheduler lines without the #SBATCH / #$ prefix,
+    e.g. "--time=2:00:00" or "-l h_rt=2:00:00"
+    """
+    bundle_dir = os.path.abspath(bundle_dir)
+    log_dir = os.path.join(bundle_dir, "logs")
+    if scheduler == "slurm":
+        throttle = f"%{max_parallel}" if max_parallel else ""
+        header = [
+            f"#SBATCH --job-name={job_name}",
+            f"#SBATCH --array=0-{n_bundles - 1}{throttle}",
+            f"#SBATCH --output={log_dir}/bundle_%a.log",
+        ] + [f"#SBATCH {directive}" for directive in directives]
+        task_id = "$SLURM_ARRAY_TASK_ID"
+    elif scheduler == "sge":
+        header = [
+            f"#$ -N {job_name}",
+            f"#$ -t 1-{n_bundles}",
+            "#$ -cwd",
+            f"#$ -o {log_dir}/",
+            "#$ -j y",
+        ]
+        if max_parallel:
+            header.append(f"#$ -tc {max_parallel}")
+        header += [f"#$ {directive}" for directive in directives]
+        # SGE task ids are 1 based
+        task_id = "$((SGE_TASK_ID - 1))"
+    else:
+        raise ValueError(
+            f"unknown scheduler {scheduler}, use one of {SCHEDULERS}"
+        )
+    body = [
+        f'bundle=$(printf "%05d" {task_id})',
+        f'exec bash {shlex.quote(bundle_dir)}/bundle_"$bundle".sh',
+    ]
+    return "\n".join(["#!/bin/bash"] + header + [""] + body) + "\n"
+
+
+def write_bundles(
+    locations,
+    bundle_dir,
+    bundle_size=50,
+    runner="cmd",
+    runner_args="",
+    scheduler="slurm",
+    job_name="bp_bundles",
+    max_parallel=None,
+    directives=(),
+):
+    """
+    Writes the task list, per bundle lists and command files and the array
+    job script for locations into bundle_dir
+
+    Returns the path of the array job script
+    """
+    bundles = split_bundles(list(locations), bundle_size)
+    os.makedirs(os.path.join(bundle_dir, "logs"), exist_ok=True)
+    with open(os.path.join(bundle_dir, TASKS_NAME), "w") as f:
+        f.writelines(
+            f"{location}\n" for bundle in bundles for location in bundle
+        )
+    for i, bundle in enumerate(bundles):
+        list_path = os.path.join(bundle_dir, f"bundle_{i:05d}.txt")
+        with open(list_path, "w") as f:
+            f.writelines(f"{location}\n" for location in bundle)
+        script_path = os.path.join(bundle_dir, f"bundle_{i:05d}.sh")
+        with open(script_path, "w") as f:
+            f.write(bundle_script(list_path, bundle, runner, runner_args))
+        os.chmod(script_path, 0o755)
+    submit_path = os.path.join(bundle_dir, f"submit_{scheduler}.sh")
+    with open(submit_path, "w") as f:
+        f.write(
+            scheduler_script(
+                scheduler,
+                bundle_dir,
+                len(bundles),
+                job_name=job_name,
+                max_parallel=max_parallel,
+                directives=directives,
+            )
+        )
+    os.chmod(submit_path, 0o755)
+    return submit_path
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+Queryable catalog of the designs of a run
+
+build_bp_run records every design it builds as one row of a sqlite
+database at the top of the output dir (CATALOG_NAME): its element types
+and sizes, repeat size, constraint settings, fragment source and location.
+bp_tools run fills in the run status of each design and bp_tools harvest
+its score summary, so selecting designs never needs a directory walk or
+parsing design names:
+
+    bp_tools catalog RUN_DIR --repeat-size 40-50 --has E --status ok
+
+designs holds one row per (name, fragment), elements one row per element
+of a design; the columns queries filter on are indexed.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import click
+
+from bp_tools.bp_tools import get_design_name
+from bp_tools.bundles import is_container_location
+
+CATALOG_NAME = "design_catalog.sqlite"
+# status of a design that was built but hasn't run yet
+BUILT_STATUS = "built"
+DEFAULT_COLUMNS = (
+    "name",
+    "fragment",
+    "repeat_size",
+    "types",
+    "sizes",
+    "status",
+    "path",
+)
+SCHEMA = """
+    PRAGMA journal_mode=WAL;
+    CREATE TABLE IF NOT EXISTS designs (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        fragment TEXT NOT NULL DEFAULT '',
+        n_elements INTEGER,
+        types TEXT,
+        type_set TEXT,
+        sizes TEXT,
+        repeat_size INTEGER,
+        cst_repeats INTEGER,
+        cst_separations TEXT,
+        append INTEGER,
+        abego INTEGER,
+        path TEXT,
+        input_hash TEXT,
+        status TEXT,
+        returncode INTEGER,
+        elapsed REAL,
+        error TEXT,
+        n_scores INTEGER,
+        best_score REAL,
+        updated REAL,
+        UNIQUE (name, fragment));
+    CREATE TABLE IF NOT EXISTS elements (
+        design_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        type TEXT,
+        size INTEGER,
+        lattice_space REAL,
+        cst_tolerance REAL,
+        PRIMARY KEY (design_id, position)) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS type_sets (
+        type_set TEXT PRIMARY KEY) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS designs_repeat_size ON designs (repeat_size);
+    CREATE INDEX IF NOT EXISTS designs_types ON designs (types);
+    CREATE INDEX IF NOT EXISTS designs_type_set
+        ON designs (type_set, repeat_size);
+    CREATE INDEX IF NOT EXISTS designs_status ON designs (status);
+    CREATE INDEX IF NOT EXISTS designs_path ON designs (path);
+    CREATE INDEX IF NOT EXISTS elements_type_size
+        ON elements (type, size, design_id);
+    """
+UPSERT = """
+    INSERT INTO designs (
+        name, fragment, n_elements, types, type_set, sizes, repeat_size,
+        cst_repeats, cst_separations, append, abego, path, input_hash,
+        status, updated)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (name, fragment) DO UPDATE SET
+        n_elements = excluded.n_elements,
+        types = excluded.types,
+        type_set = excluded.type_set,
+        sizes = excluded.sizes,
+        repeat_size = excluded.repeat_size,
+        cst_repeats = excluded.cst_repeats,
+        cst_separations = excluded.cst_separations,
+        append = excluded.append,
+        abego = excluded.abego,
+        path = excluded.path,
+        input_hash = excluded.input_hash,
+        status = excluded.status,
+        returncode = NULL,
+        elapsed = NULL,
+        error = NULL,
+        n_scores = NULL,
+        best_score = NULL,
+        updated = excluded.updated
+    """
+
+
+def catalog_location(location):
+    """
+    Absolute form of a design dir or "container:name" location, the key
+    the runner and harvester find a design's row by
+    """
+    if is_container_location(location):
+        container, _, name = location.rpartition(":")
+        return f"{os.path.abspath(container)}:{name}"
+    return os.path.abspath(location)
+
+
+def find_catalog(run_dir):
+    """
+    Path of the catalog of run_dir, None if it doesn't have one
+    """
+    path = os.path.join(run_dir, CATALOG_NAME)
+    return path if os.path.exists(path) else None
+
+
+def parse_range(text):
+    """
+    (low, high) from "40-50", "40", "40-" or "-50", None for an open end
+    """
+    low, sep, high = text.partition("-")
+    try:
+        low = int(low) if low else None
+        high = int(high) if high else None if sep else low
+    except ValueError:
+        raise ValueError(f"not a range: {text!r}")
+    return low, high
+
+
+class DesignCatalog(object):
+    """
+    sqlite catalog of designs, CATALOG_NAME in a run dir
+
+    Safe to share between threads; writers in other processes (shards of
+    the same run) wait for each other's transactions.
+    """
+
+    def __init__(self, path, mode="a", timeout=60.0):
+        self.path = path
+        if mode == "r" and not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, timeout=timeout, check_same_thread=False
+        )
+        self._db.row_factory = sqlite3.Row
+        if mode != "r":
+            self._db.executescript(SCHEMA)
+            self._db.execute("PRAGMA synchronous=NORMAL")
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM designs").fetchone()[0]
+
+    def add_designs(
+        self,
+        designs,
+        fragment="",
+        cst_repeats=2,
+        cst_separations=(1,),
+        append=False,
+        abego=False,
+    ):
+        """
+        Records built designs as [(ss_elements, location, input_hash), ...]
+        in one transaction
+
+        ss_elements are (dssp_type,size,lattice_space,cst_tolerance)
+        tuples. A design already in the catalog (same name and fragment) is
+        replaced and its run status and scores are reset.
+        """
+        now = time.time()
+        separations = ",".join(str(s) for s in cst_separations)
+        rows = []
+        elements = {}
+        for ss_elements, location, input_hash in designs:
+            name = get_design_name(ss_elements)
+            elements[name] = ss_elements
+            types = "".join(t for t, _, _, _ in ss_elements)
+            rows.append(
+                (
+                    name,
+                    fragment,
+                    len(ss_elements),
+                    types,
+                    "".join(sorted(set(types))),
+                    ",".join(str(size) for _, size, _, _ in ss_elements),
+                    sum(size for _, size, _, _ in ss_elements),
+                    cst_repeats,
+                    separations,
+                    int(append),
+                    int(abego),
+                    catalog_location(location),
+                    input_hash,
+                    BUILT_STATUS,
+                    now,
+                )
+            )
+        if not rows:
+            return
+        with self._lock, self._db:
+            self._db.executemany(UPSERT, rows)
+            self._db.executemany(
+                "INSERT OR IGNORE INTO type_sets VALUES (?)",
+                [(type_set,) for type_set in {row[4] for row in rows}],
+            )
+            ids = {}
+            names = list(elements)
+            # batches bounded by sqlite's limit on host parameters
+            for i in range(0, len(names), 500):
+                batch = names[i : i + 500]
+                marks = ",".join("?" * len(batch))
+                batch_ids = {
+                    name: design_id
+                    for name, design_id in self._db.execute(
+                        f"SELECT name, id FROM designs WHERE fragment = ? "
+                        f"AND name IN ({marks})",
+                        [fragment] + batch,
+                    )
+                }
+                self._db.execute(
+                    f"DELETE FROM elements WHERE design_id IN "
+                    f"({','.join('?' * len(batch_ids))})",
+                    list(batch_ids.values()),
+                )
+                ids.update(batch_ids)
+            self._db.executemany(
+                "INSERT INTO elements VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (ids[name], position, *element)
+                    for name, ss_elements in elements.items()
+                    for position, element in enumerate(ss_elements)
+                ],
+            )
+
+    def set_run_status(self, record):
+        """
+        Stores a runner status record ({"location", "status", "returncode",
+        "elapsed", "error"}) on the design at its location
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE designs SET status = ?, returncode = ?, elapsed = ?, "
+                "error = ?, updated = ? WHERE path = ?",
+                (
+                    record["status"],
+                    record.get("returncode"),
+                    record.get("elapsed"),
+                    record.get("error"),
+                    time.time(),
+                    catalog_location(record["location"]),
+                ),
+            )
+
+    def set_scores(self, scores):
+        """
+        Stores [(location, n_scores, best_score), ...] from a harvest
+        """
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE designs SET n_scores = ?, best_score = ?, "
+                "updated = ? WHERE path = ?",
+                [
+                    (n_scores, best_score, now, catalog_location(location))
+                    for location, n_scores, best_score in scores
+                ],
+            )
+
+    def _where(self, repeat_size, has_types, status, fragment, where):
+        clauses = []
+        params = []
+        if repeat_size is not None:
+            low, high = repeat_size
+            if low is not None:
+                clauses.append("repeat_size >= ?")
+                params.append(low)
+            if high is not None:
+                clauses.append("repeat_size <= ?")
+                params.append(high)
+        if has_types:
+            # the few distinct type sets holding every type, so the
+            # (type_set, repeat_size) index answers the query
+            clauses.append(
+                "type_set IN (SELECT type_set FROM type_sets WHERE "
+                + " AND ".join("instr(type_set, ?)" for _ in has_types)
+                + ")"
+            )
+            params += list(has_types)
+        if status:
+            clauses.append(f"status IN ({','.join('?' * len(status))})")
+            params += list(status)
+        if fragment is not None:
+            clauses.append("fragment = ?")
+            params.append(fragment)
+        if where:
+            clauses.append(f"({where})")
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def query(
+        self,
+        repeat_size=None,
+        has_types=(),
+        status=(),
+        fragment=None,
+        where="",
+        columns=DEFAULT_COLUMNS,
+        limit=None,
+    ):
+        """
+        Rows (dicts of columns) of the designs matching every filter
+
+        repeat_size is a (low, high) range with None for an open end,
+        has_types element types every design must contain, status the
+        accepted statuses and where an extra SQL condition on the designs
+        table
+        """
+        clause, params = self._where(
+            repeat_size, has_types, status, fragment, where
+        )
+        sql = f"SELECT {', '.join(columns)} FROM designs{clause} ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [dict(row) for row in self._db.execute(sql, params)]
+
+    def count(
+        self,
+        repeat_size=None,
+        has_types=(),
+        status=(),
+        fragment=None,
+        where="",
+    ):
+        clause, params = self._where(
+            repeat_size, has_types, status, fragment, where
+        )
+        return self._db.execute(
+            f"SELECT COUNT(*) FROM designs{clause}", params
+        ).fetchone()[0]
+
+    def design(self, name, fragment=""):
+        """
+        The row of design name with its elements as
+        [(dssp_type,size,lattice_space,cst_tolerance), ...], or None
+        """
+        row = self._db.execute(
+            "SELECT * FROM designs WHERE name = ? AND fragment = ?",
+            (name, fragment),
+        ).fetchone()
+        if row is None:
+            return None
+        design = dict(row)
+        design["elements"] = [
+            tuple(element)
+            for element in self._db.execute(
+                "SELECT type, size, lattice_space, cst_tolerance "
+                "FROM elements WHERE design_id = ? ORDER BY position",
+                (row["id"],),
+            )
+        ]
+        return design
+
+    def designs_at(self, locations):
+        """
+        {location: row} of the designs at locations, each row with its
+        elements as in design; locations not in the catalog are left out
+        """
+        by_path = {catalog_location(loc): loc for loc in locations}
+        paths = list(by_path)
+        designs = {}
+        ids = {}
+        # batches bounded by sqlite's limit on host parameters
+        for i in range(0, len(paths), 500):
+            batch = paths[i : i + 500]
+            for row in self._db.execute(
+                f"SELECT * FROM designs WHERE path IN "
+                f"({','.join('?' * len(batch))})",
+                batch,
+            ):
+                design = dict(row)
+                design["elements"] = []
+                designs[by_path[row["path"]]] = design
+                ids[row["id"]] = design
+        id_list = list(ids)
+        for i in range(0, len(id_list), 500):
+            batch = id_list[i : i + 500]
+            for design_id, *element in self._db.execute(
+                "SELECT design_id, type, size, lattice_space, cst_tolerance "
+                f"FROM elements WHERE design_id IN "
+                f"({','.join('?' * len(batch))}) "
+                "ORDER BY design_id, position",
+                batch,
+            ):
+                ids[design_id]["elements"].append(tuple(element))
+        return designs
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@click.command()
+@click.argument("run_dir", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "--repeat-size",
+    "repeat_size",
+    default="",
+    help="Repeat size or range, e.g. 40-50, 40- or -50",
+)
+@click.option(
+    "--has",
+    "has_types",
+    multiple=True,
+    help="Element type the designs must contain, e.g. E (can be repeated)",
+)
+@click.option(
+    "--status",
+    "status",
+    multiple=True,
+    help=f"Accepted status: {BUILT_STATUS}, ok, failed, timeout or "
+    "cancelled (can be repeated)",
+)
+@click.option("--fragment", "fragment", default=None)
+@click.option(
+    "--where",
+    "where",
+    default="",
+    help="Extra SQL condition on the designs table, e.g. 'best_score < -100'",
+)
+@click.option(
+    "--columns",
+    "columns",
+    default=",".join(DEFAULT_COLUMNS),
+    show_default=True,
+)
+@click.option("--limit", "limit", type=int, default=None)
+@click.option(
+    "--count", "count", is_flag=True, help="Only print the number of designs"
+)
+def main(
+    run_dir,
+    repeat_size="",
+    has_types=(),
+    status=(),
+    fragment=None,
+    where="",
+    columns=",".join(DEFAULT_COLUMNS),
+    limit=None,
+    count=False,
+):
+    """
+    Lists the designs of RUN_DIR matching the filters, tab separated
+    """
+    path = find_catalog(run_dir)
+    if path is None:
+        raise click.ClickException(f"no {CATALOG_NAME} in {run_dir}")
+    try:
+        repeat_size = parse_range(repeat_size) if repeat_size else None
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--repeat-size")
+    columns = [column.strip() for column in columns.split(",")]
+    filters = {
+        "repeat_size": repeat_size,
+        "has_types": has_types,
+        "status": status,
+        "fragment": fragment,
+        "where": where,
+    }
+    with DesignCatalog(path, mode="r") as catalog:
+        try:
+            if count:
+                click.echo(catalog.count(**filters))
+                return
+            rows = catalog.query(columns=columns, limit=limit, **filters)
+        except sqlite3.Error as e:
+            raise click.ClickException(f"bad query: {e}")
+    click.echo("\t".join(columns))
+    for row in rows:
+        click.echo(
+            "\t".join("" if v is None else str(v) for v in row.values())
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+bp_tools command group for the tools that work on an existing run
+"""
+
+import click
+
+from bp_tools.catalog import main as catalog_main
+from bp_tools.harvest import main as harvest_main
+from bp_tools.pose_service import main as pose_service_main
+from bp_tools.runner import main as run_main
+
+
+@click.group()
+def main():
+    """
+    Tools for runs built with build_bp_run
+    """
+
+
+main.add_command(run_main, "run")
+main.add_command(harvest_main, "harvest")
+main.add_command(pose_service_main, "pose-service")
+main.add_command(catalog_main, "catalog")
+
+
+if __name__ == "__main__":
+    main()
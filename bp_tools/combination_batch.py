@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Columnar storage for large sets of combinations
+
+A CombinationBatch keeps n combinations of k elements as an (n, k) array of
+choice digits, one byte per element for positions with up to 256 choices,
+plus one small table per position holding that position's choices once
+(type, size, repeat_dist and repeat_dist_cst). Slices and filters only
+touch the digits, and batch-wide operations like the total repeat length
+are vectorized gathers from the tables. SecondaryStructElement objects are
+only built on request.
+"""
+
+import numpy as np
+
+from bp_tools.bp_tools import SecondaryStructElement
+
+# one choice of a position's table
+ELEMENT_DTYPE = np.dtype(
+    [
+        ("dssp_type", "S1"),
+        ("size", np.uint16),
+        ("repeat_dist", np.float64),
+        ("repeat_dist_cst", np.float64),
+    ]
+)
+
+
+def digit_dtype(radices):
+    """
+    Smallest unsigned dtype holding a choice digit of every position
+    """
+    largest = max(radices, default=1)
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if largest <= np.iinfo(dtype).max + 1:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def _element_record(element):
+    if hasattr(element, "to_tuple"):
+        element = element.to_tuple()
+    dssp_type, size, repeat_dist, repeat_dist_cst = element
+    if len(dssp_type) != 1:
+        raise ValueError(f"dssp_type must be one letter, got {dssp_type!r}")
+    return (dssp_type.encode(), size, repeat_dist, repeat_dist_cst)
+
+
+def element_table(elements):
+    """
+    ELEMENT_DTYPE records of a list of elements, e.g. the choices of one
+    sampler, to gather combinations from by digit
+    """
+    return np.array(
+        [_element_record(element) for element in elements],
+        dtype=ELEMENT_DTYPE,
+    )
+
+
+class CombinationBatch(object):
+    """
+    n combinations of k elements: tables[j] is the ELEMENT_DTYPE table of
+    the choices of position j, digits the (n, k) choice indices into them
+
+    batch[i] is the (k,) ELEMENT_DTYPE records of combination i, batch[a:b]
+    a CombinationBatch sharing the tables and viewing the same digits. Use
+    combination(i) for the tuple of SecondaryStructElement.
+    """
+
+    def __init__(self, tables, digits):
+        digits = np.asarray(digits)
+        tables = [np.asarray(table) for table in tables]
+        if digits.ndim != 2 or digits.shape[1] != len(tables):
+            raise ValueError("digits must be a 2d array, one column per table")
+        if any(table.dtype != ELEMENT_DTYPE for table in tables):
+            raise ValueError("tables must be arrays of ELEMENT_DTYPE")
+        self.tables = tables
+        self.digits = digits
+
+    @classmethod
+    def from_combinations(cls, combinations):
+        """
+        Builds a batch from an iterable of combinations of
+        SecondaryStructElement or (dssp_type,size,lattice_space,cst_tolerance)
+        tuples, all of the same number of elements
+        """
+        choices = None
+        rows = []
+        for combination in combinations:
+            records = [_element_record(element) for element in combination]
+            if choices is None:
+                choices = [{} for _ in records]
+            if len(records) != len(choices):
+                raise ValueError("combinations differ in number of elements")
+            rows.append(
+                [
+                    position.setdefault(record, len(position))
+                    for position, record in zip(choices, records)
+                ]
+            )
+        if choices is None:
+            return cls([], np.zeros((0, 0), dtype=np.uint8))
+        tables = [
+            np.array(list(position), dtype=ELEMENT_DTYPE)
+            for position in choices
+        ]
+        dtype = digit_dtype([len(table) for table in tables])
+        return cls(tables, np.array(rows, dtype=dtype))
+
+    @classmethod
+    def from_space(cls, design_space, start=0, stop=None):
+        """
+        Combinations start <= k < stop of a DesignSpace, in product order
+
+        Decodes the whole range at once with vectorized integer division of
+        the indices, so no per-combination Python runs
+        """
+        stop = len(design_space) if stop is None else stop
+        start = max(start, 0)
+        stop = max(min(stop, len(design_space)), start)
+        radices = design_space.radices
+        digits = np.empty(
+            (stop - start, len(radices)), dtype=digit_dtype(radices)
+        )
+        remainder = np.arange(start, stop, dtype=np.int64)
+        for j in range(len(radices) - 1, -1, -1):
+            remainder, digits[:, j] = np.divmod(remainder, radices[j])
+        tables = [
+            element_table(elements) for elements in design_space.element_lists
+        ]
+        return cls(tables, digits)
+
+    def __len__(self):
+        return self.digits.shape[0]
+
+    @property
+    def n_elements(self):
+        return self.digits.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.digits.nbytes + sum(table.nbytes for table in self.tables)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return CombinationBatch(self.tables, self.digits[k])
+        return np.array(
+            [
+                table[digit]
+                for table, digit in zip(self.tables, self.digits[k])
+            ],
+            dtype=ELEMENT_DTYPE,
+        )
+
+    def __repr__(self):
+        return (
+            f"CombinationBatch(n_combinations={len(self)}, "
+            f"n_elements={self.n_elements})"
+        )
+
+    @property
+    def sizes(self):
+        """
+        (n, k) array of the element sizes
+        """
+        sizes = np.empty(self.digits.shape, dtype=np.uint16)
+        for j, table in enumerate(self.tables):
+            sizes[:, j] = table["size"][self.digits[:, j]]
+        return sizes
+
+    def total_lengths(self):
+        """
+        Total repeat length of every combination
+        """
+        return self.sizes.sum(axis=1, dtype=np.int64)
+
+    def filter(self, mask):
+        """
+        New batch with the combinations where mask (length n) is true
+        """
+        return CombinationBatch(
+            self.tables, self.digits[np.asarray(mask, dtype=bool)]
+        )
+
+    def select_lengths(self, min_length=None, max_length=None):
+        """
+        New batch with the combinations whose total repeat length is within
+        [min_length, max_length]
+        """
+        lengths = self.total_lengths()
+        mask = np.ones(len(self), dtype=bool)
+        if min_length is not None:
+            mask &= lengths >= min_length
+        if max_length is not None:
+            mask &= lengths <= max_length
+        return self.filter(mask)
+
+    def to_tuples(self, k):
+        """
+        Combination k as (dssp_type,size,lattice_space,cst_tolerance) tuples,
+        the form prepare_design_dir takes
+        """
+        return [
+            (dssp_type.decode(), int(size), float(dist), float(cst))
+            for dssp_type, size, dist, cst in self[k].tolist()
+        ]
+
+    def combination(self, k):
+        """
+        Combination k as a tuple of SecondaryStructElement
+        """
+        return tuple(
+            SecondaryStructElement(*element) for element in self.to_tuples(k)
+        )
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self.combination(k)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+import json
+
+import click
+
+from bp_tools.frag_io import (
+    read_frag_params_jsonl,
+    write_frag_params_json,
+    write_frag_params_jsonl,
+)
+
+FORMATS = ("json", "jsonl", "bin")
+
+
+def guess_format(path):
+    for fmt in FORMATS:
+        if path.endswith(f".{fmt}"):
+            return fmt
+    raise click.BadParameter(
+        f"can't tell the format of {path}, use --from/--to"
+    )
+
+
+def read_combinations(path, fmt):
+    """
+    Returns a function that (re)opens path and returns an iterable of
+    combinations, so the input can be read twice without holding it
+    """
+    if fmt == "bin":
+        from bp_tools.frag_binary import FragParamsBinary
+
+        reader = FragParamsBinary(path)
+        return lambda: reader
+    if fmt == "jsonl":
+        return lambda: read_frag_params_jsonl(path)
+    from bp_tools.bp_tools import SecondaryStructElement
+
+    with open(path, "r") as f:
+        combinations = [
+            tuple(SecondaryStructElement.from_dict(d) for d in dicts)
+            for dicts in json.load(f)
+        ]
+    return lambda: combinations
+
+
+@click.command()
+@click.argument("source")
+@click.argument("destination")
+@click.option(
+    "--from", "source_format", type=click.Choice(FORMATS), default=None
+)
+@click.option(
+    "--to", "destination_format", type=click.Choice(FORMATS), default=None
+)
+def main(source, destination, source_format=None, destination_format=None):
+    """
+    Converts a frag_params file between the json, jsonl and binary layouts
+
+    Formats are taken from the file extensions unless given. Converting to
+    binary infers the samplers from the combinations, so every position must
+    have the same element type and distances throughout.
+    """
+    source_format = source_format or guess_format(source)
+    destination_format = destination_format or guess_format(destination)
+    combinations = read_combinations(source, source_format)
+    if destination_format == "bin":
+        from bp_tools.frag_binary import (
+            FragParamsBinary,
+            samplers_from_combinations,
+            write_frag_params_binary,
+        )
+
+        if source_format == "bin":
+            samplers = FragParamsBinary(source).samplers
+        else:
+            try:
+                samplers = samplers_from_combinations(combinations())
+            except ValueError as e:
+                raise click.ClickException(str(e))
+        count = write_frag_params_binary(combinations(), destination, samplers)
+    elif destination_format == "jsonl":
+        count = write_frag_params_jsonl(combinations(), destination)
+    else:
+        count = write_frag_params_json(combinations(), destination)
+    click.echo(f"wrote {count} combinations to {destination}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Pruning rules applied while a DesignSpace is enumerated
+
+iter_filtered walks the space depth first, one sampler per level, and asks
+every rule after each element is fixed whether any completion of the prefix
+could still pass. A rule that says no cuts the whole subtree, so rejected
+combinations are never built. The rules:
+
+    LengthWindow      total repeat length within [min_length, max_length]
+    ElementRelation   size of element i compared to size of element j
+    TypeRatio         summed size of some dssp types over that of others
+    Predicate         any user callable on the full (or partial) combination
+    CyclicCanonical   one representative per rotation (and reversal) class
+
+Every rejected combination is credited to the first rule that rejected it
+(or the subtree containing it) in FilterStats.
+"""
+
+import operator
+
+
+def _bound_str(value):
+    return "" if value is None else value
+
+
+RELATION_OPS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
+class DesignRule(object):
+    """
+    Base class for pruning rules
+
+    bind(space) is called once before enumeration. prune(prefix, length) is
+    called with every prefix (a tuple of SecondaryStructElement) and its
+    total size and must only return True if no completion of the prefix can
+    be accepted. accepts(combination) is the final check of a full
+    combination.
+    """
+
+    name = "rule"
+
+    def bind(self, space):
+        pass
+
+    def prune(self, prefix, length):
+        return False
+
+    def accepts(self, combination):
+        return True
+
+    def __repr__(self):
+        return self.name
+
+
+def _size_bounds(space, dssp_types=None):
+    """
+    Per sampler (min, max) size of the elements, counting only elements of
+    dssp_types when given, and the suffix sums of both from each position
+
+    A sampler without choices (min_size > max_size) makes the space empty;
+    it is bounded by (0, 0)
+    """
+    bounds = []
+    for elements in space.element_lists:
+        sizes = [
+            element.size
+            for element in elements
+            if dssp_types is None or element.dssp_type in dssp_types
+        ]
+        if len(sizes) < len(elements) or not sizes:
+            # some choices contribute nothing
+            sizes.append(0)
+        bounds.append((min(sizes), max(sizes)))
+    suffix_min = [0] * (len(bounds) + 1)
+    suffix_max = [0] * (len(bounds) + 1)
+    for j in range(len(bounds) - 1, -1, -1):
+        suffix_min[j] = suffix_min[j + 1] + bounds[j][0]
+        suffix_max[j] = suffix_max[j + 1] + bounds[j][1]
+    return suffix_min, suffix_max
+
+
+class LengthWindow(DesignRule):
+    """
+    Total repeat length (sum of element sizes) within [min_length,
+    max_length], either bound may be None
+
+    Prunes with running-sum bounds: a prefix is cut once even the shortest
+    (longest) completion is too long (short)
+    """
+
+    def __init__(self, min_length=None, max_length=None):
+        self.min_length = min_length
+        self.max_length = max_length
+        self.name = (
+            f"length in [{_bound_str(min_length)}, {_bound_str(max_length)}]"
+        )
+
+    def bind(self, space):
+        self._suffix_min, self._suffix_max = _size_bounds(space)
+
+    def prune(self, prefix, length):
+        depth = len(prefix)
+        if (
+            self.max_length is not None
+            and length + self._suffix_min[depth] > self.max_length
+        ):
+            return True
+        return (
+            self.min_length is not None
+            and length + self._suffix_max[depth] < self.min_length
+        )
+
+    def accepts(self, combination):
+        length = sum(element.size for element in combination)
+        if self.max_length is not None and length > self.max_length:
+            return False
+        return self.min_length is None or length >= self.min_length
+
+
+class ElementRelation(DesignRule):
+    """
+    size of element i <op> size of element j + offset
+
+    i and j are 0 based sampler positions, op one of RELATION_OPS. E.g.
+    ElementRelation(2, 0, ">=") keeps a sheet at position 2 at least as long
+    as its pairing partner at position 0. Checked as soon as both elements
+    are fixed.
+    """
+
+    def __init__(self, i, j, op="<=", offset=0):
+        if op not in RELATION_OPS:
+            raise ValueError(
+                f"unknown relation {op}, use one of {RELATION_OPS}"
+            )
+        self.i = i
+        self.j = j
+        self.op = op
+        self.offset = offset
+        self._compare = RELATION_OPS[op]
+        offset_str = f"{offset:+d}" if offset else ""
+        self.name = f"{i}{op}{j}{offset_str}"
+
+    def bind(self, space):
+        n = len(space.element_lists)
+        if not (0 <= self.i < n and 0 <= self.j < n):
+            raise ValueError(
+                f"relation {self.name} refers to an element outside the "
+                f"{n} samplers"
+            )
+        self._depth = max(self.i, self.j) + 1
+
+    def _holds(self, elements):
+        return self._compare(
+            elements[self.i].size, elements[self.j].size + self.offset
+        )
+
+    def prune(self, prefix, length):
+        return len(prefix) == self._depth and not self._holds(prefix)
+
+    def accepts(self, combination):
+        return self._holds(combination)
+
+
+def parse_relation(spec):
+    """
+    Parses "i<op>j" or "i<op>j+offset" (e.g. "2>=0", "1<=3-2") into an
+    ElementRelation
+    """
+    for op in sorted(RELATION_OPS, key=len, reverse=True):
+        if op in spec:
+            left, right = spec.split(op, 1)
+            break
+    else:
+        raise ValueError(f"no comparison in relation: {spec}")
+    offset = 0
+    for sign in "+-":
+        if sign in right:
+            right, offset_str = right.split(sign, 1)
+            offset = int(offset_str) * (1 if sign == "+" else -1)
+            break
+    try:
+        return ElementRelation(int(left), int(right), op, offset)
+    except ValueError:
+        raise ValueError(f"relation must look like i<=j+offset, got: {spec}")
+
+
+class TypeRatio(DesignRule):
+    """
+    Ratio of the summed sizes of numerator dssp types to denominator types
+    within [min_ratio, max_ratio], e.g. TypeRatio("L", "H", max_ratio=0.3)
+    for at most 0.3 loop residues per helix residue
+
+    Prunes with the same running-sum bounds as LengthWindow, kept per type
+    """
+
+    def __init__(self, numerator, denominator, min_ratio=None, max_ratio=None):
+        self.numerator = set(numerator)
+        self.denominator = set(denominator)
+        self.min_ratio = min_ratio
+        self.max_ratio = max_ratio
+        self.name = (
+            f"{''.join(sorted(self.numerator))}/"
+            f"{''.join(sorted(self.denominator))} ratio in "
+            f"[{_bound_str(min_ratio)}, {_bound_str(max_ratio)}]"
+        )
+
+    def bind(self, space):
+        self._num_bounds = _size_bounds(space, self.numerator)
+        self._den_bounds = _size_bounds(space, self.denominator)
+
+    def _sum(self, elements, dssp_types):
+        return sum(e.size for e in elements if e.dssp_type in dssp_types)
+
+    def _in_range(self, num_low, num_high, den_low, den_high):
+        # can any num/den with num, den in these ranges be in the window?
+        if self.max_ratio is not None and num_low > self.max_ratio * den_high:
+            return False
+        return self.min_ratio is None or num_high >= self.min_ratio * den_low
+
+    def prune(self, prefix, length):
+        depth = len(prefix)
+        num = self._sum(prefix, self.numerator)
+        den = self._sum(prefix, self.denominator)
+        num_min, num_max = self._num_bounds
+        den_min, den_max = self._den_bounds
+        return not self._in_range(
+            num + num_min[depth],
+            num + num_max[depth],
+            den + den_min[depth],
+            den + den_max[depth],
+        )
+
+    def accepts(self, combination):
+        num = self._sum(combination, self.numerator)
+        den = self._sum(combination, self.denominator)
+        return self._in_range(num, num, den, den)
+
+
+class Predicate(DesignRule):
+    """
+    A user callable accepts(combination) -> bool on the full combination
+
+    If prefix_func is given it is called as prefix_func(prefix) on every
+    partial combination and must only return False when no completion of
+    prefix can be accepted
+    """
+
+    def __init__(self, func, name=None, prefix_func=None):
+        self.func = func
+        self.prefix_func = prefix_func
+        self.name = name or getattr(func, "__name__", "predicate")
+
+    def prune(self, prefix, length):
+        return self.prefix_func is not None and not self.prefix_func(prefix)
+
+    def accepts(self, combination):
+        return bool(self.func(combination))
+
+
+CANONICAL_MODES = ("rotation", "rotation+reversal")
+
+
+class CyclicCanonical(DesignRule):
+    """
+    Keeps one combination per class of cyclic rotations (optionally also
+    reversals) of the repeat unit
+
+    (H20, L3, H18, L4) and (H18, L4, H20, L3) are the same repeat lattice
+    in a different register. A combination is accepted iff no rotation of
+    it that is also in the space (every element among its position's
+    sampler choices) comes earlier in product order, so each class keeps
+    its first member and the check needs no memory of what was emitted.
+    Works unchanged on shards, index ranges and samples.
+
+    Rules that are not rotation invariant (ElementRelation, position
+    specific Predicates) are applied independently, so they can reject the
+    representative of a class whose other members they would accept.
+    """
+
+    def __init__(self, mode="rotation"):
+        if mode not in CANONICAL_MODES:
+            raise ValueError(
+                f"unknown canonical mode {mode}, use one of {CANONICAL_MODES}"
+            )
+        self.reversal = mode == "rotation+reversal"
+        self.name = f"{mode} duplicates"
+
+    def bind(self, space):
+        # per position: element -> its index in that sampler
+        self._digits = [
+            {element.to_tuple(): k for k, element in enumerate(elements)}
+            for elements in space.element_lists
+        ]
+
+    def _digits_of(self, keys):
+        """
+        Product order digits of the elements keys, None if some element
+        isn't a choice of its position
+        """
+        digits = []
+        for position, key in zip(self._digits, keys):
+            k = position.get(key)
+            if k is None:
+                return None
+            digits.append(k)
+        return digits
+
+    def accepts(self, combination):
+        keys = [element.to_tuple() for element in combination]
+        own = self._digits_of(keys)
+        if own is None:
+            return True
+        orders = [keys, keys[::-1]] if self.reversal else [keys]
+        for order in orders:
+            for r in range(len(order)):
+                digits = self._digits_of(order[r:] + order[:r])
+                if digits is not None and digits < own:
+                    return False
+        return True
+
+
+class FilterStats(object):
+    """
+    Counts of accepted combinations and of combinations rejected per rule
+    """
+
+    def __init__(self, rules=()):
+        self.accepted = 0
+        self.rejected = {rule.name: 0 for rule in rules}
+
+    @property
+    def total_rejected(self):
+        return sum(self.rejected.values())
+
+    def reject(self, rule, count=1):
+        self.rejected[rule.name] = self.rejected.get(rule.name, 0) + count
+
+    def report(self):
+        """
+        One line per rule, for printing
+        """
+        return [
+            f"{name}: filtered {count} combinations"
+            for name, count in self.rejected.items()
+        ] + [f"{self.accepted} combinations accepted"]
+
+    def __repr__(self):
+        return (
+            f"FilterStats(accepted={self.accepted}, "
+            f"rejected={self.rejected})"
+        )
+
+
+def accepts_all(combination, rules, stats=None):
+    """
+    Checks a full combination against every (bound) rule
+    """
+    for rule in rules:
+        if not rule.accepts(combination):
+            if stats is not None:
+                stats.reject(rule)
+            return False
+    if stats is not None:
+        stats.accepted += 1
+    return True
+
+
+def iter_filtered(space, rules, start=0, stop=None, gray=False, stats=None):
+    """
+    Generator over the combinations start <= k < stop of space that pass
+    every rule, in the same order as space.iter_range(start, stop, gray)
+
+    Subtrees are cut as soon as a rule prunes their prefix, and subtrees
+    entirely outside [start, stop) are never entered. Pass a FilterStats to
+    collect per rule counts of the rejected combinations.
+    """
+    rules = list(rules)
+    for rule in rules:
+        rule.bind(space)
+    stop = len(space) if stop is None else min(stop, len(space))
+    start = max(start, 0)
+    if start >= stop:
+        return
+    element_lists = space.element_lists
+    radices = space.radices
+    # number of combinations below a prefix of each depth
+    subtree = [1] * (len(radices) + 1)
+    for j in range(len(radices) - 1, -1, -1):
+        subtree[j] = subtree[j + 1] * radices[j]
+    n_levels = len(radices)
+
+    def walk(prefix, length, rank):
+        depth = len(prefix)
+        if depth == n_levels:
+            if accepts_all(prefix, rules, stats):
+                yield prefix
+            return
+        elements = element_lists[depth]
+        radix = radices[depth]
+        size = subtree[depth + 1]
+        # reflected Gray order sweeps a digit down below odd prefixes
+        reverse = gray and rank % 2
+        for position in range(radix):
+            child_rank = rank * radix + position
+            low = child_rank * size
+            if low + size <= start:
+                continue
+            if low >= stop:
+                break
+            element = elements[radix - 1 - position if reverse else position]
+            child = prefix + (element,)
+            child_length = length + element.size
+            for rule in rules:
+                if rule.prune(child, child_length):
+                    if stats is not None:
+                        # only the part of the subtree inside the range
+                        stats.reject(
+                            rule, min(stop, low + size) - max(start, low)
+                        )
+                    break
+            else:
+                yield from walk(child, child_length, child_rank)
+
+    yield from walk((), 0, 0)
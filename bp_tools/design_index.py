@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Name -> path index of the design dirs of a run
+
+With the hashed layout the design dirs are spread over a two-level prefix
+tree, so listing a run means walking up to 65536 dirs. The index is an
+append-only tab separated file at the top of the run dir with one
+"name<TAB>path relative to the run dir" line per design, written as designs
+complete. Lookups of a single name don't even need it: find_design derives
+the path from the name and only falls back to the index.
+"""
+
+import os
+import threading
+
+from bp_tools.bp_tools import DESIGN_LAYOUTS, design_path
+
+INDEX_NAME = "design_index.tsv"
+
+
+class DesignIndex(object):
+    """
+    Append-only name -> relative path index, INDEX_NAME in dirname
+
+    Later lines for a name supersede earlier ones; a truncated last line is
+    ignored
+    """
+
+    def __init__(self, dirname, index_name=INDEX_NAME):
+        self.dirname = dirname
+        self.path = os.path.join(dirname, index_name)
+        self._paths = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._paths is None:
+            self._paths = {}
+            if os.path.exists(self.path):
+                with open(self.path, "r") as f:
+                    for line in f:
+                        name, tab, path = line.rstrip("\n").partition("\t")
+                        if tab and line.endswith("\n"):
+                            self._paths[name] = path
+        return self._paths
+
+    def __len__(self):
+        return len(self._load())
+
+    def __contains__(self, name):
+        return name in self._load()
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def add(self, name, path):
+        """
+        Records that design name lives at path (absolute or relative to the
+        run dir)
+        """
+        relative = os.path.relpath(path, self.dirname)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a")
+            self._file.write(f"{name}\t{relative}\n")
+            self._file.flush()
+            if self._paths is not None:
+                self._paths[name] = relative
+
+    def lookup(self, name):
+        """
+        Path of design name, or None if it is not indexed
+        """
+        relative = self._load().get(name)
+        if relative is None:
+            return None
+        return os.path.join(self.dirname, relative)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def find_design(dirname, name):
+    """
+    Path of the design dir for name in a run dir of any layout, or None
+
+    Tries the path of every layout first (one stat each) and only reads the
+    index if none exists
+    """
+    for layout in DESIGN_LAYOUTS:
+        path = design_path(dirname, name, layout)
+        if os.path.isdir(path):
+            return path
+    path = DesignIndex(dirname).lookup(name)
+    if path is not None and os.path.isdir(path):
+        return path
+    return None
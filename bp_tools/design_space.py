@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Random-access view over the combinations of a list of samplers
+
+A DesignSpace behaves like the sequence produced by
+product(*(s.get_ss_elements_list() for s in samplers)) without ever building
+it: combination k is decoded from k as a mixed radix number whose digits are
+the size indices of each sampler (last sampler is the fastest digit, same as
+product()).
+"""
+
+
+class DesignSpace(object):
+    """
+    Indexable, shardable design space over SecondaryStructElementSampler lists
+
+    Supports len(), integer and slice indexing, iteration and shard(i, n).
+    Memory use is proportional to the number of samplers, not to the size of
+    the space.
+    """
+
+    def __init__(self, samplers):
+        self.samplers = list(samplers)
+        self._elements = [s.get_ss_elements_list() for s in self.samplers]
+        self._radices = [len(elements) for elements in self._elements]
+        # stride of digit j is the product of the radices after it
+        self._strides = [1] * len(self._radices)
+        for j in range(len(self._radices) - 2, -1, -1):
+            self._strides[j] = self._strides[j + 1] * self._radices[j + 1]
+        self._size = 1
+        for radix in self._radices:
+            self._size *= radix
+        if not self.samplers:
+            self._size = 0
+
+    @property
+    def radices(self):
+        return list(self._radices)
+
+    @property
+    def element_lists(self):
+        """
+        The SecondaryStructElement choices of every sampler, in order
+        """
+        return self._elements
+
+    def __len__(self):
+        return self._size
+
+    def __repr__(self):
+        return f"DesignSpace({self.samplers!r})"
+
+    def _check_index(self, k):
+        if k < 0:
+            k += self._size
+        if not 0 <= k < self._size:
+            raise IndexError(
+                f"combination index {k} out of range for space of {self._size}"
+            )
+        return k
+
+    def decode(self, k):
+        """
+        Returns the per-sampler size indices (digits) of combination k
+        """
+        k = self._check_index(k)
+        digits = []
+        for stride in self._strides:
+            digit, k = divmod(k, stride)
+            digits.append(digit)
+        return digits
+
+    def encode(self, digits):
+        """
+        Inverse of decode: the combination index for per-sampler digits
+        """
+        if len(digits) != len(self._radices):
+            raise ValueError(
+                f"expected {len(self._radices)} digits, got {len(digits)}"
+            )
+        k = 0
+        for digit, radix, stride in zip(digits, self._radices, self._strides):
+            if not 0 <= digit < radix:
+                raise ValueError(
+                    f"digit {digit} out of range for radix {radix}"
+                )
+            k += digit * stride
+        return k
+
+    def combination(self, digits):
+        """
+        Returns the tuple of SecondaryStructElement for the given digits
+        """
+        return tuple(
+            elements[digit] for elements, digit in zip(self._elements, digits)
+        )
+
+    def gray_digits(self, k):
+        """
+        Digits of combination k in reflected mixed-radix Gray code order
+
+        Consecutive k differ in exactly one digit, by one size step: each
+        digit sweeps up and then back down instead of wrapping around
+        """
+        digits = self.decode(k)
+        k = self._check_index(k)
+        for j, (radix, stride) in enumerate(zip(self._radices, self._strides)):
+            # number of completed sweeps of digit j = value of higher digits
+            if (k // (stride * radix)) % 2:
+                digits[j] = radix - 1 - digits[j]
+        return digits
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            start, stop, step = k.indices(self._size)
+            if step == 1:
+                return list(self.iter_range(start, stop))
+            return [self[i] for i in range(start, stop, step)]
+        return self.combination(self.decode(k))
+
+    def iter_range(self, start, stop, gray=False):
+        """
+        Generator over combinations start <= k < stop
+
+        Decodes start once and then steps the digits like an odometer, so the
+        cost is O(stop - start) regardless of where in the space start lies.
+        With gray set the combinations come in Gray code order (see
+        gray_digits), so neighbouring designs differ in a single element.
+        """
+        start = max(start, 0)
+        stop = min(stop, self._size)
+        if start >= stop:
+            return
+        if gray:
+            yield from self._iter_gray_range(start, stop)
+            return
+        digits = self.decode(start)
+        last = len(digits) - 1
+        for _ in range(stop - start):
+            yield self.combination(digits)
+            j = last
+            while j >= 0:
+                digits[j] += 1
+                if digits[j] < self._radices[j]:
+                    break
+                digits[j] = 0
+                j -= 1
+
+    def _iter_gray_range(self, start, stop):
+        digits = self.gray_digits(start)
+        # +1 while a digit sweeps up, -1 while it sweeps down
+        directions = [1] * len(digits)
+        for j, (radix, stride) in enumerate(zip(self._radices, self._strides)):
+            if (start // (stride * radix)) % 2:
+                directions[j] = -1
+        last = len(digits) - 1
+        for _ in range(stop - start):
+            yield self.combination(digits)
+            # step the lowest digit that can still move, reversing the
+            # direction of every digit below it that has reached its end
+            j = last
+            while j >= 0:
+                moved = digits[j] + directions[j]
+                if 0 <= moved < self._radices[j]:
+                    digits[j] = moved
+                    break
+                directions[j] = -directions[j]
+                j -= 1
+
+    def __iter__(self):
+        return self.iter_range(0, self._size)
+
+    def shard_bounds(self, i, n):
+        """
+        Returns (start, stop) of contiguous shard i (0 based) of n
+
+        Shard sizes differ by at most one combination
+        """
+        if n < 1 or not 0 <= i < n:
+            raise ValueError(f"invalid shard {i}/{n}")
+        return (i * self._size // n, (i + 1) * self._size // n)
+
+    def shard(self, i, n, gray=False):
+        """
+        Generator over the combinations in shard i (0 based) of n
+        """
+        return self.iter_range(*self.shard_bounds(i, n), gray=gray)
+
+
+def parse_shard(shard_str):
+    """
+    Parses an "i/N" shard spec into (i, N), with i 0 based
+    """
+    try:
+        i, n = (int(part) for part in shard_str.split("/"))
+    except ValueError:
+        raise ValueError(f"shard must look like i/N, got: {shard_str}")
+    if n < 1 or not 0 <= i < n:
+        raise ValueError(f"shard index must satisfy 0 <= i < N: {shard_str}")
+    return i, n
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Closed-form statistics of a design space, for dry runs
+
+Nothing here enumerates combinations. The number of combinations is the
+product of the sampler sizes, and the distribution of the total repeat
+length is the convolution of the per-sampler size histograms. Quantities
+that add up over elements (constraint lines, frag_params json) ride along
+in the same convolution as per-length sums. Quantities that only depend on
+the total length (blueprint and motif_flags size) are then read off the
+length histogram, so a length window can be applied exactly. The cost
+grows with the number of samplers and the length range, not with the size
+of the space.
+"""
+
+import json
+
+import numpy as np
+
+from bp_tools.atom_pair_csts import element_cst_size
+from bp_tools.bp_tools import BLUEPRINT_SS_TYPES, SHARED_FILES
+
+# per-design files prepare_design_dir writes besides the SHARED_FILES links
+DESIGN_FILES = ("design.blueprint", "lattice_csts.cst", "motif_flags")
+MOTIF_FLAGS_PREFIX = "-score:motif_residues "
+TAR_BLOCK = 512
+
+
+def _digits_upto(n):
+    """
+    Total number of decimal digits in 1..n
+    """
+    total = 0
+    width = 1
+    low = 1
+    while low <= n:
+        high = min(n, low * 10 - 1)
+        total += (high - low + 1) * width
+        width += 1
+        low *= 10
+    return total
+
+
+def motif_flags_bytes(design_length):
+    """
+    Size of the motif_flags file (see motif_flags_text)
+    """
+    numbers = _digits_upto(design_length * 2) - _digits_upto(design_length - 1)
+    return len(MOTIF_FLAGS_PREFIX) + numbers + design_length
+
+
+def blueprint_bytes(design_length, fragment_rows=None, abego=False):
+    """
+    Size of the blueprint render_blueprint writes for a repeat of
+    design_length residues, given the (optional) FragmentRows
+    """
+    if not design_length:
+        return 0
+    width = len(BLUEPRINT_SS_TYPES["h"][abego])
+    # "0 x HA\n" per residue, the first element's anchor row replaces one
+    size = (design_length - 1) * (5 + width)
+    first_anchor = (1, "A")
+    rows = fragment_rows
+    if rows is not None:
+        if rows.lead is not None:
+            size += len(rows.lead) + 1
+        if rows.first_anchor:
+            first_anchor = tuple(rows.first_anchor)
+        if rows.last_anchor:
+            size += len("%s %s " % tuple(rows.last_anchor)) + width + 1
+        if rows.trail is not None:
+            size += len(rows.trail) + 1
+    return size + len("%s %s " % first_anchor) + width + 1
+
+
+def element_cst_lines(element, cst_repeats=2, cst_separations=(1,)):
+    """
+    (lines, bytes) of the lattice constraints of one SecondaryStructElement
+
+    bytes assume residue numbers fit the %2d/%3d fields of the templates
+    """
+    return element_cst_size(
+        element.to_tuple(),
+        n_repeats=cst_repeats,
+        separations=cst_separations,
+    )
+
+
+def _element_json_bytes(element):
+    return len(json.dumps(element.to_dict()))
+
+
+class DesignStats(object):
+    """
+    Closed-form summary of a design space
+
+    lengths/length_counts is the histogram of total repeat length; the
+    totals are over every counted combination and exact, except cst_bytes
+    (see element_cst_lines) and the bytes of tar output, which assume half a
+    tar block of padding per member
+    """
+
+    def __init__(self, n_space, lengths, length_counts, totals, output):
+        self.n_space = n_space
+        self.lengths = lengths
+        self.length_counts = length_counts
+        self.totals = totals
+        self.output = output
+
+    @property
+    def n_combinations(self):
+        return int(sum(self.length_counts))
+
+    def mean_length(self):
+        n = self.n_combinations
+        if not n:
+            return 0.0
+        return float(
+            sum(
+                int(l) * int(c)
+                for l, c in zip(self.lengths, self.length_counts)
+            )
+            / n
+        )
+
+    def to_dict(self):
+        n = self.n_combinations
+        per_design = {
+            key: (value / n if n else 0.0)
+            for key, value in self.totals.items()
+        }
+        return {
+            "space_size": self.n_space,
+            "combinations": n,
+            "repeat_length": {
+                "min": int(self.lengths[0]) if n else None,
+                "max": int(self.lengths[-1]) if n else None,
+                "mean": self.mean_length(),
+                "histogram": {
+                    int(l): int(c)
+                    for l, c in zip(self.lengths, self.length_counts)
+                },
+            },
+            "totals": {key: int(v) for key, v in self.totals.items()},
+            "per_design_mean": per_design,
+            "output": {key: int(v) for key, v in self.output.items()},
+        }
+
+
+def _accumulate(samplers_elements, quantities):
+    """
+    Convolves the per-sampler size histograms, carrying the per-length sums
+    of every additive element quantity (a function element -> int)
+
+    Returns (counts, sums) indexed by total length
+    """
+    counts = np.array([1], dtype=object)
+    sums = [np.array([0], dtype=object) for _ in quantities]
+    for elements in samplers_elements:
+        max_size = max(element.size for element in elements)
+        hist = np.zeros(max_size + 1, dtype=object)
+        q_hists = [np.zeros(max_size + 1, dtype=object) for _ in quantities]
+        for element in elements:
+            hist[element.size] += 1
+            for q_hist, quantity in zip(q_hists, quantities):
+                q_hist[element.size] += quantity(element)
+        sums = [
+            np.convolve(q_sum, hist) + np.convolve(counts, q_hist)
+            for q_sum, q_hist in zip(sums, q_hists)
+        ]
+        counts = np.convolve(counts, hist)
+    return counts, sums
+
+
+def estimate_design_stats(
+    design_space,
+    fragment_rows=None,
+    abego=False,
+    cst_repeats=2,
+    cst_separations=(1,),
+    min_length=None,
+    max_length=None,
+    output_format="dir",
+    extra_files_dir=".",
+    jsonl=False,
+):
+    """
+    Closed-form DesignStats of design_space
+
+    min_length/max_length restrict every count to that total repeat length
+    window, like design_filters.LengthWindow. output_format is "dir", "tar"
+    or "sqlite" (see output_backends) and only changes the file/inode/byte
+    estimate of the design output.
+    """
+    element_lists = design_space.element_lists
+    if not len(design_space):
+        lengths = np.zeros(0, dtype=np.int64)
+        return DesignStats(0, lengths, [], {}, {})
+    quantities = {
+        "cst_lines": lambda e: element_cst_lines(
+            e, cst_repeats, cst_separations
+        )[0],
+        "cst_bytes": lambda e: element_cst_lines(
+            e, cst_repeats, cst_separations
+        )[1],
+        "frag_json_bytes": _element_json_bytes,
+    }
+    counts, sums = _accumulate(element_lists, list(quantities.values()))
+    lengths = np.arange(len(counts))
+    keep = counts > 0
+    if min_length is not None:
+        keep &= lengths >= min_length
+    if max_length is not None:
+        keep &= lengths <= max_length
+    lengths = lengths[keep]
+    counts = counts[keep]
+    totals = {
+        name: int(q_sum[keep].sum()) for name, q_sum in zip(quantities, sums)
+    }
+    n = int(counts.sum())
+    n_elements = len(element_lists)
+    # "[" + ", ".join(elements) + "]" per combination, joined by ", " or "\n"
+    totals["frag_json_bytes"] += n * (2 + 2 * (n_elements - 1))
+    totals["frag_json_bytes"] += n if jsonl else 2 * max(n - 1, 0) + 2
+    totals["blueprint_bytes"] = sum(
+        blueprint_bytes(int(l), fragment_rows, abego) * c
+        for l, c in zip(lengths, counts)
+    )
+    totals["motif_flags_bytes"] = sum(
+        motif_flags_bytes(int(l)) * c for l, c in zip(lengths, counts)
+    )
+    design_bytes = (
+        totals["blueprint_bytes"]
+        + totals["cst_bytes"]
+        + totals["motif_flags_bytes"]
+    )
+    if output_format == "dir":
+        link_bytes = sum(
+            len(f"{extra_files_dir}/{source}")
+            for source in SHARED_FILES.values()
+        )
+        output = {
+            "files": n * (len(SHARED_FILES) + len(DESIGN_FILES)),
+            "inodes": n * (1 + len(SHARED_FILES) + len(DESIGN_FILES)),
+            "bytes": design_bytes + n * link_bytes,
+        }
+    else:
+        members = n * len(DESIGN_FILES)
+        output = {"files": 1, "inodes": 1, "bytes": design_bytes}
+        if output_format == "tar":
+            # a header block per member plus on average half a block padding
+            output["bytes"] += members * (TAR_BLOCK + TAR_BLOCK // 2)
+    return DesignStats(
+        len(design_space), lengths, list(counts), totals, output
+    )
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Fixed-width binary frag_params format
+
+Layout (all integers little endian):
+
+    MAGIC                 8 bytes
+    header length         uint32
+    header                json: {"samplers": [sampler dicts],
+                                 "digit_dtype": "<u1" | "<u2" | "<u4"}
+    padding               to a multiple of 8 bytes
+    records               one row of k digits per combination
+
+Digit j of a record is the size index within sampler j (size = min_size +
+digit), the same digits DesignSpace uses, so a record is k bytes for
+samplers of up to 256 sizes. The record count is implied by the file size,
+which lets writers stream without knowing it in advance. FragParamsBinary
+memory-maps the records: combination k is one row lookup and slices
+(e.g. array job shards) are views. Conversion to and from the json layouts
+is lossless.
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+from bp_tools.bp_tools import (
+    SecondaryStructElement,
+    SecondaryStructElementSampler,
+)
+
+MAGIC = b"BPFRAG1\n"
+ALIGNMENT = 8
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+
+def _digit_dtype(samplers):
+    largest = max((s.max_size - s.min_size for s in samplers), default=0)
+    for dtype in ("<u1", "<u2", "<u4"):
+        if largest <= np.iinfo(np.dtype(dtype)).max:
+            return dtype
+    raise ValueError(f"sampler with {largest + 1} sizes is too large")
+
+
+def _header_bytes(samplers, digit_dtype):
+    header = json.dumps(
+        {
+            "samplers": [s.to_dict() for s in samplers],
+            "digit_dtype": digit_dtype,
+        }
+    ).encode()
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    return prefix + b"\0" * (-len(prefix) % ALIGNMENT)
+
+
+def _combination_digits(combination, samplers):
+    if len(combination) != len(samplers):
+        raise ValueError(
+            f"combination of {len(combination)} elements for "
+            f"{len(samplers)} samplers"
+        )
+    digits = []
+    for element, sampler in zip(combination, samplers):
+        if (
+            element.dssp_type != sampler.dssp_type
+            or element.repeat_dist != sampler.repeat_dist
+            or element.repeat_dist_cst != sampler.repeat_dist_cst
+            or not sampler.min_size <= element.size <= sampler.max_size
+        ):
+            raise ValueError(f"{element!r} does not come from {sampler!r}")
+        digits.append(element.size - sampler.min_size)
+    return digits
+
+
+def write_frag_params_binary(
+    fragerator, path, samplers, echo=False, chunk_size=DEFAULT_CHUNK_SIZE
+):
+    """
+    Streams combinations (tuples of SecondaryStructElement) drawn from
+    samplers to path in the binary layout
+
+    Returns the number of combinations written
+    """
+    samplers = list(samplers)
+    digit_dtype = _digit_dtype(samplers)
+    count = 0
+    chunk = []
+    with open(path, "wb") as f:
+        f.write(_header_bytes(samplers, digit_dtype))
+        for combination in fragerator:
+            if echo:
+                print(combination)
+            chunk.append(_combination_digits(combination, samplers))
+            if len(chunk) == chunk_size:
+                f.write(np.array(chunk, dtype=digit_dtype).tobytes())
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            f.write(np.array(chunk, dtype=digit_dtype).tobytes())
+            count += len(chunk)
+    return count
+
+
+def write_space_binary(
+    design_space, path, start=0, stop=None, chunk_size=DEFAULT_CHUNK_SIZE
+):
+    """
+    Writes combinations start <= k < stop of a DesignSpace, decoding the
+    digits with vectorized integer division instead of per combination
+
+    Returns the number of combinations written
+    """
+    stop = len(design_space) if stop is None else min(stop, len(design_space))
+    start = max(start, 0)
+    samplers = design_space.samplers
+    digit_dtype = _digit_dtype(samplers)
+    radices = design_space.radices
+    with open(path, "wb") as f:
+        f.write(_header_bytes(samplers, digit_dtype))
+        for chunk_start in range(start, stop, chunk_size):
+            remainder = np.arange(
+                chunk_start,
+                min(chunk_start + chunk_size, stop),
+                dtype=np.int64,
+            )
+            digits = np.empty(
+                (len(remainder), len(radices)), dtype=digit_dtype
+            )
+            for j in range(len(radices) - 1, -1, -1):
+                remainder, digits[:, j] = np.divmod(remainder, radices[j])
+            f.write(digits.tobytes())
+    return max(stop - start, 0)
+
+
+class FragParamsBinary(object):
+    """
+    Random access reader for binary frag_params files
+
+    len(reader) is the number of combinations, reader[k] combination k as a
+    tuple of SecondaryStructElement, reader[a:b] a list of them. digits is
+    the memory-mapped (n, k) record array.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a binary frag_params file")
+            (header_length,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_length))
+        self.samplers = [
+            SecondaryStructElementSampler.from_dict(d)
+            for d in header["samplers"]
+        ]
+        self._elements = [s.get_ss_elements_list() for s in self.samplers]
+        dtype = np.dtype(header["digit_dtype"])
+        offset = len(MAGIC) + 4 + header_length
+        offset += -offset % ALIGNMENT
+        record_size = dtype.itemsize * len(self.samplers)
+        data_size = os.path.getsize(path) - offset
+        n = data_size // record_size if record_size else 0
+        if record_size and data_size % record_size:
+            raise ValueError(f"{path} ends with a truncated record")
+        if n:
+            self.digits = np.memmap(
+                path,
+                dtype=dtype,
+                mode="r",
+                offset=offset,
+                shape=(n, len(self.samplers)),
+            )
+        else:
+            self.digits = np.zeros((0, len(self.samplers)), dtype=dtype)
+
+    def __len__(self):
+        return self.digits.shape[0]
+
+    def __repr__(self):
+        return f"FragParamsBinary({self.path!r}, n_combinations={len(self)})"
+
+    def combination(self, digits):
+        return tuple(
+            elements[digit]
+            for elements, digit in zip(self._elements, digits.tolist())
+        )
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self.combination(row) for row in self.digits[k]]
+        return self.combination(self.digits[k])
+
+    def __iter__(self):
+        for row in self.digits:
+            yield self.combination(row)
+
+    def shard(self, i, n):
+        """
+        Combinations of contiguous shard i (0 based) of n, as a list
+        """
+        if n < 1 or not 0 <= i < n:
+            raise ValueError(f"invalid shard {i}/{n}")
+        return self[i * len(self) // n : (i + 1) * len(self) // n]
+
+    def batch(self, start=0, stop=None):
+        """
+        Combinations start <= k < stop as a CombinationBatch
+        """
+        from bp_tools.combination_batch import CombinationBatch, element_table
+
+        return CombinationBatch(
+            [element_table(elements) for elements in self._elements],
+            self.digits[start:stop],
+        )
+
+
+def samplers_from_combinations(combinations):
+    """
+    The narrowest samplers that cover every combination (lists of element
+    dicts or SecondaryStructElement): per position the element type and
+    distances must agree, sizes span the observed min to max
+
+    Returns the list of SecondaryStructElementSampler
+    """
+    samplers = None
+    for combination in combinations:
+        combination = [
+            SecondaryStructElement.from_dict(e) if isinstance(e, dict) else e
+            for e in combination
+        ]
+        if samplers is None:
+            samplers = [
+                SecondaryStructElementSampler(
+                    e.dssp_type,
+                    e.size,
+                    e.size,
+                    e.repeat_dist,
+                    e.repeat_dist_cst,
+                )
+                for e in combination
+            ]
+            continue
+        if len(combination) != len(samplers):
+            raise ValueError("combinations have different numbers of elements")
+        for e, sampler in zip(combination, samplers):
+            if (e.dssp_type, e.repeat_dist, e.repeat_dist_cst) != (
+                sampler.dssp_type,
+                sampler.repeat_dist,
+                sampler.repeat_dist_cst,
+            ):
+                raise ValueError(
+                    f"{e!r} does not match the other elements at its "
+                    f"position ({sampler!r})"
+                )
+            sampler.min_size = min(sampler.min_size, e.size)
+            sampler.max_size = max(sampler.max_size, e.size)
+    return samplers or []
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Readers and writers for frag_params files
+
+The writers take any iterable of SecondaryStructElement combinations (e.g.
+the itertools.product over the samplers) and write them out as they are
+produced, so memory stays bounded no matter how large the design space is.
+"""
+
+import json
+
+# big buffered writes keep the syscall count low on network filesystems
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+_encode = json.JSONEncoder().encode
+
+
+def _combination_to_json(ss_elements):
+    return _encode([sse.to_dict() for sse in ss_elements])
+
+
+def write_frag_params_json(
+    fragerator, path, echo=False, buffer_size=DEFAULT_BUFFER_SIZE
+):
+    """
+    Streams combinations to path as a single json array
+
+    The output is byte-identical to json.dump of the full list of
+    combinations, but only one combination is in memory at a time.
+
+    Returns the number of combinations written
+    """
+    count = 0
+    with open(path, "w", buffering=buffer_size) as f:
+        f.write("[")
+        for ss_elements in fragerator:
+            if echo:
+                print(ss_elements)
+            if count:
+                f.write(", ")
+            f.write(_combination_to_json(ss_elements))
+            count += 1
+        f.write("]")
+    return count
+
+
+def write_frag_params_jsonl(
+    fragerator, path, echo=False, buffer_size=DEFAULT_BUFFER_SIZE
+):
+    """
+    Streams combinations to path, one json list of elements per line
+
+    Returns the number of combinations written
+    """
+    count = 0
+    with open(path, "w", buffering=buffer_size) as f:
+        for ss_elements in fragerator:
+            if echo:
+                print(ss_elements)
+            f.write(_combination_to_json(ss_elements))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def read_frag_params_jsonl(path, as_dicts=False):
+    """
+    Generator over the combinations in a jsonl frag_params file
+
+    Yields tuples of SecondaryStructElement, or the raw lists of dicts if
+    as_dicts is set. Blank lines are skipped.
+    """
+    from bp_tools.bp_tools import SecondaryStructElement
+
+    with open(path, "r", buffering=DEFAULT_BUFFER_SIZE) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            elem_dict_list = json.loads(line)
+            if as_dicts:
+                yield elem_dict_list
+            else:
+                yield tuple(
+                    SecondaryStructElement.from_dict(d) for d in elem_dict_list
+                )
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Many insertion fragments in one run
+
+Every fragment is loaded and rendered to FragmentRows exactly once, in a
+pool of worker processes. Each file gets its own deadline and its own
+error handling, so an unreadable or hanging structure only loses that
+fragment. The rendered rows are then crossed with every combination by
+building one ordinary run dir per fragment (output_dir/<label>/) with the
+bulk writer, and FRAGMENTS_NAME at the top of output_dir lists them:
+
+    label<TAB>fragment path<TAB>run dir
+"""
+
+import multiprocessing
+import os
+import time
+
+from bp_tools.bp_tools import FragmentRows
+from bp_tools.silent_reader import parse_silent_spec
+
+FRAGMENT_SUFFIXES = (".pdb", ".ent", ".cif", ".mmcif")
+FRAGMENTS_NAME = "fragments.tsv"
+
+
+def list_fragment_files(pdb_dir="", pdb_list=""):
+    """
+    Structure files of pdb_dir (by FRAGMENT_SUFFIXES, sorted) followed by
+    the paths in pdb_list (one per line, # comments, relative to the list;
+    "path.silent:tag" picks one structure of a silent file)
+    """
+    paths = []
+    if pdb_dir:
+        paths += sorted(
+            entry.path
+            for entry in os.scandir(pdb_dir)
+            if entry.is_file()
+            and entry.name.lower().endswith(FRAGMENT_SUFFIXES)
+        )
+    if pdb_list:
+        base = os.path.dirname(os.path.abspath(pdb_list))
+        with open(pdb_list, "r") as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    paths.append(os.path.join(base, line))
+    return paths
+
+
+def fragment_labels(paths):
+    """
+    A unique, filesystem friendly label per path: the file name without
+    its extension (the tag for "path.silent:tag"), with -2, -3, ...
+    appended to repeats
+    """
+    labels = []
+    seen = {}
+    for path in paths:
+        silent = parse_silent_spec(path)
+        name = os.path.basename(path)
+        if silent is not None and silent[1]:
+            name = silent[1]
+        for suffix in FRAGMENT_SUFFIXES:
+            if name.lower().endswith(suffix):
+                name = name[: -len(suffix)]
+                break
+        count = seen.get(name, 0) + 1
+        seen[name] = count
+        labels.append(name if count == 1 else f"{name}-{count}")
+    return labels
+
+
+def _render_fragment(path, loader, append, cache_dir):
+    """
+    Worker: ("ok", rows dict) or ("error", message) for one fragment
+    """
+    from bp_tools.blueprint_cache import BlueprintFragmentCache
+
+    try:
+        cache = BlueprintFragmentCache(cache_dir=cache_dir, loader=loader)
+        return "ok", cache.get(path, append=append).to_dict()
+    except Exception as e:
+        return "error", f"{type(e).__name__}: {e}"
+
+
+def render_fragments(
+    paths,
+    loader,
+    append=False,
+    cache_dir=None,
+    workers=1,
+    timeout=None,
+    poll_interval=0.05,
+):
+    """
+    Renders the FragmentRows of every path in a pool of worker processes
+
+    loader(path, chain) returns the fragment sequence (see
+    blueprint_cache) and must pickle. At most one fragment per worker is in
+    flight, so a fragment's timeout counts from when a worker picks it up.
+    A fragment that runs past timeout seconds is recorded as failed and the
+    pool is replaced (a stuck loader can't be interrupted otherwise); the
+    other fragments in flight are resubmitted.
+
+    Returns ({path: FragmentRows}, [(path, error message)])
+    """
+    workers = max(1, workers)
+    rows = {}
+    failures = []
+    todo = list(paths)[::-1]
+    pool = multiprocessing.Pool(workers)
+    in_flight = {}
+    try:
+        while todo or in_flight:
+            while todo and len(in_flight) < workers:
+                path = todo.pop()
+                result = pool.apply_async(
+                    _render_fragment, (path, loader, append, cache_dir)
+                )
+                in_flight[path] = (result, time.monotonic())
+            time.sleep(poll_interval)
+            now = time.monotonic()
+            timed_out = []
+            for path, (result, started) in list(in_flight.items()):
+                if result.ready():
+                    del in_flight[path]
+                    status, value = result.get()
+                    if status == "ok":
+                        rows[path] = FragmentRows.from_dict(value)
+                    else:
+                        failures.append((path, value))
+                elif timeout is not None and now - started > timeout:
+                    timed_out.append(path)
+            if timed_out:
+                for path in timed_out:
+                    del in_flight[path]
+                    failures.append((path, f"timed out after {timeout:g} s"))
+                pool.terminate()
+                pool.join()
+                pool = multiprocessing.Pool(workers)
+                todo.extend(in_flight)
+                in_flight.clear()
+    finally:
+        pool.terminate()
+        pool.join()
+    return rows, failures
+
+
+def write_fragment_table(output_dir, entries):
+    """
+    Writes FRAGMENTS_NAME for [(label, fragment path, run dir), ...]
+    """
+    path = os.path.join(output_dir, FRAGMENTS_NAME)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        for label, fragment, run_dir in entries:
+            relative = os.path.relpath(run_dir, output_dir)
+            f.write(f"{label}\t{os.path.abspath(fragment)}\t{relative}\n")
+    os.replace(tmp_path, path)
+
+
+def read_fragment_table(output_dir):
+    """
+    [(label, fragment path, run dir), ...] of a multi-fragment run, empty
+    if output_dir isn't one
+    """
+    path = os.path.join(output_dir, FRAGMENTS_NAME)
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, "r") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) == 3:
+                label, fragment, run_dir = fields
+                entries.append(
+                    (label, fragment, os.path.join(output_dir, run_dir))
+                )
+    return entries
@@ -0,0 +1,740 @@
+#!/usr/bin/env python3
+"""
+Collects the score files of a run into one columnar results table
+
+Every design dir's score file(s) are parsed in a pool of worker processes
+a chunk of dirs at a time (for designs of a tar/sqlite output, those of
+their results dir, see output_backends.store_results), and each scored
+structure becomes one row joined with the design's parameters: if the run
+has a design catalog, its fragment, constraint settings and the type,
+size and repeat_dist/repeat_dist_cst of every element recorded there,
+otherwise the element types and sizes parsed from its name. The rows of
+finished chunks are spooled to disk and the table is written a chunk at a
+time, as Parquet (one row group per chunk) if pyarrow is installed,
+otherwise as NPZ (or CSV on request).
+
+Rows carry the mtime of the score files they were read from, so a second
+harvest into the same table only re-parses dirs whose score files changed
+(or are new) and keeps the other rows as they are. The number of scored
+structures and the best total score of every re-parsed dir also go to the
+run's design catalog, if it has one.
+"""
+
+import concurrent.futures
+import csv
+import fnmatch
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import click
+
+from bp_tools.bundles import collect_design_locations, output_dir_for
+from bp_tools.catalog import CATALOG_NAME, DesignCatalog, find_catalog
+
+# filters reported by get_default_xml, the columns most analyses want first
+DEFAULT_XML_FILTERS = (
+    "VDW",
+    "worst9mer_h",
+    "motif_score",
+    "motif_degree_score",
+    "ss_degree_worst",
+    "radius",
+    "rise",
+    "omega",
+)
+SCORE_FILE_PATTERN = "*.sc"
+TABLE_FORMATS = ("parquet", "npz", "csv")
+HARVEST_NAME = "harvest"
+# bookkeeping columns, followed by the element and score columns
+KEY_COLUMNS = ("path", "name", "tag", "score_mtime_ns")
+# score terms best_score is taken from, first one present wins
+TOTAL_SCORE_TERMS = ("total_score", "score")
+ELEMENT_PATTERN = re.compile(r"^([A-Za-z])(\d+)$")
+# design parameters joined from the catalog row
+CATALOG_COLUMNS = (
+    "fragment",
+    "cst_repeats",
+    "cst_separations",
+    "append",
+    "abego",
+)
+DESIGN_COLUMNS = ("n_elements", "length") + CATALOG_COLUMNS
+# <column>_<i> for every element i
+ELEMENT_COLUMNS = ("type", "size", "repeat_dist", "repeat_dist_cst")
+ELEMENT_COLUMN_PATTERN = re.compile(rf"^({'|'.join(ELEMENT_COLUMNS)})_(\d+)$")
+
+
+def parse_design_name(name):
+    """
+    [(dssp_type, size), ...] from a design name like H20_L3_H18, or None if
+    the name doesn't look like one
+    """
+    elements = []
+    for part in name.split("_"):
+        match = ELEMENT_PATTERN.match(part)
+        if match is None:
+            return None
+        elements.append((match.group(1), int(match.group(2))))
+    return elements
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return float("nan")
+
+
+def parse_score_file(path):
+    """
+    Yields {term: value} for every score line of a Rosetta score file
+
+    Header lines ("SCORE: ... description") may repeat, e.g. when runs
+    append to the same file; every score line is read with the last header.
+    Values are floats except "description"
+    """
+    header = None
+    with open(path, "r") as f:
+        for line in f:
+            if not line.startswith("SCORE:"):
+                continue
+            fields = line.split()[1:]
+            if fields and fields[-1] == "description":
+                header = fields
+                continue
+            if header is None or len(fields) != len(header):
+                continue
+            row = {
+                term: _to_float(value)
+                for term, value in zip(header[:-1], fields[:-1])
+            }
+            row["description"] = fields[-1]
+            yield row
+
+
+def score_files(design_dir, pattern=SCORE_FILE_PATTERN):
+    try:
+        entries = list(os.scandir(design_dir))
+    except OSError:
+        return []
+    return sorted(
+        entry.path
+        for entry in entries
+        if entry.is_file() and fnmatch.fnmatch(entry.name, pattern)
+    )
+
+
+def score_mtime_ns(paths):
+    """
+    Latest mtime of paths (ns), -1 for no files
+    """
+    return max((os.stat(path).st_mtime_ns for path in paths), default=-1)
+
+
+def design_params(name, design=None):
+    """
+    Parameter columns of design name: with its catalog row (see
+    DesignCatalog.designs_at) the CATALOG_COLUMNS and every element's type,
+    size, repeat_dist and repeat_dist_cst, else the element types and sizes
+    parsed from the name
+    """
+    if design is None:
+        elements = [
+            (dssp_type, size, None, None)
+            for dssp_type, size in parse_design_name(name) or []
+        ]
+        params = {}
+    else:
+        elements = design["elements"]
+        params = {column: design[column] for column in CATALOG_COLUMNS}
+    params["n_elements"] = len(elements)
+    params["length"] = sum(size for _, size, _, _ in elements)
+    for i, (dssp_type, size, repeat_dist, repeat_dist_cst) in enumerate(
+        elements
+    ):
+        params[f"type_{i}"] = dssp_type
+        params[f"size_{i}"] = size
+        if design is not None:
+            params[f"repeat_dist_{i}"] = repeat_dist
+            params[f"repeat_dist_cst_{i}"] = repeat_dist_cst
+    return params
+
+
+def _harvest_chunk(chunk, pattern, catalog_path=None):
+    """
+    Worker: rows for every (location, known mtime) in chunk whose score
+    files changed, joined with the designs' rows in the catalog at
+    catalog_path if given
+
+    Returns (harvested locations with their new mtime, rows, failures)
+    """
+    harvested = []
+    rows = []
+    failures = []
+    designs = {}
+    if catalog_path:
+        with DesignCatalog(catalog_path, mode="r") as catalog:
+            designs = catalog.designs_at(location for location, _ in chunk)
+    for location, known_mtime in chunk:
+        try:
+            design_dir = output_dir_for(location)
+            paths = score_files(design_dir, pattern)
+            mtime = score_mtime_ns(paths)
+            if mtime == known_mtime:
+                continue
+            name = os.path.basename(os.path.normpath(design_dir))
+            params = design_params(name, designs.get(location))
+            for path in paths:
+                for scores in parse_score_file(path):
+                    row = {
+                        "path": location,
+                        "name": name,
+                        "tag": scores.pop("description"),
+                        "score_mtime_ns": mtime,
+                    }
+                    row.update(params)
+                    row.update(scores)
+                    rows.append(row)
+            harvested.append((location, mtime))
+        except Exception as e:
+            failures.append((location, f"{type(e).__name__}: {e}"))
+    return harvested, rows, failures
+
+
+def _column_order(columns):
+    def key(column):
+        if column in KEY_COLUMNS:
+            return (0, KEY_COLUMNS.index(column), 0)
+        if column in DESIGN_COLUMNS:
+            return (1, DESIGN_COLUMNS.index(column), 0)
+        match = ELEMENT_COLUMN_PATTERN.match(column)
+        if match:
+            return (
+                2,
+                int(match.group(2)),
+                ELEMENT_COLUMNS.index(match.group(1)),
+            )
+        if column in DEFAULT_XML_FILTERS:
+            return (3, DEFAULT_XML_FILTERS.index(column), 0)
+        return (4, column, 0)
+
+    return sorted(columns, key=key)
+
+
+def rows_to_columns(rows):
+    """
+    {column: list} for a list of row dicts, missing values filled with ""
+    for text columns, 0 for element sizes and nan for scores
+    """
+    names = set()
+    for row in rows:
+        names.update(row)
+    columns = {}
+    for name in _column_order(names):
+        values = [row.get(name) for row in rows]
+        present = [v for v in values if v is not None]
+        fill = _fill_value(present[0] if present else None)
+        columns[name] = [fill if v is None else v for v in values]
+    return columns
+
+
+def _fill_value(value):
+    """
+    Value missing entries of a column holding value are filled with
+    """
+    if isinstance(value, str):
+        return ""
+    if isinstance(value, int):
+        return 0
+    return float("nan")
+
+
+def columns_to_rows(columns):
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def default_table_format():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "npz"
+    return "parquet"
+
+
+def table_format_for(path):
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    if extension not in TABLE_FORMATS:
+        raise ValueError(
+            f"can't tell the table format of {path}, use one of "
+            f"{', '.join('.' + fmt for fmt in TABLE_FORMATS)}"
+        )
+    return extension
+
+
+def write_table(columns, path, table_format=None):
+    """
+    Writes {column: list} to path as parquet, npz or csv (default: by the
+    extension of path), atomically
+    """
+    table_format = table_format or table_format_for(path)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    if table_format == "parquet":
+        import pyarrow
+        import pyarrow.parquet
+
+        pyarrow.parquet.write_table(pyarrow.table(columns), tmp_path)
+    elif table_format == "npz":
+        import numpy as np
+
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **{name: np.asarray(v) for name, v in columns.items()})
+    elif table_format == "csv":
+        with open(tmp_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(zip(*columns.values()))
+    else:
+        raise ValueError(
+            f"unknown table format {table_format}, use one of "
+            f"{TABLE_FORMATS}"
+        )
+    os.replace(tmp_path, path)
+
+
+def _csv_value(text):
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            continue
+    return text
+
+
+def read_table(path, table_format=None):
+    """
+    {column: list} of a table written by write_table
+    """
+    table_format = table_format or table_format_for(path)
+    if table_format == "parquet":
+        import pyarrow.parquet
+
+        return pyarrow.parquet.read_table(path).to_pydict()
+    if table_format == "npz":
+        import numpy as np
+
+        with np.load(path, allow_pickle=False) as data:
+            return {name: data[name].tolist() for name in data.files}
+    if table_format == "csv":
+        with open(path, "r", newline="") as f:
+            reader = csv.reader(f)
+            names = next(reader, [])
+            values = [[_csv_value(v) for v in row] for row in reader]
+        columns = {name: [] for name in names}
+        for row in values:
+            for name, value in zip(names, row):
+                columns[name].append(value)
+        return columns
+    raise ValueError(
+        f"unknown table format {table_format}, use one of {TABLE_FORMATS}"
+    )
+
+
+def iter_table_rows(path, table_format=None, batch_size=4096):
+    """
+    Yields the rows of a table written by write_table or TableWriter as
+    lists of up to batch_size row dicts
+
+    Parquet and csv tables are read a batch at a time; npz tables can only
+    be loaded whole
+    """
+    table_format = table_format or table_format_for(path)
+    if table_format == "parquet":
+        import pyarrow.parquet
+
+        table = pyarrow.parquet.ParquetFile(path)
+        for batch in table.iter_batches(batch_size=batch_size):
+            yield batch.to_pylist()
+    elif table_format == "csv":
+        with open(path, "r", newline="") as f:
+            reader = csv.reader(f)
+            names = next(reader, [])
+            batch = []
+            for values in reader:
+                batch.append(
+                    {
+                        name: _csv_value(value)
+                        for name, value in zip(names, values)
+                    }
+                )
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+    else:
+        rows = columns_to_rows(read_table(path, table_format))
+        for i in range(0, len(rows), batch_size):
+            yield rows[i : i + batch_size]
+
+
+class TableWriter(object):
+    """
+    Writes a table with known columns a batch of row dicts at a time, to
+    a temporary file that replaces path on close
+
+    fills maps every column to the value its missing entries get (see
+    rows_to_columns). Parquet gets one row group per batch and csv is
+    appended to; npz has to be written whole, so its columns are kept in
+    memory until close.
+    """
+
+    def __init__(self, path, fills, table_format=None):
+        self.path = path
+        self.table_format = table_format or table_format_for(path)
+        self.columns = _column_order(fills)
+        self.fills = fills
+        self.tmp_path = f"{path}.tmp.{os.getpid()}"
+        self._file = None
+        self._writer = None
+        self._arrays = None
+        if self.table_format == "parquet":
+            import pyarrow
+            import pyarrow.parquet
+
+            types = {str: pyarrow.string(), int: pyarrow.int64()}
+            self._schema = pyarrow.schema(
+                [
+                    (name, types.get(type(fills[name]), pyarrow.float64()))
+                    for name in self.columns
+                ]
+            )
+            self._writer = pyarrow.parquet.ParquetWriter(
+                self.tmp_path, self._schema
+            )
+        elif self.table_format == "csv":
+            self._file = open(self.tmp_path, "w", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.columns)
+        elif self.table_format == "npz":
+            self._arrays = {name: [] for name in self.columns}
+        else:
+            raise ValueError(
+                f"unknown table format {self.table_format}, use one of "
+                f"{TABLE_FORMATS}"
+            )
+
+    def _values(self, rows, name):
+        fill = self.fills[name]
+        values = (row.get(name) for row in rows)
+        return [fill if value is None else value for value in values]
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        if self.table_format == "parquet":
+            import pyarrow
+
+            self._writer.write_table(
+                pyarrow.table(
+                    {name: self._values(rows, name) for name in self.columns},
+                    schema=self._schema,
+                )
+            )
+        elif self.table_format == "csv":
+            self._writer.writerows(
+                zip(*(self._values(rows, name) for name in self.columns))
+            )
+        else:
+            for name in self.columns:
+                self._arrays[name] += self._values(rows, name)
+
+    def close(self):
+        if self.table_format == "parquet":
+            self._writer.close()
+        elif self.table_format == "csv":
+            self._file.close()
+        else:
+            write_table(self._arrays, self.tmp_path, "npz")
+        os.replace(self.tmp_path, self.path)
+
+
+class _RowSpool(object):
+    """
+    Rows of finished chunks appended to a temporary file as they come in,
+    with the fill value of every column seen
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fills = {}
+        self._file = open(path, "w+")
+
+    def add(self, rows):
+        if not rows:
+            return
+        for row in rows:
+            for name, value in row.items():
+                if name not in self.fills and value is not None:
+                    self.fills[name] = _fill_value(value)
+        self._file.write(json.dumps(rows) + "\n")
+
+    def __iter__(self):
+        self._file.flush()
+        self._file.seek(0)
+        for line in self._file:
+            yield json.loads(line)
+
+    def close(self):
+        self._file.close()
+        os.unlink(self.path)
+
+
+class HarvestResult(object):
+    """
+    Summary of a harvest: dirs parsed, dirs unchanged since the last
+    harvest, dirs without score files, rows in the table and
+    (design_dir, error) failures
+    """
+
+    def __init__(self):
+        self.harvested = 0
+        self.unchanged = 0
+        self.missing = 0
+        self.rows = 0
+        self.failures = []
+        self.elapsed = 0.0
+
+    def report(self):
+        return (
+            f"harvested {self.harvested} dirs ({self.unchanged} unchanged, "
+            f"{self.missing} without scores, {len(self.failures)} failed), "
+            f"{self.rows} rows in "
+            f"{self.elapsed:.1f} s"
+        )
+
+
+def best_score(rows):
+    """
+    Lowest total score of rows (see TOTAL_SCORE_TERMS), None if there is
+    none
+    """
+    scores = []
+    for row in rows:
+        for term in TOTAL_SCORE_TERMS:
+            if term in row:
+                # nan for unparsable values
+                if row[term] == row[term]:
+                    scores.append(row[term])
+                break
+    return min(scores, default=None)
+
+
+def _chunked(items, chunk_size):
+    for i in range(0, len(items), chunk_size):
+        yield items[i : i + chunk_size]
+
+
+def harvest(
+    design_dirs,
+    output_path,
+    table_format=None,
+    pattern=SCORE_FILE_PATTERN,
+    workers=None,
+    chunk_size=64,
+    incremental=True,
+    catalog=None,
+):
+    """
+    Parses the score files of design_dirs (design dirs or "container:name"
+    locations) into the table at output_path
+
+    With incremental, rows of an existing table are kept for dirs whose
+    score files have the same mtime as recorded, and only the other dirs
+    are parsed. Rows of dirs not in design_dirs are dropped. With a
+    catalog (a catalog.DesignCatalog) the rows are joined with the
+    designs' catalog rows and the score summary of every parsed dir is
+    stored in it.
+
+    Rows are not kept in memory: the rows of every finished chunk go to a
+    spool file next to output_path, and the table is then written a
+    chunk at a time (see TableWriter), kept rows first.
+
+    Returns a HarvestResult
+    """
+    start_time = time.perf_counter()
+    table_format = table_format or table_format_for(output_path)
+    result = HarvestResult()
+    wanted_dirs = set(design_dirs)
+    known_mtimes = {}
+    old_fills = {}
+    if incremental and os.path.exists(output_path):
+        for batch in iter_table_rows(output_path, table_format):
+            for row in batch:
+                if row["path"] not in wanted_dirs:
+                    continue
+                known_mtimes[row["path"]] = row["score_mtime_ns"]
+                for name, value in row.items():
+                    old_fills.setdefault(name, _fill_value(value))
+    wanted = [(d, known_mtimes.get(d)) for d in design_dirs]
+    reharvested = set()
+    spool = _RowSpool(f"{output_path}.rows.{os.getpid()}")
+    try:
+        workers = max(1, workers or os.cpu_count() or 1)
+        chunks = _chunked(wanted, chunk_size)
+        catalog_path = None if catalog is None else catalog.path
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers
+        ) as pool:
+            pending = set()
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < 2 * workers:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                        break
+                    pending.add(
+                        pool.submit(
+                            _harvest_chunk, chunk, pattern, catalog_path
+                        )
+                    )
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    harvested, new_rows, failures = future.result()
+                    result.failures.extend(failures)
+                    spool.add(new_rows)
+                    dir_rows = {}
+                    for design_dir, mtime in harvested:
+                        reharvested.add(design_dir)
+                        dir_rows[design_dir] = []
+                        if mtime == -1:
+                            result.missing += 1
+                        else:
+                            result.harvested += 1
+                    for row in new_rows:
+                        dir_rows[row["path"]].append(row)
+                    if catalog is not None:
+                        catalog.set_scores(
+                            [
+                                (d, len(rows), best_score(rows))
+                                for d, rows in dir_rows.items()
+                            ]
+                        )
+        kept = {d for d in known_mtimes if d not in reharvested}
+        result.unchanged = len(kept)
+        fills = dict(old_fills) if kept else {}
+        fills.update(spool.fills)
+        writer = TableWriter(output_path, fills, table_format)
+        if kept:
+            for batch in iter_table_rows(output_path, table_format):
+                rows = [row for row in batch if row["path"] in kept]
+                writer.write_rows(rows)
+                result.rows += len(rows)
+        for rows in spool:
+            writer.write_rows(rows)
+            result.rows += len(rows)
+        writer.close()
+    finally:
+        spool.close()
+    result.elapsed = time.perf_counter() - start_time
+    return result
+
+
+@click.command()
+@click.argument("run_dir", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "-o",
+    "--output",
+    "output_path",
+    default="",
+    help=f"Results table (default: RUN_DIR/{HARVEST_NAME}.<format>)",
+)
+@click.option(
+    "--format",
+    "table_format",
+    type=click.Choice(("auto",) + TABLE_FORMATS),
+    default="auto",
+    show_default=True,
+    help="auto: by the extension of --output, else parquet if pyarrow is "
+    "installed, else npz",
+)
+@click.option(
+    "--score-files",
+    "pattern",
+    default=SCORE_FILE_PATTERN,
+    show_default=True,
+    help="Glob of the score files in each design dir",
+)
+@click.option("-j", "--workers", "workers", type=int, default=None)
+@click.option(
+    "--incremental/--full",
+    "incremental",
+    default=True,
+    help="Only re-parse dirs whose score files changed since the last "
+    "harvest into the same table",
+)
+@click.option(
+    "--catalog",
+    "catalog_path",
+    default="",
+    help="Design catalog to store score summaries in (default: "
+    f"RUN_DIR/{CATALOG_NAME} if the run has one)",
+)
+def main(
+    run_dir,
+    output_path="",
+    table_format="auto",
+    pattern=SCORE_FILE_PATTERN,
+    workers=None,
+    incremental=True,
+    catalog_path="",
+):
+    """
+    Collects the score files of every design of RUN_DIR into one table
+    """
+    if table_format == "auto":
+        if output_path:
+            try:
+                table_format = table_format_for(output_path)
+            except ValueError as e:
+                raise click.BadParameter(str(e), param_hint="--output")
+        else:
+            table_format = default_table_format()
+    if table_format == "parquet" and default_table_format() != "parquet":
+        raise click.BadParameter(
+            "writing parquet needs pyarrow, use --format npz or csv",
+            param_hint="--format",
+        )
+    output_path = output_path or os.path.join(
+        run_dir, f"{HARVEST_NAME}.{table_format}"
+    )
+    design_dirs = collect_design_locations(run_dir)
+    if not design_dirs:
+        raise click.ClickException(f"no design dirs found in {run_dir}")
+    catalog_path = catalog_path or find_catalog(run_dir)
+    catalog = DesignCatalog(catalog_path) if catalog_path else None
+    result = harvest(
+        design_dirs,
+        output_path,
+        table_format=table_format,
+        pattern=pattern,
+        workers=workers,
+        incremental=incremental,
+        catalog=catalog,
+    )
+    if catalog is not None:
+        catalog.close()
+    for design_dir, error in result.failures:
+        print(f"failed: {design_dir}: {error}", file=sys.stderr)
+    click.echo(f"{result.report()} -> {output_path}")
+
+
+if __name__ == "__main__":
+    main()
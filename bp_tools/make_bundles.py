@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+import click
+
+from bp_tools.bundles import (
+    RUNNERS,
+    SCHEDULERS,
+    collect_design_locations,
+    write_bundles,
+)
+
+
+@click.command()
+@click.argument("run_dir", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "-o",
+    "--bundle-dir",
+    "bundle_dir",
+    default="bundles",
+    show_default=True,
+)
+@click.option(
+    "-k",
+    "--bundle-size",
+    "bundle_size",
+    type=int,
+    default=50,
+    show_default=True,
+    help="Number of designs each array task runs in sequence",
+)
+@click.option(
+    "--runner",
+    "runner",
+    type=click.Choice(RUNNERS),
+    default="cmd",
+    show_default=True,
+    help="Run every design's own cmd, or the whole bundle in one pyrosetta "
+    "process (bp_run_bundle)",
+)
+@click.option(
+    "--runner-args",
+    "runner_args",
+    default="",
+    help="Extra arguments for bp_run_bundle, e.g. '--nstruct 5'",
+)
+@click.option(
+    "--scheduler",
+    "scheduler",
+    type=click.Choice(SCHEDULERS),
+    default="slurm",
+    show_default=True,
+)
+@click.option(
+    "--job-name", "job_name", default="bp_bundles", show_default=True
+)
+@click.option(
+    "--max-parallel",
+    "max_parallel",
+    type=int,
+    default=None,
+    help="Maximum number of bundles running at once",
+)
+@click.option(
+    "--directive",
+    "directives",
+    multiple=True,
+    help="Extra scheduler directive, e.g. --directive '--time=2:00:00' "
+    "(can be repeated)",
+)
+def main(
+    run_dir,
+    bundle_dir="bundles",
+    bundle_size=50,
+    runner="cmd",
+    runner_args="",
+    scheduler="slurm",
+    job_name="bp_bundles",
+    max_parallel=None,
+    directives=(),
+):
+    """
+    Splits the designs built in RUN_DIR into bundles and writes an array
+    job script with one task per bundle
+    """
+    locations = collect_design_locations(run_dir)
+    if not locations:
+        raise click.ClickException(f"no designs found in {run_dir}")
+    try:
+        submit_path = write_bundles(
+            locations,
+            bundle_dir,
+            bundle_size=bundle_size,
+            runner=runner,
+            runner_args=runner_args,
+            scheduler=scheduler,
+            job_name=job_name,
+            max_parallel=max_parallel,
+            directives=directives,
+        )
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--bundle-size")
+    n_bundles = -(-len(locations) // bundle_size)
+    click.echo(
+        f"{len(locations)} designs in {n_bundles} bundles, submit with: "
+        f"{'sbatch' if scheduler == 'slurm' else 'qsub'} {submit_path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
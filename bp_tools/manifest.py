@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Append-only manifest of completed design dirs
+
+Every completed design dir is recorded as one json line with a hash of the
+inputs it was built from and its absolute location, so the manifest can be
+read from any working directory. A resumed run skips designs whose
+recorded hash still matches and rebuilds everything else, so the work after
+a restart is proportional to what is missing or stale.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from bp_tools.bp_tools import FragmentRows, get_chain_sequence
+
+MANIFEST_NAME = "design_manifest.jsonl"
+
+
+def _fragment_fingerprint(extra_pose):
+    if extra_pose is None:
+        return None
+    if isinstance(extra_pose, FragmentRows):
+        return extra_pose.to_dict()
+    return get_chain_sequence(extra_pose)
+
+
+def design_input_hasher(
+    extra_files_dir="",
+    extra_pose=None,
+    append=False,
+    abego=False,
+    cst_repeats=2,
+    cst_separations=(1,),
+):
+    """
+    Returns a function ss_elements -> sha256 of everything prepare_design_dir
+    writes for them with these settings
+
+    The settings (including the fragment) are serialized once, so hashing a
+    design only costs serializing its elements
+    """
+    settings = json.dumps(
+        {
+            "extra_files_dir": os.path.abspath(extra_files_dir),
+            "fragment": _fragment_fingerprint(extra_pose),
+            "append": append,
+            "abego": abego,
+            "cst_repeats": cst_repeats,
+            "cst_separations": list(cst_separations),
+        },
+        sort_keys=True,
+    ).encode()
+
+    def input_hash(ss_elements):
+        digest = hashlib.sha256(settings)
+        digest.update(
+            json.dumps([list(element) for element in ss_elements]).encode()
+        )
+        return digest.hexdigest()
+
+    return input_hash
+
+
+def design_input_hash(ss_elements, **settings):
+    """
+    sha256 of everything prepare_design_dir's output depends on
+
+    ss_elements should be a list of tuples
+    (dssp_type,size,lattice_space,cst_tolerance), settings are the keyword
+    arguments of design_input_hasher
+    """
+    return design_input_hasher(**settings)(ss_elements)
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+class DesignManifest(object):
+    """
+    jsonl record of completed designs: {"name", "input_hash", "path"}
+
+    Later records for the same name supersede earlier ones. A truncated last
+    line (e.g. from a killed job) is ignored on load. Paths are recorded
+    absolute.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.completed[record["name"]] = record
+        self._file = open(path, "a")
+        # don't glue the first new record onto a truncated last line
+        if self._file.tell() and not _ends_with_newline(path):
+            self._file.write("\n")
+
+    def __len__(self):
+        return len(self.completed)
+
+    def __contains__(self, name):
+        return name in self.completed
+
+    def is_complete(self, name, input_hash):
+        record = self.completed.get(name)
+        return record is not None and record["input_hash"] == input_hash
+
+    def record(self, name, input_hash, path):
+        """
+        Records design name as complete at path, a design dir or
+        "container:name" location (made absolute)
+        """
+        # names never contain "/", so this also works for container:name
+        path = os.path.abspath(path)
+        record = {"name": name, "input_hash": input_hash, "path": path}
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            self.completed[name] = record
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import os
+
+import click
+
+from bp_tools.output_backends import (
+    materialize_design,
+    open_backend,
+    store_results,
+)
+
+
+@click.command()
+@click.argument("container")
+@click.argument("names", nargs=-1)
+@click.option(
+    "-o",
+    "--output-dir",
+    "output_dir",
+    default=".",
+    show_default=True,
+    help="Dir to write the design dir(s) into, e.g. local scratch",
+)
+@click.option(
+    "-l",
+    "--list",
+    "list_designs",
+    is_flag=True,
+    default=False,
+    help="Print the names of the designs in the container and exit",
+)
+@click.option(
+    "--store-results",
+    "store",
+    is_flag=True,
+    default=False,
+    help="Instead copy the outputs of design dir(s) NAMES, materialized "
+    "into the output dir and run, to results/<name> next to CONTAINER",
+)
+def main(container, names=(), output_dir=".", list_designs=False, store=False):
+    """
+    Writes design dir(s) NAMES stored in a designs.tar or designs.sqlite
+    CONTAINER to the output dir, ready to run
+    """
+    if not os.path.exists(container):
+        raise click.BadParameter(
+            f"{container} does not exist", param_hint="CONTAINER"
+        )
+    if list_designs:
+        with open_backend(container, mode="r") as backend:
+            for name in backend.design_names():
+                click.echo(name)
+        return
+    for name in names:
+        try:
+            if store:
+                click.echo(
+                    store_results(
+                        container, name, os.path.join(output_dir, name)
+                    )
+                )
+                continue
+            click.echo(materialize_design(container, name, output_dir))
+        except KeyError as e:
+            raise click.ClickException(e.args[0])
+        except OSError as e:
+            raise click.ClickException(str(e))
+
+
+if __name__ == "__main__":
+    main()
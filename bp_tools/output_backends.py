@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Output backends for generated designs
+
+The default layout is one directory per design holding symlinks to the
+SHARED_FILES plus the rendered per-design files. On shared filesystems that
+costs about a dozen inodes per design, so the same content can instead go
+into a single container:
+
+    DirectoryBackend   today's layout, one dir per design
+    TarBackend         one uncompressed tar, <name>/<file> members, and
+                       a sqlite index of where each member's data is
+    SQLiteBackend      one sqlite file with a row per design file
+
+Containers store the shared files once (under SHARED_PREFIX in the tar, in
+their own table in sqlite) and take designs in batches from a single
+writer. materialize_design turns any stored design back into a normal
+design dir, e.g. on local scratch at job start, and store_results copies
+what the design's run wrote there back into results/<name> next to the
+container, where harvest reads it.
+"""
+
+import io
+import os
+import shutil
+import sqlite3
+import tarfile
+import threading
+import time
+
+from bp_tools.bp_tools import (
+    SHARED_FILES,
+    copy_necessary_files,
+    design_path,
+)
+
+SHARED_PREFIX = "_shared"
+# dir next to a container that the outputs of its designs are copied to
+RESULTS_DIR_NAME = "results"
+
+
+def _read_shared_files(extra_files_dir):
+    shared = {}
+    for name, source in SHARED_FILES.items():
+        with open(os.path.join(extra_files_dir, source), "rb") as f:
+            shared[name] = f.read()
+    return shared
+
+
+def _as_bytes(contents):
+    return contents.encode() if isinstance(contents, str) else contents
+
+
+class DirectoryBackend(object):
+    """
+    One directory per design with symlinks to the shared files
+
+    parallel_writes is True when workers may write designs themselves;
+    container backends take batches from a single writer instead
+    """
+
+    parallel_writes = True
+
+    def __init__(self, dirname, extra_files_dir=".", layout="flat"):
+        self.dirname = dirname
+        self.extra_files_dir = extra_files_dir
+        self.layout = layout
+
+    def location(self, name):
+        return design_path(self.dirname, name, self.layout)
+
+    def has_design(self, name):
+        return os.path.isdir(self.location(name))
+
+    def write_designs(self, designs):
+        """
+        designs is a list of (name, {file name: contents})
+        """
+        for name, files in designs:
+            path = self.location(name)
+            os.makedirs(path, exist_ok=True)
+            for link_name in SHARED_FILES:
+                if os.path.lexists(os.path.join(path, link_name)):
+                    os.unlink(os.path.join(path, link_name))
+            copy_necessary_files(path, self.extra_files_dir)
+            for file_name, contents in files.items():
+                with open(os.path.join(path, file_name), "wb") as f:
+                    f.write(_as_bytes(contents))
+
+    def read_design(self, name):
+        path = self.location(name)
+        files = {}
+        for file_name in os.listdir(path):
+            with open(os.path.join(path, file_name), "rb") as f:
+                files[file_name] = f.read()
+        return files
+
+    def design_names(self):
+        if self.layout != "flat":
+            from bp_tools.design_index import DesignIndex
+
+            return sorted(DesignIndex(self.dirname))
+        return sorted(
+            entry.name
+            for entry in os.scandir(self.dirname)
+            if entry.is_dir() and not entry.name.startswith(".")
+        )
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+TAR_INDEX_SUFFIX = ".index.sqlite"
+TAR_INDEX_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS members (
+        design TEXT, file_name TEXT, offset INTEGER, size INTEGER,
+        PRIMARY KEY (design, file_name)) WITHOUT ROWID;
+    """
+
+
+def build_tar_index(path, index_path):
+    """
+    Writes the member index of the tar at path to index_path (atomically),
+    for archives written without one
+    """
+    tmp_path = f"{index_path}.tmp.{os.getpid()}"
+    db = sqlite3.connect(tmp_path)
+    try:
+        db.executescript(TAR_INDEX_SCHEMA)
+        with tarfile.open(path, "r") as tar:
+            # later copies of a member replace earlier ones
+            db.executemany(
+                "INSERT OR REPLACE INTO members VALUES (?, ?, ?, ?)",
+                (
+                    (
+                        *member.name.split("/", 1),
+                        member.offset_data,
+                        member.size,
+                    )
+                    for member in tar
+                    if member.isfile() and "/" in member.name
+                ),
+            )
+        db.commit()
+    finally:
+        db.close()
+    os.replace(tmp_path, index_path)
+
+
+class TarBackend(DirectoryBackend):
+    """
+    A single uncompressed tar holding every design
+
+    Opening an existing archive appends to it; a design written twice is
+    read back from its latest copy. Every member's data offset and size
+    goes to a sqlite index next to the archive (TAR_INDEX_SUFFIX), so
+    reading a design is an index lookup and a seek, whatever the size of
+    the archive
+    """
+
+    parallel_writes = False
+
+    def __init__(self, path, extra_files_dir=".", mode="a"):
+        self.path = path
+        self.extra_files_dir = extra_files_dir
+        self.index_path = f"{path}{TAR_INDEX_SUFFIX}"
+        self._lock = threading.Lock()
+        exists = os.path.exists(path) and os.path.getsize(path)
+        if mode == "r" and not exists:
+            raise FileNotFoundError(path)
+        if not exists and os.path.exists(self.index_path):
+            os.unlink(self.index_path)
+        if exists and not os.path.exists(self.index_path):
+            build_tar_index(path, self.index_path)
+        self._index = sqlite3.connect(self.index_path, check_same_thread=False)
+        self._tar = None
+        self._data = None
+        if mode == "r":
+            return
+        self._index.executescript(TAR_INDEX_SCHEMA)
+        self._tar = tarfile.open(path, "a" if exists else "w")
+        if not self._has_prefix(SHARED_PREFIX):
+            with self._lock:
+                self._add_files(
+                    SHARED_PREFIX, _read_shared_files(extra_files_dir)
+                )
+
+    def location(self, name):
+        return f"{self.path}:{name}"
+
+    def _has_prefix(self, prefix):
+        return (
+            self._index.execute(
+                "SELECT 1 FROM members WHERE design = ? LIMIT 1", (prefix,)
+            ).fetchone()
+            is not None
+        )
+
+    def has_design(self, name):
+        return (
+            self._index.execute(
+                "SELECT 1 FROM members WHERE design = ? "
+                "AND file_name = 'design.blueprint'",
+                (name,),
+            ).fetchone()
+            is not None
+        )
+
+    def _add_files(self, prefix, files):
+        now = time.time()
+        rows = []
+        for file_name, contents in files.items():
+            data = _as_bytes(contents)
+            info = tarfile.TarInfo(f"{prefix}/{file_name}")
+            info.size = len(data)
+            info.mtime = now
+            self._tar.addfile(info, io.BytesIO(data))
+            # the data ends at the current offset, padded to whole blocks
+            blocks = -(-info.size // tarfile.BLOCKSIZE)
+            offset = self._tar.offset - blocks * tarfile.BLOCKSIZE
+            rows.append((prefix, file_name, offset, info.size))
+        # the index only ever points at data that is on disk
+        self._tar.fileobj.flush()
+        self._index.executemany(
+            "INSERT OR REPLACE INTO members VALUES (?, ?, ?, ?)", rows
+        )
+        self._index.commit()
+
+    def write_designs(self, designs):
+        with self._lock:
+            for name, files in designs:
+                self._add_files(name, files)
+
+    def _read_prefix(self, prefix):
+        if self._data is None:
+            self._data = open(self.path, "rb")
+        files = {}
+        with self._lock:
+            for file_name, offset, size in self._index.execute(
+                "SELECT file_name, offset, size FROM members "
+                "WHERE design = ?",
+                (prefix,),
+            ):
+                self._data.seek(offset)
+                files[file_name] = self._data.read(size)
+        return files
+
+    def read_design(self, name):
+        files = self._read_prefix(name)
+        if not files:
+            raise KeyError(f"no design {name} in {self.path}")
+        return files
+
+    def read_shared(self):
+        return self._read_prefix(SHARED_PREFIX)
+
+    def design_names(self):
+        return [
+            row[0]
+            for row in self._index.execute(
+                "SELECT DISTINCT design FROM members WHERE design != ? "
+                "ORDER BY design",
+                (SHARED_PREFIX,),
+            )
+        ]
+
+    def close(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+
+class SQLiteBackend(DirectoryBackend):
+    """
+    A single sqlite database holding every design, keyed by design name
+    """
+
+    parallel_writes = False
+
+    def __init__(self, path, extra_files_dir=".", mode="a"):
+        self.path = path
+        self.extra_files_dir = extra_files_dir
+        self._lock = threading.Lock()
+        if mode == "r" and not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if mode == "r":
+            return
+        self._db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS shared_files (
+                file_name TEXT PRIMARY KEY, contents BLOB);
+            CREATE TABLE IF NOT EXISTS design_files (
+                design TEXT, file_name TEXT, contents BLOB,
+                PRIMARY KEY (design, file_name));
+            """)
+        if not self._db.execute("SELECT 1 FROM shared_files").fetchone():
+            self._db.executemany(
+                "INSERT INTO shared_files VALUES (?, ?)",
+                _read_shared_files(extra_files_dir).items(),
+            )
+            self._db.commit()
+
+    def location(self, name):
+        return f"{self.path}:{name}"
+
+    def has_design(self, name):
+        return (
+            self._db.execute(
+                "SELECT 1 FROM design_files WHERE design = ? LIMIT 1", (name,)
+            ).fetchone()
+            is not None
+        )
+
+    def write_designs(self, designs):
+        rows = [
+            (name, file_name, _as_bytes(contents))
+            for name, files in designs
+            for file_name, contents in files.items()
+        ]
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO design_files VALUES (?, ?, ?)", rows
+            )
+            self._db.commit()
+
+    def read_design(self, name):
+        files = dict(
+            self._db.execute(
+                "SELECT file_name, contents FROM design_files "
+                "WHERE design = ?",
+                (name,),
+            )
+        )
+        if not files:
+            raise KeyError(f"no design {name} in {self.path}")
+        return files
+
+    def read_shared(self):
+        return dict(self._db.execute("SELECT * FROM shared_files"))
+
+    def design_names(self):
+        return [
+            row[0]
+            for row in self._db.execute(
+                "SELECT DISTINCT design FROM design_files ORDER BY design"
+            )
+        ]
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+BACKENDS = {
+    "dir": DirectoryBackend,
+    "tar": TarBackend,
+    "sqlite": SQLiteBackend,
+}
+
+
+def backend_type_for(path):
+    """
+    Guesses the backend type from a container path
+    """
+    if path.endswith(".tar"):
+        return "tar"
+    if path.endswith((".sqlite", ".sqlite3", ".db")):
+        return "sqlite"
+    return "dir"
+
+
+def open_backend(
+    path, extra_files_dir=".", backend_type=None, mode="a", layout="flat"
+):
+    """
+    Opens the output backend at path, guessing the type from the extension
+    unless backend_type ("dir", "tar" or "sqlite") is given; layout only
+    applies to the dir backend
+    """
+    backend_type = backend_type or backend_type_for(path)
+    if backend_type == "dir":
+        return DirectoryBackend(path, extra_files_dir, layout=layout)
+    return BACKENDS[backend_type](path, extra_files_dir, mode=mode)
+
+
+def materialize_design(container, name, dest_dir):
+    """
+    Writes design name from a tar or sqlite container as a normal design dir
+    under dest_dir, with real copies of the shared files
+
+    Returns the path of the design dir
+    """
+    with open_backend(container, mode="r") as backend:
+        files = backend.read_shared()
+        files.update(backend.read_design(name))
+    path = os.path.join(dest_dir, name)
+    os.makedirs(path, exist_ok=True)
+    for file_name, contents in files.items():
+        with open(os.path.join(path, file_name), "wb") as f:
+            f.write(contents)
+    return path
+
+
+def results_dir(container, name):
+    """
+    Dir the outputs of design name of a tar or sqlite container are kept in
+    once it ran from a materialized copy: results/<name> next to container
+    """
+    return os.path.join(
+        os.path.dirname(os.path.abspath(container)), RESULTS_DIR_NAME, name
+    )
+
+
+def store_results(container, name, design_dir):
+    """
+    Copies everything in design_dir, a materialized copy of design name,
+    that is not one of the design's stored files (score files, structures,
+    logs) to results_dir(container, name)
+
+    Returns the path of the results dir
+    """
+    with open_backend(container, mode="r") as backend:
+        inputs = set(backend.read_shared())
+        inputs.update(backend.read_design(name))
+    dest = results_dir(container, name)
+    _merge_tree(design_dir, dest, skip=inputs)
+    return dest
+
+
+def _merge_tree(src, dest, skip=()):
+    """
+    Copies the tree under src into dest, replacing files that exist in
+    both and leaving other files of dest alone; top level names in skip
+    are not copied
+    """
+    os.makedirs(dest, exist_ok=True)
+    for entry in os.scandir(src):
+        if entry.name in skip:
+            continue
+        target = os.path.join(dest, entry.name)
+        if entry.is_dir(follow_symlinks=False):
+            _merge_tree(entry.path, target)
+        else:
+            shutil.copy2(entry.path, target)
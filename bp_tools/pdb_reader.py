@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Lightweight PDB/mmCIF reader for blueprint generation
+
+Blueprints only need the one letter sequence and residue numbering of the
+inserted chain, so building a full pyrosetta Pose (and splitting it by
+chain) is overkill. This reader memory-maps the file, streams the atom
+records of the first model and keeps one entry per residue.
+"""
+
+import mmap
+import os
+
+THREE_TO_ONE = {
+    "ALA": "A",
+    "ARG": "R",
+    "ASN": "N",
+    "ASP": "D",
+    "CYS": "C",
+    "GLN": "Q",
+    "GLU": "E",
+    "GLY": "G",
+    "HIS": "H",
+    "ILE": "I",
+    "LEU": "L",
+    "LYS": "K",
+    "MET": "M",
+    "PHE": "F",
+    "PRO": "P",
+    "SER": "S",
+    "THR": "T",
+    "TRP": "W",
+    "TYR": "Y",
+    "VAL": "V",
+    # common modified residues that rosetta reads as their parent
+    "MSE": "M",
+    "HIE": "H",
+    "HID": "H",
+    "HIP": "H",
+    "CYX": "C",
+}
+
+
+class ChainResidues(object):
+    """
+    Residue numbering and one letter sequence of a single chain
+
+    numbers are the residue numbers from the file (with insertion codes
+    appended where present); blueprint positions are 1..len(self) in file
+    order, the same as for the matching chain of a pyrosetta Pose
+    """
+
+    def __init__(self, chain, numbers, sequence, source=""):
+        self.chain = chain
+        self.numbers = list(numbers)
+        self.sequence = sequence
+        self.source = source
+
+    def __len__(self):
+        return len(self.sequence)
+
+    def __repr__(self):
+        return (
+            f"ChainResidues(chain={self.chain!r}, n_residues={len(self)}, "
+            f"source={self.source!r})"
+        )
+
+
+def _iter_lines(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from iter(mm.readline, b"")
+
+
+def _is_mmcif(path):
+    if path.lower().endswith((".cif", ".mmcif")):
+        return True
+    for line in _iter_lines(path):
+        if line.strip():
+            return line.startswith(b"data_")
+    return False
+
+
+def _iter_pdb_residues(path):
+    """
+    Yields (chain, residue_number, three_letter_name) per residue, model 1
+    """
+    last_key = None
+    for line in _iter_lines(path):
+        record = line[:6]
+        if record == b"ATOM  " or record == b"HETATM":
+            chain = line[21:22].decode().strip()
+            number = line[22:27].decode().strip()
+            resname = line[17:20].decode().strip()
+            if record == b"HETATM" and resname not in THREE_TO_ONE:
+                continue
+            key = (chain, number)
+            if key != last_key:
+                last_key = key
+                yield chain, number, resname
+        elif record == b"ENDMDL":
+            return
+
+
+def _iter_mmcif_residues(path):
+    """
+    Yields (chain, residue_number, three_letter_name) per residue, model 1
+    """
+    columns = []
+    in_atom_site = False
+    last_key = None
+    first_model = None
+    for line in _iter_lines(path):
+        line = line.decode().strip()
+        if line.startswith("_atom_site."):
+            in_atom_site = True
+            columns.append(line.split()[0][len("_atom_site.") :])
+            continue
+        if not in_atom_site or not line or line.startswith("loop_"):
+            continue
+        if line.startswith(("#", "_", "data_")):
+            if last_key is not None:
+                return
+            continue
+        fields = dict(zip(columns, line.split()))
+        model = fields.get("pdbx_PDB_model_num")
+        if first_model is None:
+            first_model = model
+        elif model != first_model:
+            return
+        resname = fields.get("auth_comp_id", fields.get("label_comp_id"))
+        if fields.get("group_PDB") == "HETATM" and resname not in THREE_TO_ONE:
+            continue
+        chain = fields.get("auth_asym_id", fields.get("label_asym_id", ""))
+        number = fields.get("auth_seq_id", fields.get("label_seq_id", ""))
+        icode = fields.get("pdbx_PDB_ins_code", "?")
+        if icode not in ("?", "."):
+            number += icode
+        key = (chain, number)
+        if key != last_key:
+            last_key = key
+            yield chain, number, resname
+
+
+def read_chain_residues(path, chain=None):
+    """
+    Reads the residues of one chain from a PDB or mmCIF file, or from one
+    structure of a silent file given as "path.silent:tag" (see
+    silent_reader)
+
+    chain defaults to the first chain in the file, matching
+    pose.split_by_chain()[1]. Unknown residue names map to "X".
+
+    Returns a ChainResidues
+    """
+    from bp_tools.silent_reader import is_silent_spec, read_silent_residues
+
+    if is_silent_spec(path):
+        return read_silent_residues(path, chain=chain)
+    residues = (
+        _iter_mmcif_residues(path)
+        if _is_mmcif(path)
+        else _iter_pdb_residues(path)
+    )
+    numbers = []
+    sequence = []
+    for res_chain, number, resname in residues:
+        if chain is None:
+            chain = res_chain
+        if res_chain != chain:
+            # chains are contiguous, so once the first chain ends we are done
+            if numbers:
+                break
+            continue
+        numbers.append(number)
+        sequence.append(THREE_TO_ONE.get(resname, "X"))
+    if not numbers:
+        raise ValueError(f"no residues found for chain {chain!r} in {path}")
+    return ChainResidues(chain, numbers, "".join(sequence), source=path)
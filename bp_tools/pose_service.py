@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""
+Long-lived local service that keeps pyrosetta initialized between runs
+
+Importing and initializing pyrosetta takes seconds, and build_bp_run
+--load-pose pays that on every invocation just to read one chain of one
+structure. The pose service owns an initialized session and answers
+"chain residues of this structure" and "fragment blueprint rows for this
+structure" over a Unix socket (never the network), keeping loaded
+structures in an in-memory LRU. build_bp_run uses it whenever one is
+listening on the socket and falls back to loading in-process otherwise.
+
+The protocol is one json request line and one json response line per
+connection:
+
+    {"op": "chain_residues", "path": ..., "chain": ..., "flags": ...}
+    {"op": "fragment_rows", "path": ..., "chain", "append", "offset",
+     "clip", "flags"}
+    {"op": "ping"} / {"op": "stats"} / {"op": "shutdown"}
+
+and every response is {"ok": true, ...} or {"ok": false, "error": ...}.
+
+The "stub" backend reads structures with the pure-Python pdb_reader, so
+the service and its clients can be tested without pyrosetta.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import click
+
+from bp_tools.blueprint_cache import PDB_READER_KIND, POSE_KIND
+from bp_tools.bp_tools import (
+    get_pyrosetta_session,
+    normalize_flags,
+    read_flag_file_cached,
+)
+from bp_tools.silent_reader import is_silent_spec, read_silent_residues
+
+SOCKET_ENV = "BP_POSE_SERVICE_SOCKET"
+BACKEND_NAMES = ("pyrosetta", "stub")
+# client side: how long to wait for a service before loading in-process
+CONNECT_TIMEOUT = 0.5
+REQUEST_TIMEOUT = 600.0
+MAX_MESSAGE = 1 << 24
+
+
+def default_socket_path():
+    """
+    $BP_POSE_SERVICE_SOCKET, else a per user socket in $XDG_RUNTIME_DIR (or
+    the temp dir)
+    """
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    run_dir = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(run_dir, f"bp_pose_service-{os.getuid()}.sock")
+
+
+def _flags_key(flags_file):
+    if not flags_file:
+        return normalize_flags("")
+    return normalize_flags(read_flag_file_cached(flags_file))
+
+
+class StubBackend(object):
+    """
+    Reads chains with the pure-Python pdb_reader, ignores rosetta flags
+    """
+
+    name = "stub"
+    # same rows as the in-process pdb reader loader
+    loader_kind = PDB_READER_KIND
+
+    def __init__(self, flags_file=""):
+        self.flags_file = flags_file
+
+    def chain_residues(self, path, chain=None):
+        from bp_tools.pdb_reader import read_chain_residues
+
+        residues = read_chain_residues(path, chain=chain)
+        return residues.chain, residues.numbers, residues.sequence
+
+
+class PyRosettaBackend(object):
+    """
+    Loads structures as pyrosetta Poses in the process wide session
+    """
+
+    name = "pyrosetta"
+    # same rows as the in-process pose loader
+    loader_kind = POSE_KIND
+
+    def __init__(self, flags_file=""):
+        self.flags_file = flags_file
+        self.session = get_pyrosetta_session().init(flags_file)
+
+    def _load(self, path):
+        pose = self.session.load_pdb(path)
+        if pose is None:
+            raise ValueError(f"unable to load: {path}")
+        return pose
+
+    def chain_residues(self, path, chain=None):
+        if is_silent_spec(path):
+            # pyrosetta can't seek to a tag, the indexed reader can
+            residues = read_silent_residues(path, chain=chain)
+            return residues.chain, residues.numbers, residues.sequence
+        pose = self._load(path)
+        chains = pose.split_by_chain()
+        index = 1
+        if chain is not None:
+            for k in range(1, len(chains) + 1):
+                if chains[k].pdb_info().chain(1) == chain:
+                    index = k
+                    break
+            else:
+                raise ValueError(f"no chain {chain} in {path}")
+        chain_pose = chains[index]
+        info = chain_pose.pdb_info()
+        numbers = [
+            f"{info.number(i)}{info.icode(i).strip()}"
+            for i in range(1, chain_pose.size() + 1)
+        ]
+        return info.chain(1), numbers, chain_pose.sequence()
+
+
+BACKENDS = {"pyrosetta": PyRosettaBackend, "stub": StubBackend}
+
+
+class PoseService(object):
+    """
+    Request handling of the service: a backend, an LRU of loaded chains
+    keyed by the file's content hash, and a BlueprintFragmentCache for the
+    rendered rows
+
+    Backend calls are serialized, pyrosetta is not thread safe
+    """
+
+    def __init__(self, backend, max_entries=256):
+        from bp_tools.blueprint_cache import BlueprintFragmentCache
+
+        self.backend = backend
+        self.flags = _flags_key(backend.flags_file)
+        self.max_entries = max_entries
+        self.started = time.time()
+        self.requests = 0
+        self.last_request = time.time()
+        self._chains = OrderedDict()
+        self._lock = threading.Lock()
+        self.fragments = BlueprintFragmentCache(
+            max_entries=max_entries,
+            loader=lambda path, chain: self._chain(path, chain)[2],
+            kind=backend.loader_kind,
+        )
+
+    def _chain(self, path, chain=None):
+        key = (self.fragments.content_hash(path), chain)
+        entry = self._chains.get(key)
+        if entry is None:
+            entry = self.backend.chain_residues(path, chain)
+            self._chains[key] = entry
+            while len(self._chains) > self.max_entries:
+                self._chains.popitem(last=False)
+        self._chains.move_to_end(key)
+        return entry
+
+    def _check_flags(self, request):
+        if self.backend.name == "stub":
+            return
+        flags = _flags_key(request.get("flags") or "")
+        if flags != self.flags:
+            raise ValueError(
+                "the service was started with different rosetta flags"
+            )
+
+    def handle(self, request):
+        op = request.get("op")
+        with self._lock:
+            self.requests += 1
+            self.last_request = time.time()
+            if op == "ping":
+                return {"backend": self.backend.name, "pid": os.getpid()}
+            if op == "stats":
+                return {
+                    "backend": self.backend.name,
+                    "pid": os.getpid(),
+                    "uptime": time.time() - self.started,
+                    "requests": self.requests,
+                    "chains": len(self._chains),
+                    "fragments": self.fragments.stats(),
+                }
+            self._check_flags(request)
+            path = request["path"]
+            chain = request.get("chain")
+            if op == "chain_residues":
+                chain, numbers, sequence = self._chain(path, chain)
+                return {
+                    "chain": chain,
+                    "numbers": numbers,
+                    "sequence": sequence,
+                }
+            if op == "fragment_rows":
+                rows = self.fragments.get(
+                    path,
+                    chain=chain,
+                    append=request.get("append", False),
+                    offset=request.get("offset"),
+                    clip=request.get("clip"),
+                )
+                return {"rows": rows.to_dict()}
+        raise ValueError(f"unknown op {op}")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline(MAX_MESSAGE)
+        shutdown = False
+        try:
+            request = json.loads(line)
+            if request.get("op") == "shutdown":
+                response = {"ok": True}
+                shutdown = True
+            else:
+                response = {"ok": True, **self.server.service.handle(request)}
+        except Exception as e:
+            response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+        self.wfile.flush()
+        if shutdown:
+            # only once the reply is out: the process exits as soon as
+            # serve_forever returns, killing this (daemon) thread
+            threading.Thread(target=self.server.shutdown).start()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(
+    socket_path=None,
+    backend="pyrosetta",
+    flags_file="",
+    max_entries=256,
+    idle_timeout=None,
+    log=sys.stderr,
+):
+    """
+    Runs the service on socket_path until a shutdown request, SIGINT or
+    idle_timeout seconds without requests
+
+    Refuses to start if another service is answering on socket_path; a
+    stale socket file is replaced. The socket is only accessible to the
+    current user.
+    """
+    socket_path = socket_path or default_socket_path()
+    if ping(socket_path) is not None:
+        raise RuntimeError(
+            f"a pose service is already running on {socket_path}"
+        )
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    service = PoseService(BACKENDS[backend](flags_file), max_entries)
+    old_umask = os.umask(0o177)
+    try:
+        server = _Server(socket_path, _Handler)
+    finally:
+        os.umask(old_umask)
+    server.service = service
+    if idle_timeout:
+
+        def watch_idle():
+            while True:
+                time.sleep(min(idle_timeout, 5.0))
+                if time.time() - service.last_request > idle_timeout:
+                    server.shutdown()
+                    return
+
+        threading.Thread(target=watch_idle, daemon=True).start()
+    print(
+        f"pose service ({backend}) listening on {socket_path}",
+        file=log,
+        flush=True,
+    )
+    try:
+        server.serve_forever(poll_interval=0.2)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def request(socket_path, message, timeout=REQUEST_TIMEOUT):
+    """
+    Sends one request and returns the response, raises OSError if nothing
+    is listening and RuntimeError for an error response
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(socket_path)
+        sock.settimeout(timeout)
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline(MAX_MESSAGE)
+    if not line:
+        raise OSError("the pose service closed the connection")
+    response = json.loads(line)
+    if not response.pop("ok", False):
+        raise RuntimeError(response.get("error", "pose service error"))
+    return response
+
+
+def ping(socket_path=None):
+    """
+    The ping response of the service on socket_path, or None if none is
+    running
+    """
+    socket_path = socket_path or default_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+    try:
+        return request(socket_path, {"op": "ping"}, timeout=CONNECT_TIMEOUT)
+    except (OSError, ValueError, RuntimeError):
+        return None
+
+
+class PoseServiceClient(object):
+    """
+    Client side of the pose service; paths are sent as absolute paths and
+    flags_file must match the flags the service was started with
+    """
+
+    def __init__(self, socket_path=None, flags_file=""):
+        self.socket_path = socket_path or default_socket_path()
+        self.flags_file = os.path.abspath(flags_file) if flags_file else ""
+
+    def _request(self, op, path, **fields):
+        return request(
+            self.socket_path,
+            {
+                "op": op,
+                "path": os.path.abspath(path),
+                "flags": self.flags_file,
+                **fields,
+            },
+        )
+
+    def chain_residues(self, path, chain=None):
+        """
+        (chain, residue numbers, one letter sequence) of chain of path
+        """
+        response = self._request("chain_residues", path, chain=chain)
+        return response["chain"], response["numbers"], response["sequence"]
+
+    def fragment_rows(
+        self, path, chain=None, append=False, offset=None, clip=None
+    ):
+        from bp_tools.bp_tools import FragmentRows
+
+        response = self._request(
+            "fragment_rows",
+            path,
+            chain=chain,
+            append=append,
+            offset=offset,
+            clip=clip,
+        )
+        return FragmentRows.from_dict(response["rows"])
+
+    def sequence_loader(self, fallback=None):
+        """
+        A BlueprintFragmentCache loader served by the service, which calls
+        fallback(path, chain) instead if the service is gone or refuses
+        """
+        backend = (ping(self.socket_path) or {}).get("backend")
+        kind = BACKENDS[backend].loader_kind if backend in BACKENDS else None
+        return ServiceSequenceLoader(self, fallback, kind)
+
+
+class ServiceSequenceLoader(object):
+    """
+    Loader calling client.chain_residues, or fallback on failure; pickles
+    if fallback does. kind is the loader kind of the service's backend
+    (see blueprint_cache.loader_kind)
+    """
+
+    def __init__(self, client, fallback=None, kind=None):
+        self.client = client
+        self.fallback = fallback
+        self.kind = kind or "pose_service"
+
+    def __call__(self, path, chain=None):
+        try:
+            return self.client.chain_residues(path, chain)[2]
+        except (OSError, RuntimeError, ValueError):
+            if self.fallback is None:
+                raise
+            return self.fallback(path, chain)
+
+
+def service_client(socket_path=None, flags_file=""):
+    """
+    A PoseServiceClient if a service is running on socket_path, else None
+    """
+    if ping(socket_path) is None:
+        return None
+    return PoseServiceClient(socket_path, flags_file)
+
+
+@click.group()
+def main():
+    """
+    Local pose service keeping pyrosetta initialized between runs
+    """
+
+
+@main.command("serve")
+@click.option(
+    "--socket",
+    "socket_path",
+    default="",
+    help=f"Unix socket to listen on (default: ${SOCKET_ENV} or a per user "
+    "socket in $XDG_RUNTIME_DIR)",
+)
+@click.option(
+    "--backend",
+    "backend",
+    type=click.Choice(BACKEND_NAMES),
+    default="pyrosetta",
+    show_default=True,
+    help="stub reads pdb/cif files without pyrosetta, for testing",
+)
+@click.option(
+    "-r",
+    "--rosetta-flags-file",
+    "flags_file",
+    default="",
+    help="Flags to initialize pyrosetta with; clients must use the same",
+)
+@click.option(
+    "--max-entries",
+    "max_entries",
+    type=int,
+    default=256,
+    show_default=True,
+    help="Loaded structures kept in memory",
+)
+@click.option(
+    "--idle-timeout",
+    "idle_timeout",
+    type=float,
+    default=None,
+    help="Exit after this many seconds without requests",
+)
+def serve_main(
+    socket_path="",
+    backend="pyrosetta",
+    flags_file="",
+    max_entries=256,
+    idle_timeout=None,
+):
+    """
+    Runs the pose service in the foreground
+    """
+    try:
+        serve(
+            socket_path or None,
+            backend=backend,
+            flags_file=flags_file,
+            max_entries=max_entries,
+            idle_timeout=idle_timeout,
+        )
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+
+@main.command("status")
+@click.option("--socket", "socket_path", default="")
+def status_main(socket_path=""):
+    """
+    Prints the stats of the running pose service
+    """
+    socket_path = socket_path or default_socket_path()
+    try:
+        stats = request(socket_path, {"op": "stats"}, timeout=CONNECT_TIMEOUT)
+    except (OSError, ValueError, RuntimeError):
+        raise click.ClickException(f"no pose service on {socket_path}")
+    click.echo(json.dumps(stats, indent=2))
+
+
+@main.command("stop")
+@click.option("--socket", "socket_path", default="")
+def stop_main(socket_path=""):
+    """
+    Shuts the running pose service down
+    """
+    socket_path = socket_path or default_socket_path()
+    try:
+        request(socket_path, {"op": "shutdown"}, timeout=CONNECT_TIMEOUT)
+    except (OSError, ValueError, RuntimeError):
+        raise click.ClickException(f"no pose service on {socket_path}")
+
+
+if __name__ == "__main__":
+    main()
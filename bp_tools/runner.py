@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Runs the design dirs of a run locally under a bounded pool of processes
+
+Every design runs its command (by default "bash ./cmd") in its own dir and
+process group, with stdout/stderr going to run.log in the dir. At most
+--jobs commands run at once; each one gets threads_per_job cores worth of
+OMP/MKL threads so a node is filled without being oversubscribed. A
+command that runs past --timeout is killed with its whole process group.
+Designs of tar/sqlite outputs run from a copy in --scratch-dir; what they
+write there is copied to results/<name> next to the container afterwards
+(see output_backends.store_results) and the copy is removed.
+
+Outcomes go to an append-only status log (RUN_STATUS_NAME in the run dir),
+one json line per finished design with its status, exit code and timing,
+and to the run's design catalog if it has one (see catalog). A restarted
+run skips the designs that already succeeded. The first SIGINT/SIGTERM
+stops launching new designs and terminates the running ones, which are
+logged as cancelled and rerun on restart.
+"""
+
+import json
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from bp_tools.bundles import collect_design_locations, is_container_location
+from bp_tools.catalog import CATALOG_NAME, DesignCatalog, find_catalog
+
+RUN_STATUS_NAME = "run_status.jsonl"
+RUN_LOG_NAME = "run.log"
+DEFAULT_COMMAND = "bash ./cmd"
+# statuses a restarted run doesn't repeat (unless --rerun-failed is off)
+DONE_STATUSES = ("ok",)
+FAILED_STATUSES = ("failed", "timeout")
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+)
+# seconds between SIGTERM and SIGKILL when stopping a command
+KILL_GRACE = 5.0
+
+
+def available_cores():
+    """
+    Cores this process may run on (respects taskset/cgroup affinity)
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class RunStatusLog(object):
+    """
+    Append-only jsonl of finished designs:
+    {"location", "status", "returncode", "start", "elapsed"}
+
+    Later records for a location supersede earlier ones; a truncated last
+    line is ignored
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.latest = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.latest[record["location"]] = record
+        self._file = open(path, "a")
+        if self._file.tell():
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+
+    def status(self, location):
+        record = self.latest.get(location)
+        return None if record is None else record["status"]
+
+    def record(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            self.latest[record["location"]] = record
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def job_env(threads_per_job=1, path_prepend=()):
+    env = dict(os.environ)
+    for var in THREAD_ENV_VARS:
+        env[var] = str(threads_per_job)
+    if path_prepend:
+        env["PATH"] = os.pathsep.join(
+            [os.path.abspath(p) for p in path_prepend] + [env.get("PATH", "")]
+        )
+    return env
+
+
+def _stop(proc):
+    """
+    SIGTERM the process group of proc, SIGKILL it if it is still running
+    after KILL_GRACE
+    """
+    for sig, wait in ((signal.SIGTERM, KILL_GRACE), (signal.SIGKILL, None)):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            proc.wait(timeout=wait)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def _wait(proc, start, timeout, cancel, poll_interval):
+    """
+    Waits for proc, stopping it on cancel or timeout seconds after start
+
+    Returns "cancelled" or "timeout" if it was stopped, else None
+    """
+    deadline = None if timeout is None else start + timeout
+    while True:
+        try:
+            proc.wait(timeout=poll_interval)
+            return None
+        except subprocess.TimeoutExpired:
+            pass
+        status = None
+        if cancel is not None and cancel.is_set():
+            status = "cancelled"
+        elif deadline is not None and time.time() > deadline:
+            status = "timeout"
+        if status is not None:
+            _stop(proc)
+            return status
+
+
+def run_design(
+    location,
+    command=DEFAULT_COMMAND,
+    timeout=None,
+    env=None,
+    cancel=None,
+    scratch_dir=None,
+    poll_interval=0.2,
+):
+    """
+    Runs command in the design dir of location and returns its status
+    record
+
+    status is "ok", "failed" (nonzero exit, the dir couldn't be set up,
+    the command couldn't be started or its outputs couldn't be stored),
+    "timeout" or "cancelled" (cancel was set while it ran). Container
+    designs also get the "results" dir their outputs were stored in
+    """
+    start = time.time()
+    record = {"location": location, "start": round(start, 3)}
+    container = None
+    try:
+        design_dir = location
+        if is_container_location(location):
+            from bp_tools.output_backends import materialize_design
+
+            container, _, name = location.rpartition(":")
+            design_dir = materialize_design(container, name, scratch_dir)
+        log = open(os.path.join(design_dir, RUN_LOG_NAME), "ab")
+    except (OSError, KeyError, ValueError) as e:
+        record.update(status="failed", returncode=None, error=str(e))
+        record["elapsed"] = round(time.time() - start, 3)
+        return record
+    with log:
+        try:
+            proc = subprocess.Popen(
+                shlex.split(command),
+                cwd=design_dir,
+                env=env,
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+        except (OSError, ValueError) as e:
+            proc = None
+            record.update(status="failed", returncode=None, error=str(e))
+        if proc is not None:
+            status = _wait(proc, start, timeout, cancel, poll_interval)
+    if proc is None:
+        if container is not None:
+            shutil.rmtree(design_dir, ignore_errors=True)
+        record["elapsed"] = round(time.time() - start, 3)
+        return record
+    if status is None:
+        status = "ok" if proc.returncode == 0 else "failed"
+    record.update(status=status, returncode=proc.returncode)
+    if container is not None:
+        from bp_tools.output_backends import store_results
+
+        try:
+            record["results"] = store_results(container, name, design_dir)
+        except (OSError, KeyError, ValueError) as e:
+            record.update(status="failed", error=f"storing results: {e}")
+        else:
+            shutil.rmtree(design_dir, ignore_errors=True)
+    record["elapsed"] = round(time.time() - start, 3)
+    return record
+
+
+def run_designs(
+    locations,
+    status_log,
+    command=DEFAULT_COMMAND,
+    jobs=None,
+    threads_per_job=1,
+    timeout=None,
+    rerun_failed=True,
+    path_prepend=(),
+    scratch_dir=None,
+    cancel=None,
+    progress=None,
+    catalog=None,
+):
+    """
+    Runs command for every location not already done in status_log with at
+    most jobs at once (default: available cores // threads_per_job)
+
+    progress is called with every finished record, which is also stored
+    in catalog (a catalog.DesignCatalog) if one is given. Returns
+    {status: count} for the designs run by this call
+    """
+    skip = DONE_STATUSES + (() if rerun_failed else FAILED_STATUSES)
+    todo = [loc for loc in locations if status_log.status(loc) not in skip]
+    jobs = jobs or max(1, available_cores() // threads_per_job)
+    env = job_env(threads_per_job, path_prepend)
+    cancel = cancel or threading.Event()
+    own_scratch_dir = scratch_dir is None
+    scratch_dir = scratch_dir or tempfile.mkdtemp(prefix="bp_run_")
+    counts = {}
+
+    def worker(location):
+        if cancel.is_set():
+            return
+        record = run_design(
+            location,
+            command=command,
+            timeout=timeout,
+            env=env,
+            cancel=cancel,
+            scratch_dir=scratch_dir,
+        )
+        status_log.record(record)
+        if catalog is not None:
+            catalog.set_run_status(record)
+        with lock:
+            counts[record["status"]] = counts.get(record["status"], 0) + 1
+        if progress is not None:
+            progress(record)
+
+    lock = threading.Lock()
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            for future in [pool.submit(worker, loc) for loc in todo]:
+                future.result()
+    finally:
+        if own_scratch_dir:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+    return counts
+
+
+def cancel_on_signals(cancel, signals=(signal.SIGINT, signal.SIGTERM)):
+    """
+    Sets cancel on the first of signals, restores the default handlers so
+    a second one kills the controller
+    """
+    previous = {sig: signal.getsignal(sig) for sig in signals}
+
+    def handler(signum, frame):
+        print(
+            "cancelling: waiting for running designs to stop",
+            file=sys.stderr,
+            flush=True,
+        )
+        cancel.set()
+        for sig, old in previous.items():
+            signal.signal(sig, old)
+
+    for sig in signals:
+        signal.signal(sig, handler)
+
+
+@click.command()
+@click.argument("run_dir", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "-j",
+    "--jobs",
+    "jobs",
+    type=int,
+    default=None,
+    help="Designs to run at once (default: cores // --threads-per-job)",
+)
+@click.option(
+    "--threads-per-job",
+    "threads_per_job",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Cores each design may use, exported as OMP/MKL_NUM_THREADS",
+)
+@click.option(
+    "-t",
+    "--timeout",
+    "timeout",
+    type=float,
+    default=None,
+    help="Seconds after which a design is killed",
+)
+@click.option(
+    "--command",
+    "command",
+    default=DEFAULT_COMMAND,
+    show_default=True,
+    help="Command run in every design dir, e.g. "
+    "'python -m bp_tools.fake_rosetta @flags' to test without Rosetta",
+)
+@click.option(
+    "--executable-dir",
+    "executable_dirs",
+    multiple=True,
+    help="Dir put in front of PATH for the commands, e.g. one holding a "
+    "fake rosetta_scripts (can be repeated)",
+)
+@click.option(
+    "--status-log",
+    "status_log_path",
+    default="",
+    help=f"Status log to resume from (default: RUN_DIR/{RUN_STATUS_NAME})",
+)
+@click.option(
+    "--rerun-failed/--skip-failed",
+    "rerun_failed",
+    default=True,
+    help="Whether a restarted run repeats designs that failed or timed out",
+)
+@click.option(
+    "--scratch-dir",
+    "scratch_dir",
+    default="",
+    help="Where designs of tar/sqlite outputs are unpacked",
+)
+@click.option(
+    "--catalog",
+    "catalog_path",
+    default="",
+    help="Design catalog to record statuses in (default: "
+    f"RUN_DIR/{CATALOG_NAME} if the run has one)",
+)
+def main(
+    run_dir,
+    jobs=None,
+    threads_per_job=1,
+    timeout=None,
+    command=DEFAULT_COMMAND,
+    executable_dirs=(),
+    status_log_path="",
+    rerun_failed=True,
+    scratch_dir="",
+    catalog_path="",
+):
+    """
+    Runs every design of RUN_DIR locally, resuming from its status log
+    """
+    if threads_per_job < 1:
+        raise click.BadParameter(
+            "must be at least 1", param_hint="--threads-per-job"
+        )
+    if jobs is not None and jobs < 1:
+        raise click.BadParameter("must be at least 1", param_hint="--jobs")
+    # absolute, so the status log matches whatever dir a restart runs from
+    locations = [
+        loc if is_container_location(loc) else os.path.abspath(loc)
+        for loc in collect_design_locations(run_dir)
+    ]
+    if not locations:
+        raise click.ClickException(f"no designs found in {run_dir}")
+    cancel = threading.Event()
+    cancel_on_signals(cancel)
+
+    def progress(record):
+        click.echo(
+            f"{record['status']}\t{record['elapsed']:.1f}s\t"
+            f"{record['location']}",
+            err=True,
+        )
+
+    catalog_path = catalog_path or find_catalog(run_dir)
+    catalog = DesignCatalog(catalog_path) if catalog_path else None
+    with RunStatusLog(
+        status_log_path or os.path.join(run_dir, RUN_STATUS_NAME)
+    ) as status_log:
+        counts = run_designs(
+            locations,
+            status_log,
+            command=command,
+            jobs=jobs,
+            threads_per_job=threads_per_job,
+            timeout=timeout,
+            rerun_failed=rerun_failed,
+            path_prepend=executable_dirs,
+            scratch_dir=scratch_dir or None,
+            cancel=cancel,
+            progress=progress,
+            catalog=catalog,
+        )
+    if catalog is not None:
+        catalog.close()
+    summary = ", ".join(
+        f"{n} {status}" for status, n in sorted(counts.items())
+    )
+    click.echo(f"{len(locations)} designs: {summary or 'nothing to run'}")
+    if cancel.is_set() or any(s != "ok" for s in counts):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Budgeted sampling of a DesignSpace
+
+Draws n distinct combinations without enumerating the space:
+
+    uniform      a lazy random permutation of the combination indices
+    stratified   equal shares per total repeat length, each share drawn
+                 uniformly by unranking within that length
+    halton       a randomly shifted Halton sequence over the element sizes,
+                 skipping repeats
+
+Every mode is reproducible from its seed and costs O(draws) (times the
+number of samplers), independent of the size of the space. Optional
+design_filters rules are applied by rejection.
+"""
+
+import random
+
+SAMPLE_MODES = ("uniform", "stratified", "halton")
+
+
+def _permuted_indices(size, rng):
+    """
+    Generator over range(size) in random order, O(1) per index
+
+    A Fisher-Yates shuffle that only stores the swapped positions
+    """
+    swapped = {}
+    for i in range(size):
+        j = rng.randrange(i, size)
+        value = swapped.get(j, j)
+        swapped[j] = swapped.pop(i, i)
+        yield value
+
+
+def _uniform_digits(space, rng):
+    for k in _permuted_indices(len(space), rng):
+        yield space.decode(k)
+
+
+def _primes(n):
+    primes = []
+    candidate = 2
+    while len(primes) < n:
+        if all(candidate % p for p in primes):
+            primes.append(candidate)
+        candidate += 1
+    return primes
+
+
+def _radical_inverse(i, base):
+    inverse = 0.0
+    scale = 1.0 / base
+    while i:
+        i, digit = divmod(i, base)
+        inverse += digit * scale
+        scale /= base
+    return inverse
+
+
+def _halton_digits(space, rng):
+    """
+    Generator over digits from a Halton sequence (one prime base per
+    sampler) with a random shift per dimension, so different seeds give
+    different but equally well spread point sets. Repeats are skipped; if
+    the sequence stalls on an almost exhausted space the rest is drawn
+    uniformly.
+    """
+    radices = space.radices
+    bases = _primes(len(radices))
+    shifts = [rng.random() for _ in radices]
+    seen = set()
+    max_points = 16 * len(space) + 1024
+    for i in range(1, max_points):
+        if len(seen) == len(space):
+            return
+        digits = [
+            int(((_radical_inverse(i, base) + shift) % 1.0) * radix)
+            for base, shift, radix in zip(bases, shifts, radices)
+        ]
+        k = space.encode(digits)
+        if k not in seen:
+            seen.add(k)
+            yield digits
+    for k in _permuted_indices(len(space), rng):
+        if k not in seen:
+            yield space.decode(k)
+
+
+def length_counts(space):
+    """
+    ways[j][length] is the number of completions from sampler j on (the
+    suffix of the combination) with that total size; ways[0] is the total
+    repeat length histogram of the space
+    """
+    ways = [[1]]
+    for elements in reversed(space.element_lists):
+        below = ways[0]
+        counts = [0] * (len(below) + max(e.size for e in elements))
+        for element in elements:
+            for length, count in enumerate(below):
+                counts[length + element.size] += count
+        ways.insert(0, counts)
+    return ways
+
+
+def _unrank_length(space, ways, length, rank):
+    """
+    Digits of the rank-th combination (in product order) with the given
+    total length
+    """
+    digits = []
+    for j, elements in enumerate(space.element_lists):
+        below = ways[j + 1]
+        for digit, element in enumerate(elements):
+            rest = length - element.size
+            count = below[rest] if 0 <= rest < len(below) else 0
+            if rank < count:
+                break
+            rank -= count
+        digits.append(digit)
+        length -= element.size
+    return digits
+
+
+def _equal_shares(n, capacities):
+    """
+    Splits n over strata with the given capacities as evenly as possible
+    """
+    shares = [0] * len(capacities)
+    open_strata = [s for s, cap in enumerate(capacities) if cap]
+    while n and open_strata:
+        share, extra = divmod(n, len(open_strata))
+        for position, s in enumerate(open_strata):
+            take = min(share + (position < extra), capacities[s] - shares[s])
+            shares[s] += take
+            n -= take
+        open_strata = [s for s in open_strata if shares[s] < capacities[s]]
+    return shares
+
+
+def _stratified_digits(space, rng, n, min_length=None, max_length=None):
+    ways = length_counts(space)
+    totals = ways[0]
+    strata = [
+        length
+        for length, count in enumerate(totals)
+        if count
+        and (min_length is None or length >= min_length)
+        and (max_length is None or length <= max_length)
+    ]
+    ranks = {
+        length: _permuted_indices(totals[length], rng) for length in strata
+    }
+    remaining = {length: totals[length] for length in strata}
+    requested = n
+    # shares are renegotiated in rounds as long as the consumer wants more,
+    # so strata emptied by rejected draws hand their share to the others
+    while requested and any(remaining.values()):
+        shares = _equal_shares(
+            requested, [remaining[length] for length in strata]
+        )
+        requested = 0
+        for length, share in zip(strata, shares):
+            for _ in range(share):
+                rank = next(ranks[length])
+                remaining[length] -= 1
+                wanted = yield _unrank_length(space, ways, length, rank)
+                requested += 0 if wanted else 1
+
+
+def sample_space(
+    space,
+    n,
+    mode="uniform",
+    seed=0,
+    rules=(),
+    stats=None,
+):
+    """
+    Generator over n distinct combinations of space drawn with mode (one of
+    SAMPLE_MODES), reproducible for a given seed
+
+    rules are design_filters rules; rejected draws are replaced, so fewer
+    than n combinations only come out if the space runs out. With the
+    stratified mode every total length gets an equal share (as far as it
+    has combinations), and LengthWindow rules narrow the strata directly.
+    """
+    from bp_tools.design_filters import LengthWindow, accepts_all
+
+    if mode not in SAMPLE_MODES:
+        raise ValueError(
+            f"unknown sample mode {mode}, use one of {SAMPLE_MODES}"
+        )
+    rules = list(rules)
+    for rule in rules:
+        rule.bind(space)
+    rng = random.Random(seed)
+    n = min(n, len(space))
+    if n <= 0:
+        return
+    if mode == "stratified":
+        min_length = max_length = None
+        for rule in rules:
+            if isinstance(rule, LengthWindow):
+                min_length = rule.min_length
+                max_length = rule.max_length
+        digit_source = _stratified_digits(
+            space, rng, n, min_length, max_length
+        )
+    elif mode == "halton":
+        digit_source = _halton_digits(space, rng)
+    else:
+        digit_source = _uniform_digits(space, rng)
+    drawn = 0
+    accepted = None
+    while drawn < n:
+        try:
+            if accepted is None or mode != "stratified":
+                digits = next(digit_source)
+            else:
+                digits = digit_source.send(accepted)
+        except StopIteration:
+            return
+        combination = space.combination(digits)
+        accepted = accepts_all(combination, rules, stats)
+        if accepted:
+            drawn += 1
+            yield combination
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Indexed, memory-mapped reader for Rosetta silent files
+
+Fragment libraries come as silent files with ~10^5 structures in several
+GB. The first open scans the file once for the lines starting a structure
+(a "SCORE:" line ending with the structure's tag) and saves a persistent
+tag -> byte offset index next to it (or in the user cache dir if that
+isn't writable). Every later open only reads the index, and extracting one
+structure slices its record out of the memory-mapped file, so random
+access to any tag is a dict lookup and one seek.
+
+Only what blueprints need is parsed from a record: the sequence
+(ANNOTATED_SEQUENCE, else the file's SEQUENCE line), chain breaks
+(CHAIN_ENDINGS) and the PDB numbering (RES_NUM) where present.
+
+Fragments are addressed as "path.silent:tag"; "path.silent" alone means
+its first structure.
+"""
+
+import bisect
+import hashlib
+import mmap
+import os
+import re
+
+from bp_tools.pdb_reader import ChainResidues
+
+SILENT_SUFFIXES = (".silent", ".out")
+INDEX_SUFFIX = ".bpidx"
+INDEX_VERSION = "1"
+ANNOTATION_PATTERN = re.compile(rb"\[[^\]]*\]")
+# first-last (or a single number) of a RES_NUM field
+RES_NUM_SPAN_PATTERN = re.compile(r"^(-?\d+)(?:-(-?\d+))?$")
+CHAIN_IDS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def parse_silent_spec(spec):
+    """
+    (path, tag or None) for "path.silent[:tag]", None if spec doesn't name
+    a silent file
+    """
+    for suffix in SILENT_SUFFIXES:
+        i = spec.find(suffix + ":")
+        if i != -1:
+            end = i + len(suffix)
+            return spec[:end], spec[end + 1 :] or None
+        if spec.endswith(suffix):
+            return spec, None
+    return None
+
+
+def is_silent_spec(spec):
+    return isinstance(spec, str) and parse_silent_spec(spec) is not None
+
+
+def _line_starts(mm, token):
+    """
+    Offsets of the lines of mm starting with token
+    """
+    pos = 0
+    while True:
+        i = mm.find(token, pos)
+        if i == -1:
+            return
+        if i == 0 or mm[i - 1] == 0x0A:
+            yield i
+        pos = i + len(token)
+
+
+def _line_at(mm, offset):
+    end = mm.find(b"\n", offset)
+    return mm[offset : len(mm) if end == -1 else end]
+
+
+def scan_silent(mm):
+    """
+    [(tag, record offset, SEQUENCE line offset or -1), ...] in file order
+    for the structures of a mapped silent file; the first record of a
+    repeated tag wins
+    """
+    sequence_offsets = list(_line_starts(mm, b"SEQUENCE:"))
+    records = []
+    seen = set()
+    for offset in _line_starts(mm, b"SCORE:"):
+        fields = _line_at(mm, offset).split()
+        if len(fields) < 2 or fields[-1] == b"description":
+            continue
+        tag = fields[-1].decode()
+        if tag in seen:
+            continue
+        seen.add(tag)
+        k = bisect.bisect_right(sequence_offsets, offset)
+        records.append((tag, offset, sequence_offsets[k - 1] if k else -1))
+    return records
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return f"{st.st_size} {st.st_mtime_ns}"
+
+
+def default_index_path(path):
+    """
+    path + INDEX_SUFFIX if its dir is writable, else a file named by the
+    hash of the absolute path in $XDG_CACHE_HOME/bp_tools/silent_index
+    """
+    if os.access(os.path.dirname(os.path.abspath(path)), os.W_OK):
+        return path + INDEX_SUFFIX
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(
+        "~/.cache"
+    )
+    name = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    return os.path.join(
+        cache_home, "bp_tools", "silent_index", name + INDEX_SUFFIX
+    )
+
+
+def _read_index(index_path, stamp):
+    try:
+        with open(index_path, "r") as f:
+            header = f.readline().split()
+            if header[1:] != [INDEX_VERSION] + stamp.split():
+                return None
+            records = []
+            for line in f:
+                tag, offset, sequence_offset = line.rstrip("\n").split("\t")
+                records.append((tag, int(offset), int(sequence_offset)))
+            return records
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _write_index(index_path, stamp, records):
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(f"#bp_silent_index {INDEX_VERSION} {stamp}\n")
+        f.writelines(f"{t}\t{o}\t{s}\n" for t, o, s in records)
+    os.replace(tmp_path, index_path)
+
+
+def _residue_numbers(res_num_fields):
+    """
+    [(chain, number), ...] from the chain:first-last fields of a RES_NUM
+    line (numbers may be negative, e.g. A:-1-0), None if a field can't be
+    parsed
+    """
+    numbers = []
+    for field in res_num_fields:
+        chain, _, span = field.partition(":")
+        match = RES_NUM_SPAN_PATTERN.match(span)
+        if match is None:
+            return None
+        first, last = match.group(1), match.group(2) or match.group(1)
+        numbers += [(chain, str(n)) for n in range(int(first), int(last) + 1)]
+    return numbers
+
+
+class SilentFile(object):
+    """
+    Random access to the structures of a silent file by tag
+
+    The index is built on first open (and rebuilt when the file's size or
+    mtime changes). tags are in file order.
+    """
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or default_index_path(path)
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if size
+            else b""
+        )
+        stamp = _stamp(path)
+        records = _read_index(self.index_path, stamp)
+        self.index_built = records is None
+        if records is None:
+            records = scan_silent(self._mm)
+            try:
+                _write_index(self.index_path, stamp, records)
+            except OSError:
+                # read-only everywhere: still usable, just not persistent
+                pass
+        self.tags = [tag for tag, _, _ in records]
+        self._offsets = {tag: k for k, (tag, _, _) in enumerate(records)}
+        self._starts = [offset for _, offset, _ in records]
+        self._sequence_offsets = [s for _, _, s in records]
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __contains__(self, tag):
+        return tag in self._offsets
+
+    def _position(self, tag):
+        if tag is None:
+            if not self.tags:
+                raise ValueError(f"no structures in {self.path}")
+            return 0
+        k = self._offsets.get(tag)
+        if k is None:
+            raise ValueError(f"no structure {tag} in {self.path}")
+        return k
+
+    def record(self, tag=None):
+        """
+        The raw bytes of the structure tag (default: the first one)
+        """
+        start = self._starts[self._position(tag)]
+        # up to the next SCORE line, a header or another record
+        end = self._mm.find(b"\nSCORE:", start)
+        return self._mm[start : len(self._mm) if end == -1 else end + 1]
+
+    def record_hash(self, tag=None):
+        """
+        sha256 of everything chain_residues(tag) depends on
+        """
+        digest = hashlib.sha256(self.record(tag))
+        sequence_offset = self._sequence_offsets[self._position(tag)]
+        if sequence_offset >= 0:
+            digest.update(_line_at(self._mm, sequence_offset))
+        return digest.hexdigest()
+
+    def chain_residues(self, tag=None, chain=None):
+        """
+        ChainResidues of chain (default: the first) of structure tag
+        (default: the first)
+        """
+        k = self._position(tag)
+        tag = self.tags[k]
+        sequence = None
+        chain_endings = []
+        numbers = None
+        for line in self.record(tag).split(b"\n"):
+            if line.startswith(b"ANNOTATED_SEQUENCE:"):
+                sequence = ANNOTATION_PATTERN.sub(b"", line.split()[1])
+            elif line.startswith(b"CHAIN_ENDINGS"):
+                chain_endings = [int(n) for n in line.split()[1:-1]]
+            elif line.startswith(b"RES_NUM"):
+                numbers = _residue_numbers(
+                    [f.decode() for f in line.split()[1:-1]]
+                )
+        if sequence is None:
+            sequence_offset = self._sequence_offsets[k]
+            if sequence_offset < 0:
+                raise ValueError(f"no sequence for {tag} in {self.path}")
+            sequence = _line_at(self._mm, sequence_offset).split()[1]
+        sequence = sequence.decode()
+        if numbers is None or len(numbers) != len(sequence):
+            # no pdb numbering: chains from the chain endings, numbered 1..n
+            bounds = chain_endings + [len(sequence)]
+            numbers = []
+            first = 0
+            for n_chain, last in enumerate(bounds):
+                chain_id = CHAIN_IDS[n_chain % len(CHAIN_IDS)]
+                numbers += [
+                    (chain_id, str(n)) for n in range(1, last - first + 1)
+                ]
+                first = last
+        if chain is None:
+            chain = numbers[0][0]
+        selected = [i for i, (c, _) in enumerate(numbers) if c == chain]
+        if not selected:
+            raise ValueError(f"no chain {chain!r} in {tag} of {self.path}")
+        return ChainResidues(
+            chain,
+            [numbers[i][1] for i in selected],
+            "".join(sequence[i] for i in selected),
+            source=f"{self.path}:{tag}",
+        )
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_open_files = {}
+
+
+def open_silent(path):
+    """
+    Process wide SilentFile for path, reopened when the file changes
+    """
+    key = os.path.abspath(path)
+    stamp = _stamp(path)
+    entry = _open_files.get(key)
+    if entry is None or entry[0] != stamp:
+        if entry is not None:
+            entry[1].close()
+        entry = (stamp, SilentFile(path))
+        _open_files[key] = entry
+    return entry[1]
+
+
+def read_silent_residues(spec, chain=None):
+    """
+    ChainResidues for a "path.silent[:tag]" spec
+    """
+    path, tag = parse_silent_spec(spec)
+    return open_silent(path).chain_residues(tag, chain=chain)
+
+
+def silent_record_hash(spec):
+    path, tag = parse_silent_spec(spec)
+    return open_silent(path).record_hash(tag)
@@ -13,6 +13,18 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     # url="https://github.com/pypa/sampleproject",
     packages=["bp_tools"],
+    install_requires=["click", "numpy"],
+    entry_points={
+        "console_scripts": [
+            "build_bp_run=bp_tools.build_bp_run:main",
+            "blueprint_organizer=bp_tools.blueprint_organizer:main",
+            "bp_materialize=bp_tools.materialize_design:main",
+            "bp_frag_convert=bp_tools.convert_frag_params:main",
+            "bp_bundle=bp_tools.make_bundles:main",
+            "bp_run_bundle=bp_tools.bundle_runner:main",
+            "bp_tools=bp_tools.cli:main",
+        ]
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "Operating System :: OS Independent",